@@ -0,0 +1,155 @@
+import os
+import time
+import shutil
+import logging
+import platform
+import threading
+import subprocess
+from concurrent.futures import ThreadPoolExecutor
+
+logging.basicConfig(level=logging.INFO)
+log = logging.getLogger(__name__)
+
+# Intervalo para reverificar as ferramentas externas (em segundo plano, sem bloquear quem consulta)
+CAPABILITIES_TTL_SECONDS = int(os.getenv("CAPABILITIES_TTL_SECONDS", "600"))
+PROBE_TIMEOUT_SECONDS = 15
+
+GS_COMMANDS = ['gswin64c', 'gswin32c'] if platform.system() == 'Windows' else ['gs']
+
+
+def available_cpus():
+    """Número de núcleos utilizáveis pelo processo (respeita a afinidade de CPU do container)."""
+    try:
+        return max(1, len(os.sched_getaffinity(0)))
+    except AttributeError:
+        return max(1, os.cpu_count() or 1)
+
+
+_UNAVAILABLE = {"available": False, "command": None, "path": None, "version": None}
+
+
+def _probe_command(candidates, version_args):
+    """Procura o primeiro comando disponível entre `candidates` e confirma que ele executa. Retorna o registro da ferramenta."""
+    for cmd in candidates:
+        path = shutil.which(cmd)
+        if not path: continue
+        try:
+            process = subprocess.run([cmd, *version_args], capture_output=True, text=True, check=True, timeout=PROBE_TIMEOUT_SECONDS)
+            output = (process.stdout or process.stderr).strip()
+            return {"available": True, "command": cmd, "path": path, "version": output.splitlines()[0] if output else None}
+        except (subprocess.SubprocessError, OSError) as e:
+            log.warning(f"'{cmd}' encontrado, mas falhou ao executar: {e}")
+    return _UNAVAILABLE.copy()
+
+
+def _probe_tesseract():
+    info = _probe_command(['tesseract'], ['--version'])
+    info["languages"] = []
+    if info["available"]:
+        try:
+            process = subprocess.run(['tesseract', '--list-langs'], capture_output=True, text=True, timeout=PROBE_TIMEOUT_SECONDS)
+            # A primeira linha é o cabeçalho "List of available languages ..."
+            info["languages"] = sorted(line.strip() for line in process.stdout.splitlines()[1:] if line.strip())
+        except (subprocess.SubprocessError, OSError) as e:
+            log.warning(f"Não foi possível listar os idiomas do Tesseract: {e}")
+    return info
+
+
+PROBES = {
+    "ghostscript": lambda: _probe_command(GS_COMMANDS, ['--version']),
+    "ocrmypdf": lambda: _probe_command(['ocrmypdf'], ['--version']),
+    "tesseract": _probe_tesseract,
+    "libreoffice": lambda: _probe_command(['soffice', 'libreoffice'], ['--version']),
+    "ffmpeg": lambda: _probe_command(['ffmpeg'], ['-version']),
+    "ffprobe": lambda: _probe_command(['ffprobe'], ['-version']),
+}
+
+TOOL_LABELS = {
+    "ghostscript": "Ghostscript", "ocrmypdf": "OCRmyPDF", "tesseract": "Tesseract",
+    "libreoffice": "LibreOffice", "ffmpeg": "FFmpeg", "ffprobe": "ffprobe",
+}
+
+
+class CapabilityRegistry:
+    """
+    Disponibilidade das ferramentas externas (Ghostscript, OCRmyPDF, Tesseract, LibreOffice, ffmpeg, ffprobe),
+    verificada uma vez por processo. Depois de CAPABILITIES_TTL_SECONDS a próxima consulta devolve o valor em
+    cache e dispara uma nova verificação em segundo plano.
+    """
+    def __init__(self, ttl_seconds=CAPABILITIES_TTL_SECONDS):
+        self.ttl_seconds = ttl_seconds
+        self._tools = None
+        self._checked_at = 0.0
+        self._lock = threading.Lock()
+        self._refreshing = False
+
+    def _probe_all(self):
+        # Em paralelo: o `soffice --version` sozinho leva alguns segundos
+        with ThreadPoolExecutor(max_workers=len(PROBES)) as executor:
+            futures = {name: executor.submit(probe) for name, probe in PROBES.items()}
+            tools = {}
+            for name, future in futures.items():
+                try:
+                    tools[name] = future.result()
+                except Exception as e:
+                    log.warning(f"Erro ao verificar {TOOL_LABELS[name]}: {e}")
+                    tools[name] = _UNAVAILABLE.copy()
+        return tools
+
+    def _store(self, tools):
+        previous = self._tools or {}
+        for name, info in tools.items():
+            if previous.get(name, {}).get("available") == info["available"]: continue
+            if info["available"]: log.info(f"{TOOL_LABELS[name]} detectado: '{info['command']}' ({info['version']})")
+            else: log.warning(f"{TOOL_LABELS[name]} não detectado. Funções que dependem dele ficarão indisponíveis.")
+        self._tools = tools
+        self._checked_at = time.time()
+
+    def _refresh_in_background(self):
+        try:
+            tools = self._probe_all()
+            with self._lock: self._store(tools)
+        finally:
+            self._refreshing = False
+
+    def refresh(self):
+        """Reverifica todas as ferramentas imediatamente (bloqueante)."""
+        tools = self._probe_all()
+        with self._lock: self._store(tools)
+
+    def snapshot(self):
+        """Retorna {ferramenta: {"available", "command", "path", "version", ...}}."""
+        with self._lock:
+            if self._tools is None:
+                self._store(self._probe_all())
+            elif time.time() - self._checked_at > self.ttl_seconds and not self._refreshing:
+                self._refreshing = True
+                threading.Thread(target=self._refresh_in_background, daemon=True).start()
+            return self._tools
+
+    def available(self, name):
+        return self.snapshot()[name]["available"]
+
+    def command(self, name):
+        """Comando a executar para a ferramenta, ou None se indisponível."""
+        return self.snapshot()[name]["command"]
+
+    def path(self, name):
+        """Caminho absoluto do executável, ou None se indisponível."""
+        return self.snapshot()[name]["path"]
+
+    def tesseract_languages(self):
+        return self.snapshot()["tesseract"].get("languages", [])
+
+
+_registry = None
+_registry_lock = threading.Lock()
+
+
+def get_capabilities():
+    """Registro de ferramentas compartilhado pelo processo."""
+    global _registry
+    with _registry_lock:
+        if _registry is None:
+            _registry = CapabilityRegistry()
+        return _registry
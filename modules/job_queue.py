@@ -0,0 +1,421 @@
+import os
+import json
+import time
+import uuid
+import shutil
+import sqlite3
+import contextlib
+import logging
+import importlib
+import threading
+import multiprocessing
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+from modules.capabilities import available_cpus
+from modules.process_runner import ProcessCancelled
+
+logging.basicConfig(level=logging.INFO)
+log = logging.getLogger(__name__)
+
+JOBS_DIR = os.getenv("JOBS_DIR", "/app/.cache/jobs")
+JOB_RETENTION_HOURS = float(os.getenv("JOB_RETENTION_HOURS", "24"))
+JOB_POLL_INTERVAL_SECONDS = 0.5
+JOB_JANITOR_INTERVAL_SECONDS = 600
+COPY_CHUNK_SIZE = 1024 * 1024
+
+STATUS_QUEUED = "queued"
+STATUS_RUNNING = "running"
+STATUS_CANCELLING = "cancelling"
+STATUS_DONE = "done"
+STATUS_FAILED = "failed"
+STATUS_CANCELLED = "cancelled"
+FINAL_STATUSES = (STATUS_DONE, STATUS_FAILED, STATUS_CANCELLED)
+
+
+# Limite global de tarefas pesadas simultâneas (por padrão, um por núcleo disponível). Uma tarefa ocupa uma vaga,
+# ou mais se reservar núcleos para processos auxiliares (JobContext.reserve_slots)
+JOB_MAX_CONCURRENT = int(os.getenv("JOB_MAX_CONCURRENT", "0")) or available_cpus()
+
+# Classes de ferramenta: cada uma tem seu próprio pool de processos
+TOOL_CLASS_WORKERS = {
+    "pdf": int(os.getenv("JOB_WORKERS_PDF", "2")),
+    "office": int(os.getenv("JOB_WORKERS_OFFICE", "2")),
+    "transcription": int(os.getenv("JOB_WORKERS_TRANSCRIPTION", "1")),
+}
+
+# Tarefas conhecidas: nome -> (classe de ferramenta, "módulo:função")
+TASKS = {
+    "compression_ocr": ("pdf", "modules.pdf_transformer:run_compression_ocr_job"),
+    "document_to_pdf": ("office", "modules.pdf_transformer:run_document_to_pdf_job"),
+    "transcription": ("transcription", "modules.media_converter:run_transcription_job"),
+}
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS jobs (
+    id TEXT PRIMARY KEY,
+    task TEXT NOT NULL,
+    tool_class TEXT NOT NULL,
+    params TEXT NOT NULL,
+    status TEXT NOT NULL,
+    progress REAL NOT NULL DEFAULT 0,
+    message TEXT,
+    result TEXT,
+    error TEXT,
+    owner TEXT,
+    slots INTEGER NOT NULL DEFAULT 1,
+    created_at REAL NOT NULL,
+    started_at REAL,
+    finished_at REAL
+);
+CREATE INDEX IF NOT EXISTS jobs_status_created ON jobs (status, created_at);
+"""
+
+
+@contextlib.contextmanager
+def _connect(db_path):
+    """Conexão curta (uma por operação): faz commit ao final do bloco e sempre fecha."""
+    conn = sqlite3.connect(db_path, timeout=30)
+    conn.row_factory = sqlite3.Row
+    try:
+        conn.execute("PRAGMA journal_mode=WAL")
+        with conn:
+            yield conn
+    finally:
+        conn.close()
+
+
+def _row_to_job(row):
+    if row is None:
+        return None
+    job = dict(row)
+    job["params"] = json.loads(job["params"] or "{}")
+    job["result"] = json.loads(job["result"]) if job["result"] else None
+    return job
+
+
+def _owner_alive(owner):
+    """`owner` é "<pid>:<token>"; o mesmo PID com outro token é uma encarnação anterior do servidor."""
+    try:
+        pid = int((owner or "").split(":")[0])
+    except ValueError:
+        return False
+    if pid == os.getpid():
+        return False
+    try:
+        os.kill(pid, 0)
+        return True
+    except OSError:
+        return False
+
+
+class JobContext:
+    """Contexto entregue às funções de tarefa no processo worker: diretórios, progresso e cancelamento."""
+    def __init__(self, job_id, job_dir, db_path):
+        self.job_id = job_id
+        self.job_dir = job_dir
+        self.db_path = db_path
+
+    def input_path(self, name):
+        return os.path.join(self.job_dir, "input", name)
+
+    def output_path(self, name):
+        os.makedirs(os.path.join(self.job_dir, "output"), exist_ok=True)
+        return os.path.join(self.job_dir, "output", name)
+
+    def report(self, progress=None, message=None):
+        """Atualiza progresso (0.0 a 1.0) e/ou mensagem exibidos na interface."""
+        try:
+            with _connect(self.db_path) as conn:
+                if progress is not None:
+                    conn.execute("UPDATE jobs SET progress = ? WHERE id = ?", (max(0.0, min(1.0, progress)), self.job_id))
+                if message is not None:
+                    conn.execute("UPDATE jobs SET message = ? WHERE id = ?", (message, self.job_id))
+        except sqlite3.Error as e:
+            log.warning(f"Falha ao registrar progresso da tarefa {self.job_id}: {e}")
+
+    def reserve_slots(self, wanted):
+        """
+        Ajusta para `wanted` as vagas do limite global (JOB_MAX_CONCURRENT) ocupadas por esta tarefa, para contar
+        processos auxiliares (ex.: trechos da transcrição longa). Concede só o que estiver livre, no mínimo 1, e
+        retorna a quantidade concedida; reserve_slots(1) devolve as vagas extras.
+        """
+        try:
+            with _connect(self.db_path) as conn:
+                conn.execute("BEGIN IMMEDIATE")  # leitura e gravação atômicas entre tarefas concorrentes
+                used = conn.execute(
+                    "SELECT COALESCE(SUM(slots), 0) FROM jobs WHERE status IN (?, ?) AND id != ? "
+                    "AND owner = (SELECT owner FROM jobs WHERE id = ?)", (STATUS_RUNNING, STATUS_CANCELLING, self.job_id, self.job_id)
+                ).fetchone()[0]
+                granted = max(1, min(wanted, JOB_MAX_CONCURRENT - used))
+                conn.execute("UPDATE jobs SET slots = ? WHERE id = ?", (granted, self.job_id))
+            return granted
+        except sqlite3.Error as e:
+            log.warning(f"Falha ao reservar vagas para a tarefa {self.job_id}: {e}")
+            return 1
+
+    def cancel_requested(self):
+        try:
+            with _connect(self.db_path) as conn:
+                row = conn.execute("SELECT status FROM jobs WHERE id = ?", (self.job_id,)).fetchone()
+            return row is not None and row["status"] == STATUS_CANCELLING
+        except sqlite3.Error:
+            return False
+
+
+class JobCancelled(Exception):
+    """Levantada por uma tarefa que interrompeu o trabalho a pedido do usuário."""
+
+
+def _execute_task(task_path, job_id, job_dir, db_path, params):
+    """Ponto de entrada no processo worker: importa e executa a função da tarefa."""
+    module_name, func_name = task_path.split(":")
+    func = getattr(importlib.import_module(module_name), func_name)
+    return func(params, JobContext(job_id, job_dir, db_path))
+
+
+def _spool(source, dest_path):
+    if isinstance(source, (bytes, bytearray, memoryview)):
+        with open(dest_path, "wb") as f:
+            f.write(source)
+    elif isinstance(source, (str, os.PathLike)):
+        shutil.copyfile(source, dest_path)
+    else:
+        if hasattr(source, "seek"):
+            source.seek(0)
+        with open(dest_path, "wb") as f:
+            shutil.copyfileobj(source, f, COPY_CHUNK_SIZE)
+
+
+class JobManager:
+    """
+    Fila de tarefas local, persistida em SQLite, com um pool de processos por classe de ferramenta.
+    Um thread despachante inicia as tarefas respeitando o limite por classe e o limite global de núcleos;
+    entradas e resultados ficam em JOBS_DIR/<id> até o fim do período de retenção.
+    """
+    def __init__(self, jobs_dir=JOBS_DIR):
+        self.jobs_dir = jobs_dir
+        os.makedirs(jobs_dir, exist_ok=True)
+        self.db_path = os.path.join(jobs_dir, "jobs.sqlite3")
+        with _connect(self.db_path) as conn:
+            conn.executescript(_SCHEMA)
+            if "slots" not in {row["name"] for row in conn.execute("PRAGMA table_info(jobs)")}:
+                conn.execute("ALTER TABLE jobs ADD COLUMN slots INTEGER NOT NULL DEFAULT 1")  # bancos anteriores
+        self._lock = threading.Lock()
+        self._pools = {}
+        self._running = {}  # job_id -> tool_class
+        self._last_janitor = 0.0
+        self._owner = f"{os.getpid()}:{uuid.uuid4().hex[:8]}"
+        self._requeue_orphans()
+        self._dispatcher = threading.Thread(target=self._dispatch_loop, name="job-dispatcher", daemon=True)
+        self._dispatcher.start()
+
+    # --- API usada pelas páginas ---
+    def submit(self, task, params=None, inputs=None):
+        """Enfileira `task` com `params` (JSON) e arquivos de entrada {nome: caminho/file-like/bytes}. Retorna o id."""
+        if task not in TASKS:
+            raise ValueError(f"Tarefa desconhecida: {task}")
+        tool_class = TASKS[task][0]
+        job_id = uuid.uuid4().hex
+        job_dir = self.job_dir(job_id)
+        os.makedirs(os.path.join(job_dir, "input"))
+        for name, source in (inputs or {}).items():
+            _spool(source, os.path.join(job_dir, "input", os.path.basename(name)))
+        with _connect(self.db_path) as conn:
+            conn.execute(
+                "INSERT INTO jobs (id, task, tool_class, params, status, message, created_at) VALUES (?, ?, ?, ?, ?, ?, ?)",
+                (job_id, task, tool_class, json.dumps(params or {}), STATUS_QUEUED, "Aguardando na fila...", time.time())
+            )
+        log.info(f"Tarefa {job_id} ({task}) enfileirada.")
+        return job_id
+
+    def submit_completed(self, task, params, result, outputs):
+        """
+        Registra uma tarefa já concluída, sem passar pela fila (ex.: resultado encontrado em cache), para que a
+        página a acompanhe como qualquer outra. `outputs` {nome: caminho/file-like/bytes} vão para a saída. Retorna o id.
+        """
+        if task not in TASKS:
+            raise ValueError(f"Tarefa desconhecida: {task}")
+        job_id = uuid.uuid4().hex
+        output_dir = os.path.join(self.job_dir(job_id), "output")
+        os.makedirs(output_dir)
+        for name, source in outputs.items():
+            _spool(source, os.path.join(output_dir, os.path.basename(name)))
+        now = time.time()
+        with _connect(self.db_path) as conn:
+            conn.execute(
+                "INSERT INTO jobs (id, task, tool_class, params, status, progress, message, result, created_at, started_at, finished_at) "
+                "VALUES (?, ?, ?, ?, ?, 1, ?, ?, ?, ?, ?)",
+                (job_id, task, TASKS[task][0], json.dumps(params or {}), STATUS_DONE, "Concluída.", json.dumps(result or {}), now, now, now)
+            )
+        log.info(f"Tarefa {job_id} ({task}) registrada como concluída.")
+        return job_id
+
+    def get(self, job_id):
+        with _connect(self.db_path) as conn:
+            return _row_to_job(conn.execute("SELECT * FROM jobs WHERE id = ?", (job_id,)).fetchone())
+
+    def queue_position(self, job_id):
+        """Quantidade de tarefas na frente desta na fila da mesma classe de ferramenta."""
+        with _connect(self.db_path) as conn:
+            row = conn.execute(
+                "SELECT COUNT(*) AS ahead FROM jobs j, jobs me WHERE me.id = ? AND j.status = ? "
+                "AND j.tool_class = me.tool_class AND j.created_at < me.created_at", (job_id, STATUS_QUEUED)
+            ).fetchone()
+        return row["ahead"] if row else 0
+
+    def cancel(self, job_id):
+        """Cancela uma tarefa na fila ou sinaliza o cancelamento de uma tarefa em execução."""
+        with _connect(self.db_path) as conn:
+            conn.execute(
+                "UPDATE jobs SET status = ?, message = ?, finished_at = ? WHERE id = ? AND status = ?",
+                (STATUS_CANCELLED, "Cancelada.", time.time(), job_id, STATUS_QUEUED)
+            )
+            conn.execute(
+                "UPDATE jobs SET status = ?, message = ? WHERE id = ? AND status = ?",
+                (STATUS_CANCELLING, "Cancelando...", job_id, STATUS_RUNNING)
+            )
+
+    def job_dir(self, job_id):
+        return os.path.join(self.jobs_dir, job_id)
+
+    def output_path(self, job_id, name):
+        return os.path.join(self.job_dir(job_id), "output", name)
+
+    # --- Despacho ---
+    def _requeue_orphans(self):
+        """Tarefas 'em execução' cujo processo dono morreu (ex.: reinício do container) voltam para a fila."""
+        with _connect(self.db_path) as conn:
+            rows = conn.execute("SELECT id, owner, status FROM jobs WHERE status IN (?, ?)",
+                                (STATUS_RUNNING, STATUS_CANCELLING)).fetchall()
+            for row in rows:
+                if _owner_alive(row["owner"]):
+                    continue
+                if row["status"] == STATUS_CANCELLING:
+                    conn.execute("UPDATE jobs SET status = ?, finished_at = ? WHERE id = ?",
+                                 (STATUS_CANCELLED, time.time(), row["id"]))
+                else:
+                    conn.execute("UPDATE jobs SET status = ?, progress = 0, message = ?, owner = NULL WHERE id = ?",
+                                 (STATUS_QUEUED, "Reenfileirada após reinício do servidor.", row["id"]))
+                    log.info(f"Tarefa {row['id']} reenfileirada (processo dono {row['owner']} não existe mais).")
+
+    def _pool(self, tool_class):
+        pool = self._pools.get(tool_class)
+        if pool is None:
+            workers = max(1, min(TOOL_CLASS_WORKERS.get(tool_class, 1), JOB_MAX_CONCURRENT))
+            # 'spawn' evita herdar, via fork, o estado multithread do servidor Streamlit
+            pool = ProcessPoolExecutor(max_workers=workers, mp_context=multiprocessing.get_context("spawn"))
+            self._pools[tool_class] = pool
+        return pool
+
+    def _dispatch_loop(self):
+        while True:
+            try:
+                self._dispatch_once()
+                if time.time() - self._last_janitor > JOB_JANITOR_INTERVAL_SECONDS:
+                    self._last_janitor = time.time()
+                    self.purge_expired()
+            except Exception as e:
+                log.error(f"Erro no despachante de tarefas: {e}", exc_info=True)
+            time.sleep(JOB_POLL_INTERVAL_SECONDS)
+
+    def _used_slots(self):
+        """Vagas ocupadas pelas tarefas deste servidor, incluindo as reservadas para processos auxiliares."""
+        with _connect(self.db_path) as conn:
+            return conn.execute("SELECT COALESCE(SUM(slots), 0) FROM jobs WHERE owner = ? AND status IN (?, ?)",
+                                (self._owner, STATUS_RUNNING, STATUS_CANCELLING)).fetchone()[0]
+
+    def _dispatch_once(self):
+        used = self._used_slots()
+        if used >= JOB_MAX_CONCURRENT:
+            return
+        with self._lock:
+            per_class = {}
+            for tool_class in self._running.values():
+                per_class[tool_class] = per_class.get(tool_class, 0) + 1
+        with _connect(self.db_path) as conn:
+            queued = conn.execute("SELECT * FROM jobs WHERE status = ? ORDER BY created_at", (STATUS_QUEUED,)).fetchall()
+        for row in queued:
+            tool_class = row["tool_class"]
+            if used >= JOB_MAX_CONCURRENT:
+                return
+            with self._lock:
+                if per_class.get(tool_class, 0) >= TOOL_CLASS_WORKERS.get(tool_class, 1):
+                    continue
+            with _connect(self.db_path) as conn:
+                claimed = conn.execute(
+                    "UPDATE jobs SET status = ?, owner = ?, slots = 1, started_at = ?, message = ? WHERE id = ? AND status = ?",
+                    (STATUS_RUNNING, self._owner, time.time(), "Processando...", row["id"], STATUS_QUEUED)
+                ).rowcount
+            if not claimed:
+                continue
+            self._start(row["id"], row["task"], tool_class, json.loads(row["params"]))
+            per_class[tool_class] = per_class.get(tool_class, 0) + 1
+            used += 1
+
+    def _start(self, job_id, task, tool_class, params):
+        task_path = TASKS[task][1]
+        with self._lock:
+            self._running[job_id] = tool_class
+        try:
+            future = self._pool(tool_class).submit(
+                _execute_task, task_path, job_id, self.job_dir(job_id), self.db_path, params
+            )
+        except Exception as e:
+            self._finish(job_id, tool_class, error=e)
+            return
+        log.info(f"Tarefa {job_id} ({task}) iniciada no pool '{tool_class}'.")
+        future.add_done_callback(lambda f: self._on_done(job_id, tool_class, f))
+
+    def _on_done(self, job_id, tool_class, future):
+        try:
+            self._finish(job_id, tool_class, result=future.result())
+        except BaseException as e:
+            self._finish(job_id, tool_class, error=e)
+
+    def _finish(self, job_id, tool_class, result=None, error=None):
+        with self._lock:
+            self._running.pop(job_id, None)
+            if isinstance(error, BrokenProcessPool):
+                # Um worker morreu (ex.: falta de memória): o pool inteiro precisa ser recriado
+                self._pools.pop(tool_class, None)
+        now = time.time()
+        with _connect(self.db_path) as conn:
+            if error is None:
+                conn.execute("UPDATE jobs SET status = ?, progress = 1, message = ?, result = ?, finished_at = ? WHERE id = ?",
+                             (STATUS_DONE, "Concluída.", json.dumps(result or {}), now, job_id))
+                log.info(f"Tarefa {job_id} concluída.")
+            elif isinstance(error, (JobCancelled, ProcessCancelled)):
+                conn.execute("UPDATE jobs SET status = ?, message = ?, finished_at = ? WHERE id = ?",
+                             (STATUS_CANCELLED, "Cancelada.", now, job_id))
+                log.info(f"Tarefa {job_id} cancelada.")
+            else:
+                conn.execute("UPDATE jobs SET status = ?, message = ?, error = ?, finished_at = ? WHERE id = ?",
+                             (STATUS_FAILED, "Falhou.", str(error), now, job_id))
+                log.error(f"Tarefa {job_id} falhou: {error}")
+
+    def purge_expired(self):
+        """Remove registros e arquivos de tarefas finalizadas há mais de JOB_RETENTION_HOURS."""
+        limit = time.time() - JOB_RETENTION_HOURS * 3600
+        placeholders = ", ".join("?" for _ in FINAL_STATUSES)
+        with _connect(self.db_path) as conn:
+            rows = conn.execute(
+                f"SELECT id FROM jobs WHERE status IN ({placeholders}) AND finished_at < ?", (*FINAL_STATUSES, limit)
+            ).fetchall()
+            for row in rows:
+                shutil.rmtree(self.job_dir(row["id"]), ignore_errors=True)
+                conn.execute("DELETE FROM jobs WHERE id = ?", (row["id"],))
+        if rows:
+            log.info(f"{len(rows)} tarefa(s) expirada(s) removida(s).")
+
+
+_manager = None
+_manager_lock = threading.Lock()
+
+
+def get_job_manager():
+    """Retorna o gerenciador de tarefas do processo (criado, com seu despachante, no primeiro uso)."""
+    global _manager
+    with _manager_lock:
+        if _manager is None:
+            _manager = JobManager()
+        return _manager
@@ -0,0 +1,64 @@
+import time
+import streamlit as st
+from modules.job_queue import get_job_manager, FINAL_STATUSES, STATUS_QUEUED
+
+JOB_POLL_INTERVAL_SECONDS = 1.0
+
+
+def remember_job(key, job_id):
+    """Guarda o id da tarefa na sessão e na URL, para que o usuário possa voltar ao resultado depois."""
+    st.session_state[key] = job_id
+    st.query_params[key] = job_id
+
+
+def recall_job(key):
+    """Recupera a tarefa ativa desta página (sessão ou URL). Retorna None se não houver ou se já expirou."""
+    job_id = st.session_state.get(key) or st.query_params.get(key)
+    if job_id and get_job_manager().get(job_id) is None:
+        forget_job(key)
+        return None
+    return job_id
+
+
+def forget_job(key):
+    st.session_state.pop(key, None)
+    if key in st.query_params:
+        del st.query_params[key]
+
+
+def render_job_lookup(key):
+    """Campo para retomar uma tarefa pelo código (ex.: depois de fechar a aba)."""
+    with st.expander("🔎 Já tem um código de tarefa? Recupere o resultado aqui"):
+        job_code = st.text_input("Código da tarefa", key=f"{key}_lookup").strip()
+        if st.button("Buscar tarefa", key=f"{key}_lookup_btn") and job_code:
+            if get_job_manager().get(job_code) is None:
+                st.error("Tarefa não encontrada (o código pode estar errado ou o resultado já expirou).")
+            else:
+                remember_job(key, job_code)
+                st.rerun()
+
+
+def wait_for_job(job_id, key, on_poll=None):
+    """
+    Exibe o andamento da tarefa até que termine e retorna o registro final (ou None se não existir).
+    `on_poll(job)` é chamado a cada consulta enquanto a tarefa está em execução (ex.: mostrar resultados parciais).
+    """
+    manager = get_job_manager()
+    st.caption(f"Código da tarefa: `{job_id}`. Você pode fechar esta página e voltar depois para buscar o resultado.")
+    cancel_placeholder = st.empty()
+    if cancel_placeholder.button("Cancelar tarefa", key=f"{key}_cancel"):
+        manager.cancel(job_id)
+    status_placeholder = st.empty()
+    while True:
+        job = manager.get(job_id)
+        if job is None or job["status"] in FINAL_STATUSES:
+            cancel_placeholder.empty()
+            status_placeholder.empty()
+            return job
+        if job["status"] == STATUS_QUEUED:
+            text = f"Na fila ({manager.queue_position(job_id)} tarefa(s) à frente)..."
+        else:
+            text = job["message"] or "Processando..."
+        status_placeholder.progress(job["progress"] or 0.0, text=text)
+        if on_poll is not None and job["status"] != STATUS_QUEUED: on_poll(job)
+        time.sleep(JOB_POLL_INTERVAL_SECONDS)
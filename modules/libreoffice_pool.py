@@ -0,0 +1,196 @@
+import os
+import json
+import time
+import queue
+import atexit
+import signal
+import shutil
+import logging
+import tempfile
+import threading
+import subprocess
+
+logging.basicConfig(level=logging.INFO)
+log = logging.getLogger(__name__)
+
+LIBREOFFICE_POOL_SIZE = int(os.getenv("LIBREOFFICE_POOL_SIZE", "1"))
+LIBREOFFICE_POOL_MAX_WAITING = int(os.getenv("LIBREOFFICE_POOL_MAX_WAITING", "8"))
+LIBREOFFICE_UNO_PYTHON = os.getenv("LIBREOFFICE_UNO_PYTHON", "/usr/bin/python3")
+CONVERSION_TIMEOUT_SECONDS = 120
+STARTUP_TIMEOUT_SECONDS = 60
+ACQUIRE_TIMEOUT_SECONDS = 300
+HEALTH_CHECK_IDLE_SECONDS = 60
+BRIDGE_SCRIPT = os.path.join(os.path.dirname(os.path.abspath(__file__)), "lo_uno_bridge.py")
+
+
+class _Instance:
+    """Um `soffice` headless de longa duração, com perfil próprio, e sua ponte UNO (modules/lo_uno_bridge.py)."""
+    def __init__(self, index, soffice_cmd, base_dir):
+        self.index = index
+        self.soffice_cmd = soffice_cmd
+        self.pipe_name = f"lo_pool_{os.getpid()}_{index}"
+        self.profile_dir = os.path.join(base_dir, f"perfil_{index}")
+        self.soffice = None
+        self.bridge = None
+        self._responses = queue.Queue()
+        self.last_used = 0.0
+
+    def start(self):
+        log.info(f"Iniciando instância LibreOffice #{self.index} (pipe {self.pipe_name})...")
+        self.soffice = subprocess.Popen(
+            [self.soffice_cmd, '--headless', '--invisible', '--nologo', '--nodefault', '--norestore', '--nolockcheck',
+             f'-env:UserInstallation=file://{self.profile_dir}',
+             f'--accept=pipe,name={self.pipe_name};urp;StarOffice.ComponentContext'],
+            stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL, start_new_session=True
+        )
+        self.bridge = subprocess.Popen(
+            # A ponte encerra o soffice se este processo morrer sem chamar stop() (ver lo_uno_bridge.py)
+            [LIBREOFFICE_UNO_PYTHON, BRIDGE_SCRIPT, self.pipe_name, str(self.soffice.pid), self.profile_dir],
+            stdin=subprocess.PIPE, stdout=subprocess.PIPE, stderr=subprocess.DEVNULL, text=True, bufsize=1
+        )
+        self._responses = queue.Queue()
+        threading.Thread(target=self._read_responses, args=(self.bridge, self._responses), daemon=True).start()
+        ready = self._wait_response(STARTUP_TIMEOUT_SECONDS)
+        if not ready or not ready.get("ok"):
+            self.stop()
+            raise RuntimeError((ready or {}).get("error", "A instância do LibreOffice não respondeu a tempo."))
+        self.last_used = time.time()
+        log.info(f"Instância LibreOffice #{self.index} pronta.")
+
+    @staticmethod
+    def _read_responses(bridge, responses):
+        for line in bridge.stdout:
+            try:
+                responses.put(json.loads(line))
+            except ValueError:
+                continue
+        responses.put(None)  # ponte encerrada
+
+    def _wait_response(self, timeout):
+        try:
+            return self._responses.get(timeout=timeout)
+        except queue.Empty:
+            return None
+
+    def is_alive(self):
+        return (self.soffice is not None and self.soffice.poll() is None
+                and self.bridge is not None and self.bridge.poll() is None)
+
+    def request(self, payload, timeout):
+        """Envia um pedido à ponte e aguarda a resposta. Retorna None em timeout ou se a ponte morreu."""
+        try:
+            self.bridge.stdin.write(json.dumps(payload) + "\n")
+            self.bridge.stdin.flush()
+        except (OSError, ValueError):
+            return None
+        response = self._wait_response(timeout)
+        self.last_used = time.time()
+        return response
+
+    def healthy(self):
+        if not self.is_alive():
+            return False
+        if time.time() - self.last_used < HEALTH_CHECK_IDLE_SECONDS:
+            return True
+        response = self.request({"cmd": "ping"}, timeout=10)
+        return bool(response and response.get("ok"))
+
+    def stop(self):
+        for proc in (self.bridge, self.soffice):
+            if proc is None or proc.poll() is not None:
+                continue
+            try:
+                os.killpg(proc.pid, signal.SIGTERM) if proc is self.soffice else proc.terminate()
+                proc.wait(timeout=10)
+            except (OSError, subprocess.TimeoutExpired):
+                try: proc.kill()
+                except OSError: pass
+        self.soffice = None
+        self.bridge = None
+
+    def restart(self):
+        self.stop()
+        shutil.rmtree(self.profile_dir, ignore_errors=True)  # um perfil corrompido pode ter causado a falha
+        self.start()
+
+
+class LibreOfficePool:
+    """
+    Pool de instâncias LibreOffice aquecidas, cada uma com perfil isolado. As instâncias sobem sob demanda,
+    são verificadas (ping) após ficarem ociosas e reiniciadas em caso de falha ou timeout. A quantidade de
+    pedidos aguardando uma instância livre é limitada por LIBREOFFICE_POOL_MAX_WAITING.
+    """
+    def __init__(self, soffice_cmd, size=LIBREOFFICE_POOL_SIZE, max_waiting=LIBREOFFICE_POOL_MAX_WAITING):
+        self.base_dir = tempfile.mkdtemp(prefix="lo_pool_")
+        self._idle = queue.Queue()
+        for index in range(max(1, size)):
+            self._idle.put(_Instance(index, soffice_cmd, self.base_dir))
+        self._instances = list(self._idle.queue)
+        self._max_waiting = max_waiting
+        self._waiting = 0
+        self._lock = threading.Lock()
+
+    def convert(self, input_path, output_path, timeout=CONVERSION_TIMEOUT_SECONDS):
+        """Converte `input_path` para PDF em `output_path`. Retorna (sucesso, mensagem)."""
+        with self._lock:
+            if self._waiting >= self._max_waiting:
+                return False, "Fila de conversões do LibreOffice cheia."
+            self._waiting += 1
+        try:
+            instance = self._idle.get(timeout=ACQUIRE_TIMEOUT_SECONDS)
+        except queue.Empty:
+            return False, "Nenhuma instância do LibreOffice ficou livre a tempo."
+        finally:
+            with self._lock:
+                self._waiting -= 1
+        try:
+            if not instance.healthy():
+                instance.restart()
+            response = instance.request({"cmd": "convert", "input": input_path, "output": output_path}, timeout)
+            if response is None:
+                log.warning(f"Instância LibreOffice #{instance.index} travou ou caiu durante a conversão. Reiniciando.")
+                instance.restart()
+                return False, "A instância do LibreOffice não respondeu."
+            if not response.get("ok"):
+                return False, response.get("error", "Erro desconhecido na conversão.")
+            return True, "Conversão concluída."
+        except Exception as e:
+            log.error(f"Erro no pool do LibreOffice: {e}", exc_info=True)
+            instance.stop()
+            return False, str(e)
+        finally:
+            self._idle.put(instance)
+
+    def shutdown(self):
+        for instance in self._instances:
+            instance.stop()
+        shutil.rmtree(self.base_dir, ignore_errors=True)
+
+
+def _uno_bridge_available():
+    try:
+        subprocess.run([LIBREOFFICE_UNO_PYTHON, '-c', 'import uno'], check=True,
+                       stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL, timeout=15)
+        return True
+    except (OSError, subprocess.SubprocessError):
+        return False
+
+
+_pool = None
+_pool_checked = False
+_pool_lock = threading.Lock()
+
+
+def get_libreoffice_pool(soffice_cmd):
+    """Retorna o pool do processo, ou None se a ponte UNO (python3-uno) não estiver disponível."""
+    global _pool, _pool_checked
+    with _pool_lock:
+        if not _pool_checked:
+            _pool_checked = True
+            if soffice_cmd and _uno_bridge_available():
+                _pool = LibreOfficePool(soffice_cmd)
+                atexit.register(_pool.shutdown)
+            else:
+                log.warning(f"Ponte UNO indisponível ('{LIBREOFFICE_UNO_PYTHON} -c \"import uno\"' falhou). "
+                            "Conversões usarão o soffice via linha de comando.")
+        return _pool
@@ -0,0 +1,191 @@
+import os
+import re
+import json
+import time
+import sqlite3
+import hashlib
+import logging
+import threading
+import contextlib
+
+logging.basicConfig(level=logging.INFO)
+log = logging.getLogger(__name__)
+
+LLM_CACHE_DIR = os.getenv("LLM_CACHE_DIR", "/app/.cache/llm")
+LLM_CACHE_MAX_MB = float(os.getenv("LLM_CACHE_MAX_MB", "256"))
+
+CACHE_FORMAT_VERSION = 1
+COUNTERS = ("exact_hits", "exact_misses", "paragraph_hits", "paragraph_misses", "writes", "evictions")
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS responses (
+    key TEXT PRIMARY KEY,
+    response TEXT NOT NULL,
+    size INTEGER NOT NULL,
+    created_at REAL NOT NULL,
+    accessed_at REAL NOT NULL
+);
+CREATE INDEX IF NOT EXISTS responses_accessed ON responses (accessed_at);
+CREATE TABLE IF NOT EXISTS counters (
+    name TEXT PRIMARY KEY,
+    value INTEGER NOT NULL
+);
+"""
+
+_PARAGRAPH_BREAK = re.compile(r"\n\s*\n")
+
+
+def normalize_text(text):
+    """Forma canônica para a chave: parágrafos preservados, espaços e quebras simples internas colapsados."""
+    return "\n\n".join(" ".join(paragraph.split()) for paragraph in _PARAGRAPH_BREAK.split(text.strip()) if paragraph.strip())
+
+
+def split_response_paragraphs(text):
+    return [paragraph.strip() for paragraph in _PARAGRAPH_BREAK.split(text.strip()) if paragraph.strip()]
+
+
+def prompt_version(*templates):
+    """Versão do prompt = hash do texto dos templates: qualquer ajuste no prompt invalida as respostas antigas."""
+    return hashlib.sha256("\x00".join(templates).encode("utf-8")).hexdigest()[:16]
+
+
+@contextlib.contextmanager
+def _connect(db_path):
+    """Conexão curta (uma por operação): faz commit ao final do bloco e sempre fecha."""
+    conn = sqlite3.connect(db_path, timeout=30)
+    try:
+        conn.execute("PRAGMA journal_mode=WAL")
+        with conn:
+            yield conn
+    finally:
+        conn.close()
+
+
+class LLMCache:
+    """
+    Cache persistente (SQLite) de respostas da API de correção. A chave combina modelo, versão do prompt,
+    temperatura e o texto normalizado, e serve tanto para o documento inteiro (acerto exato) quanto para cada
+    parágrafo: reenviar um ofício com um parágrafo alterado só manda esse parágrafo para a API.
+    A remoção é por LRU ao exceder o orçamento; os contadores (taxa de acerto) ficam no próprio banco.
+    """
+    def __init__(self, root, max_bytes):
+        self.db_path = os.path.join(root, "respostas.sqlite3")
+        self.max_bytes = max_bytes
+        self._lock = threading.Lock()
+        try:
+            os.makedirs(root, exist_ok=True)
+            with _connect(self.db_path) as conn:
+                conn.executescript(_SCHEMA)
+            self.enabled = True
+        except (OSError, sqlite3.Error) as e:
+            log.warning(f"Cache de respostas da IA desabilitado ('{root}'): {e}")
+            self.enabled = False
+
+    def make_key(self, model, prompt, temperature, text):
+        description = {"v": CACHE_FORMAT_VERSION, "model": model, "prompt": prompt, "temperature": temperature, "text": normalize_text(text)}
+        return hashlib.sha256(json.dumps(description, sort_keys=True).encode("utf-8")).hexdigest()
+
+    def _count(self, conn, name, amount=1):
+        if amount:
+            conn.execute(
+                "INSERT INTO counters (name, value) VALUES (?, ?) ON CONFLICT(name) DO UPDATE SET value = value + excluded.value",
+                (name, amount)
+            )
+
+    def get_many(self, keys, level="paragraph"):
+        """Retorna {chave: resposta} para as chaves encontradas. `level` ("exact" ou "paragraph") separa as métricas."""
+        if not self.enabled or not keys:
+            return {}
+        unique_keys = list(dict.fromkeys(keys))
+        try:
+            with _connect(self.db_path) as conn:
+                found = {}
+                for start in range(0, len(unique_keys), 500):  # limite de parâmetros do SQLite
+                    batch = unique_keys[start:start + 500]
+                    rows = conn.execute(f"SELECT key, response FROM responses WHERE key IN ({','.join('?' * len(batch))})", batch)
+                    found.update(rows.fetchall())
+                if found:
+                    conn.executemany("UPDATE responses SET accessed_at = ? WHERE key = ?", [(time.time(), key) for key in found])
+                hits = sum(key in found for key in keys)
+                self._count(conn, f"{level}_hits", hits)
+                self._count(conn, f"{level}_misses", len(keys) - hits)
+                return found
+        except sqlite3.Error as e:
+            log.warning(f"Falha ao consultar o cache de respostas da IA: {e}")
+            return {}
+
+    def get(self, key, level="exact"):
+        return self.get_many([key], level).get(key)
+
+    def put_many(self, entries):
+        """Grava pares (chave, resposta). Falhas de cache nunca interrompem o chamador."""
+        if not self.enabled or not entries:
+            return False
+        now = time.time()
+        try:
+            with _connect(self.db_path) as conn:
+                conn.executemany(
+                    "INSERT OR REPLACE INTO responses (key, response, size, created_at, accessed_at) VALUES (?, ?, ?, ?, ?)",
+                    [(key, response, len(response.encode("utf-8")), now, now) for key, response in entries]
+                )
+                self._count(conn, "writes", len(entries))
+        except sqlite3.Error as e:
+            log.warning(f"Falha ao gravar no cache de respostas da IA: {e}")
+            return False
+        self._evict()
+        return True
+
+    def put(self, key, response):
+        return self.put_many([(key, response)])
+
+    def _evict(self):
+        """Remove as respostas menos usadas até caber no orçamento (um processo por vez)."""
+        if not self._lock.acquire(blocking=False):
+            return
+        try:
+            with _connect(self.db_path) as conn:
+                total = conn.execute("SELECT COALESCE(SUM(size), 0) FROM responses").fetchone()[0]
+                if total <= self.max_bytes:
+                    return
+                removed = 0
+                for key, size in conn.execute("SELECT key, size FROM responses ORDER BY accessed_at").fetchall():
+                    if total <= self.max_bytes * 0.9:  # folga para não remover a cada gravação
+                        break
+                    conn.execute("DELETE FROM responses WHERE key = ?", (key,))
+                    total -= size
+                    removed += 1
+                self._count(conn, "evictions", removed)
+            log.info(f"Cache de respostas da IA: {removed} resposta(s) removida(s) por LRU.")
+        except sqlite3.Error as e:
+            log.warning(f"Falha ao limpar o cache de respostas da IA: {e}")
+        finally:
+            self._lock.release()
+
+    def stats(self):
+        """Contadores acumulados (todas as execuções), tamanho atual e taxas de acerto por documento e por parágrafo."""
+        stats = dict.fromkeys(COUNTERS, 0)
+        if not self.enabled:
+            return stats
+        try:
+            with _connect(self.db_path) as conn:
+                stats.update(conn.execute("SELECT name, value FROM counters").fetchall())
+                stats["entries"], stats["size_bytes"] = conn.execute("SELECT COUNT(*), COALESCE(SUM(size), 0) FROM responses").fetchone()
+        except sqlite3.Error as e:
+            log.warning(f"Falha ao ler métricas do cache de respostas da IA: {e}")
+        for level in ("exact", "paragraph"):
+            lookups = stats[f"{level}_hits"] + stats[f"{level}_misses"]
+            stats[f"{level}_hit_rate"] = stats[f"{level}_hits"] / lookups if lookups else 0.0
+        return stats
+
+
+_cache = None
+_cache_lock = threading.Lock()
+
+
+def get_llm_cache():
+    """Retorna a instância (única por processo) do cache de respostas da IA."""
+    global _cache
+    with _cache_lock:
+        if _cache is None:
+            _cache = LLMCache(LLM_CACHE_DIR, max_bytes=int(LLM_CACHE_MAX_MB * 1024 * 1024))
+        return _cache
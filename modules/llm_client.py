@@ -0,0 +1,393 @@
+import os
+import time
+import asyncio
+import logging
+import threading
+import contextlib
+import collections
+import httpx
+from openai import OpenAI, AsyncOpenAI, APIStatusError
+from dotenv import load_dotenv
+
+logging.basicConfig(level=logging.INFO)
+log = logging.getLogger(__name__)
+
+load_dotenv()  # uma vez por processo (antes era a cada TextCorrector, ou seja, a cada rerun das páginas)
+
+OPENAI_API_KEY = os.getenv("OPENAI_API_KEY")
+OPENAI_BASE_URL = os.getenv("OPENAI_BASE_URL", "https://api.deepseek.com")  # Default DeepSeek
+OPENAI_MODEL_NAME = os.getenv("OPENAI_MODEL_NAME", "deepseek-chat")  # Default DeepSeek model
+
+# Endpoints compatíveis com OpenAI, em ordem de preferência: "base_url|modelo|VARIAVEL_DA_CHAVE" separados por vírgula
+# (modelo e variável opcionais: padrão OPENAI_MODEL_NAME e OPENAI_API_KEY). Vazio: só OPENAI_BASE_URL.
+LLM_ENDPOINTS = os.getenv("LLM_ENDPOINTS", "")
+
+LLM_REQUEST_TIMEOUT_SECONDS = float(os.getenv("LLM_REQUEST_TIMEOUT_SECONDS", "120"))
+LLM_CONNECT_TIMEOUT_SECONDS = 10
+# Retentativas com backoff exponencial (e Retry-After) em 408/409/429/5xx e erros de conexão, feitas pelo SDK.
+# Com mais de um endpoint, cada um tenta só uma vez extra: o próximo endpoint é a retentativa.
+LLM_MAX_RETRIES = int(os.getenv("LLM_MAX_RETRIES", "3"))
+# Pool de conexões HTTP compartilhado (keep-alive evita um handshake TLS por chamada)
+LLM_POOL_MAX_CONNECTIONS = int(os.getenv("LLM_POOL_MAX_CONNECTIONS", "20"))
+LLM_POOL_MAX_KEEPALIVE = int(os.getenv("LLM_POOL_MAX_KEEPALIVE", "10"))
+LLM_POOL_KEEPALIVE_SECONDS = float(os.getenv("LLM_POOL_KEEPALIVE_SECONDS", "60"))
+# Hedging: sem resposta após o p95 recente (em segundos por token pedido, vezes o max_tokens da chamada), dispara
+# uma segunda chamada e fica com a primeira a chegar
+LLM_HEDGE = os.getenv("LLM_HEDGE", "0").lower() in ("1", "true", "sim", "yes")
+LLM_HEDGE_MIN_SAMPLES = 20
+LLM_HEDGE_WINDOW = 200
+LLM_HEDGE_PERCENTILE = 0.95
+# Roteamento: menor latência média (EWMA) penalizada pela taxa de erro; disjuntor após falhas seguidas.
+# As medidas são por endpoint e por tipo de chamada: "completion" (segundos por token pedido, resposta completa)
+# e "stream" (segundos até o início do fluxo), que não se misturam nem na ordem nem no hedging
+KIND_COMPLETION = "completion"
+KIND_STREAM = "stream"
+LLM_ROUTER_EWMA_ALPHA = 0.3
+LLM_ROUTER_ERROR_PENALTY = 4  # pontuação = latência EWMA × (1 + 4 × taxa de erro EWMA)
+LLM_BREAKER_FAILURES = int(os.getenv("LLM_BREAKER_FAILURES", "3"))
+LLM_BREAKER_COOLDOWN_SECONDS = float(os.getenv("LLM_BREAKER_COOLDOWN_SECONDS", "30"))
+# A cada N chamadas, o endpoint há mais tempo sem uso vai à frente: mede reservas e recupera o principal
+LLM_ROUTER_PROBE_EVERY = int(os.getenv("LLM_ROUTER_PROBE_EVERY", "20"))
+
+_lock = threading.Lock()
+_router = None
+_loop = None
+
+
+def _client_options(endpoint):
+    return {
+        "api_key": endpoint.api_key, "base_url": endpoint.base_url, "max_retries": endpoint.max_retries,
+        "timeout": httpx.Timeout(LLM_REQUEST_TIMEOUT_SECONDS, connect=LLM_CONNECT_TIMEOUT_SECONDS),
+    }
+
+
+def _pool_limits():
+    return httpx.Limits(
+        max_connections=LLM_POOL_MAX_CONNECTIONS, max_keepalive_connections=LLM_POOL_MAX_KEEPALIVE,
+        keepalive_expiry=LLM_POOL_KEEPALIVE_SECONDS
+    )
+
+
+def _is_endpoint_fault(error):
+    """Requisição inválida (400/422) falharia em qualquer endpoint; o resto (rede, 429, 5xx, chave) é do endpoint."""
+    return not (isinstance(error, APIStatusError) and error.status_code in (400, 422))
+
+
+class CircuitOpen(Exception):
+    """O endpoint está com o disjuntor aberto (ou com a chamada de teste em andamento): tente o próximo."""
+
+
+class LatencyTracker:
+    """
+    Latências recentes das chamadas bem-sucedidas de um endpoint e tipo de chamada. Nas respostas completas, em
+    segundos por token pedido (max_tokens): um ofício longo e um parágrafo curto entram na mesma escala, e o
+    percentil, vezes o max_tokens da chamada, define quando disparar a reserva.
+    """
+    def __init__(self, window=LLM_HEDGE_WINDOW):
+        self._samples = collections.deque(maxlen=window)
+        self._lock = threading.Lock()
+
+    def record(self, sample):
+        with self._lock:
+            self._samples.append(sample)
+
+    def percentile(self, fraction):
+        with self._lock:
+            samples = sorted(self._samples)
+        if len(samples) < LLM_HEDGE_MIN_SAMPLES: return None  # sem histórico suficiente, não há hedging
+        return samples[min(len(samples) - 1, int(fraction * len(samples)))]
+
+    def delay(self, tokens, fraction=LLM_HEDGE_PERCENTILE):
+        """Tempo de espera antes da reserva para uma chamada de `tokens` tokens pedidos (None: sem hedging)."""
+        per_token = self.percentile(fraction)
+        return per_token * tokens if per_token is not None and tokens else None
+
+
+class Endpoint:
+    """Um backend compatível com OpenAI: clientes próprios (criados sob demanda) e estatísticas para o roteamento."""
+    def __init__(self, base_url, model, api_key, max_retries=LLM_MAX_RETRIES):
+        self.base_url = base_url
+        self.model = model
+        self.api_key = api_key
+        self.max_retries = max_retries
+        self.latency = {KIND_COMPLETION: None, KIND_STREAM: None}  # EWMA por tipo; None = ainda sem medidas
+        self.latencies = {KIND_COMPLETION: LatencyTracker(), KIND_STREAM: LatencyTracker()}  # janelas do hedging
+        self.error_rate = 0.0
+        self.failures = 0  # falhas seguidas
+        self.open_until = 0.0
+        self.probing = False  # chamada de teste (disjuntor meio-aberto) em andamento
+        self.last_used = 0.0
+        self._client = None
+        self._async_client = None
+        self._lock = threading.Lock()
+
+    @property
+    def name(self):
+        return f"{self.model}@{self.base_url}"
+
+    def client(self):
+        with self._lock:
+            if self._client is None:
+                self._client = OpenAI(**_client_options(self), http_client=httpx.Client(limits=_pool_limits()))
+            return self._client
+
+    def async_client(self):
+        """Cliente assíncrono; só deve ser usado em corrotinas executadas via run_async/submit_async."""
+        with self._lock:
+            if self._async_client is None:
+                self._async_client = AsyncOpenAI(**_client_options(self), http_client=httpx.AsyncClient(limits=_pool_limits()))
+            return self._async_client
+
+    def record_success(self, seconds, kind=KIND_COMPLETION, tokens=None):
+        """
+        Registra uma chamada bem-sucedida. "completion" mede segundos por token pedido (`tokens` = max_tokens; sem
+        ele, só conta o sucesso); "stream" mede o tempo até o início do fluxo, independente do tamanho.
+        """
+        sample = seconds / tokens if tokens else (seconds if kind == KIND_STREAM else None)
+        with self._lock:
+            if sample is not None:
+                previous = self.latency[kind]
+                self.latency[kind] = sample if previous is None else previous + LLM_ROUTER_EWMA_ALPHA * (sample - previous)
+            self.error_rate *= 1 - LLM_ROUTER_EWMA_ALPHA
+            if self.failures >= LLM_BREAKER_FAILURES: log.info(f"Endpoint {self.name} respondeu: disjuntor fechado.")
+            self.failures = 0
+            self.last_used = time.monotonic()
+        if sample is not None: self.latencies[kind].record(sample)
+
+    def record_failure(self):
+        with self._lock:
+            self.error_rate += LLM_ROUTER_EWMA_ALPHA * (1 - self.error_rate)
+            self.failures += 1
+            self.last_used = time.monotonic()
+            if self.failures >= LLM_BREAKER_FAILURES:
+                # Aberto: fora da ordem até o fim do resfriamento; depois, meio-aberto, uma chamada de teste por vez
+                self.open_until = time.monotonic() + LLM_BREAKER_COOLDOWN_SECONDS
+                log.warning(f"Endpoint {self.name}: {self.failures} falha(s) seguida(s), disjuntor aberto por {LLM_BREAKER_COOLDOWN_SECONDS:.0f}s.")
+
+    def is_open(self, now=None):
+        return (now or time.monotonic()) < self.open_until
+
+    def is_tripped(self):
+        """Disjuntor aberto ou meio-aberto: ainda sem sucesso desde as últimas falhas seguidas."""
+        return self.failures >= LLM_BREAKER_FAILURES
+
+    def half_open(self):
+        with self._lock:
+            self.open_until = min(self.open_until, time.monotonic())
+
+    @contextlib.contextmanager
+    def admitted(self):
+        """
+        Envolve uma chamada ao endpoint: fechado, sempre admite; aberto, levanta CircuitOpen; meio-aberto, admite
+        só uma chamada de teste por vez (as demais levantam CircuitOpen), liberada ao fim dela, com ou sem sucesso.
+        """
+        with self._lock:
+            probe = self.is_tripped()
+            if probe and (self.is_open() or self.probing):
+                raise CircuitOpen(f"Endpoint {self.name} indisponível (disjuntor aberto).")
+            self.probing = self.probing or probe
+        try:
+            yield
+        finally:
+            if probe:
+                with self._lock: self.probing = False
+
+    def score(self, kind=KIND_COMPLETION):
+        return (self.latency[kind] or 0.0) * (1 + LLM_ROUTER_ERROR_PENALTY * self.error_rate)
+
+    def status(self):
+        return {
+            "endpoint": self.name, "seconds_per_token": self.latency[KIND_COMPLETION],
+            "first_token_s": self.latency[KIND_STREAM], "error_rate": self.error_rate,
+            "consecutive_failures": self.failures, "circuit_open": self.is_open(),
+        }
+
+
+def parse_endpoints(spec):
+    """Lê LLM_ENDPOINTS (ver acima). Endpoints sem chave de API são ignorados."""
+    endpoints = []
+    for item in filter(None, (part.strip() for part in spec.split(","))):
+        base_url, model, key_var = [field.strip() for field in (item.split("|") + ["", ""])[:3]]
+        api_key = os.getenv(key_var) if key_var else OPENAI_API_KEY
+        if not api_key:
+            log.warning(f"Endpoint {base_url} ignorado: chave de API ({key_var or 'OPENAI_API_KEY'}) não definida.")
+            continue
+        endpoints.append(Endpoint(base_url, model or OPENAI_MODEL_NAME, api_key))
+    if not spec.strip() and OPENAI_API_KEY:
+        endpoints.append(Endpoint(OPENAI_BASE_URL, OPENAI_MODEL_NAME, OPENAI_API_KEY))
+    if len(endpoints) > 1:
+        for endpoint in endpoints: endpoint.max_retries = min(1, LLM_MAX_RETRIES)
+    return endpoints
+
+
+class EndpointRouter:
+    """
+    Escolhe a ordem de tentativa dos endpoints a cada chamada, sem os de disjuntor aberto (se todos estiverem
+    abertos, passam a meio-abertos: cada um aceita uma chamada de teste por vez). Disjuntores fechados primeiro,
+    meio-abertos depois; em cada grupo, os já medidos pela pontuação (latência EWMA do tipo de chamada, penalizada
+    pela taxa de erro) e os ainda não medidos na ordem configurada, depois dos medidos. A cada LLM_ROUTER_PROBE_EVERY
+    chamadas, o endpoint há mais tempo sem uso vai à frente (sonda), para que as medidas dos demais não envelheçam
+    e um principal recuperado volte a ser escolhido.
+    """
+    def __init__(self, endpoints):
+        self.endpoints = endpoints
+        self._calls = 0
+        self._lock = threading.Lock()
+
+    def ordered(self, kind=KIND_COMPLETION):
+        now = time.monotonic()
+        available = [(index, endpoint) for index, endpoint in enumerate(self.endpoints) if not endpoint.is_open(now)]
+        if not available and self.endpoints:
+            for endpoint in self.endpoints: endpoint.half_open()
+            available = list(enumerate(self.endpoints))
+        ranked = [endpoint for _, endpoint in sorted(
+            available, key=lambda item: (item[1].is_tripped(), item[1].latency[kind] is None, item[1].score(kind), item[0])
+        )]
+        with self._lock:
+            self._calls += 1
+            probe = LLM_ROUTER_PROBE_EVERY and len(ranked) > 1 and self._calls % LLM_ROUTER_PROBE_EVERY == 0
+        if probe:
+            stalest = min(ranked[1:], key=lambda endpoint: endpoint.last_used)
+            ranked.remove(stalest)
+            ranked.insert(0, stalest)
+        return ranked
+
+    def status(self):
+        return [endpoint.status() for endpoint in self.endpoints]
+
+
+def get_router():
+    """Roteador único por processo, com os endpoints de LLM_ENDPOINTS (ou só OPENAI_BASE_URL)."""
+    global _router
+    with _lock:
+        if _router is None:
+            _router = EndpointRouter(parse_endpoints(LLM_ENDPOINTS))
+            if _router.endpoints:
+                log.info(f"Cliente OpenAI inicializado. Endpoints: {', '.join(endpoint.name for endpoint in _router.endpoints)}")
+        return _router
+
+
+def get_llm_client():
+    """Cliente OpenAI síncrono do endpoint principal, único por processo (None sem chave de API)."""
+    endpoints = get_router().endpoints
+    return endpoints[0].client() if endpoints else None
+
+
+def _get_loop():
+    """Loop asyncio dedicado (numa thread daemon): os clientes assíncronos e suas conexões vivem sempre no mesmo loop."""
+    global _loop
+    with _lock:
+        if _loop is None:
+            _loop = asyncio.new_event_loop()
+            threading.Thread(target=_loop.run_forever, name="llm-loop", daemon=True).start()
+        return _loop
+
+
+def submit_async(coro):
+    """Agenda `coro` no loop dos clientes e retorna um concurrent.futures.Future."""
+    return asyncio.run_coroutine_threadsafe(coro, _get_loop())
+
+
+def run_async(coro):
+    """Executa `coro` no loop dos clientes e espera o resultado (chamável de qualquer thread, inclusive a do Streamlit)."""
+    return submit_async(coro).result()
+
+
+async def _attempt(endpoint, request):
+    with endpoint.admitted():
+        started = time.monotonic()
+        try:
+            response = await endpoint.async_client().chat.completions.create(**{**request, "model": endpoint.model})
+        except Exception as e:
+            if _is_endpoint_fault(e): endpoint.record_failure()
+            raise
+        endpoint.record_success(time.monotonic() - started, KIND_COMPLETION, request.get("max_tokens"))
+        return endpoint, response
+
+
+async def create_completion(**request):
+    """
+    chat.completions.create (sem fluxo) roteado entre os endpoints (o `model` é o de cada endpoint). Se o escolhido
+    falhar, passa ao próximo. Com LLM_HEDGE ativo, se a resposta demorar mais que o p95 recente do endpoint escolhido
+    (proporcional ao max_tokens pedido; sem max_tokens não há hedging), dispara a mesma chamada no próximo endpoint (ou no mesmo,
+    se for o único) e devolve a primeira que responder com sucesso, como (endpoint, resposta): o modelo de fato
+    usado é endpoint.model. Levanta a exceção da API se todos falharem.
+    """
+    endpoints = get_router().ordered()
+    if not endpoints: raise RuntimeError("Nenhum endpoint de LLM configurado.")
+    remaining = endpoints[1:]
+    tasks = [asyncio.ensure_future(_attempt(endpoints[0], request))]
+    try:
+        delay = endpoints[0].latencies[KIND_COMPLETION].delay(request.get("max_tokens")) if LLM_HEDGE else None
+        if delay is not None:
+            done, _ = await asyncio.wait(tasks, timeout=delay)
+            if not done:
+                hedge = remaining.pop(0) if remaining else endpoints[0]
+                log.info(f"Sem resposta da API após {delay:.1f}s (p95 para {request['max_tokens']} tokens): disparando chamada de reserva em {hedge.name}.")
+                tasks.append(asyncio.ensure_future(_attempt(hedge, request)))
+        error, pending = None, set(tasks)
+        while pending:
+            done, pending = await asyncio.wait(pending, return_when=asyncio.FIRST_COMPLETED)
+            for task in done:
+                if task.exception() is None: return task.result()
+                error = task.exception()
+                if not _is_endpoint_fault(error): raise error
+                if remaining and not pending:
+                    log.warning(f"Falha na API ({error}); tentando o endpoint {remaining[0].name}.")
+                    tasks.append(asyncio.ensure_future(_attempt(remaining.pop(0), request)))
+                    pending.add(tasks[-1])
+        raise error
+    finally:
+        for task in tasks:
+            if not task.done(): task.cancel()
+
+
+async def open_stream(**request):
+    """
+    Abre um fluxo (stream=True) no melhor endpoint, passando ao próximo se a chamada falhar antes da resposta.
+    Retorna (endpoint, fluxo); falhas durante a leitura devem ser registradas com endpoint.record_failure().
+    """
+    error = None
+    for endpoint in get_router().ordered(KIND_STREAM):
+        try:
+            with endpoint.admitted():
+                started = time.monotonic()
+                try:
+                    stream = await endpoint.async_client().chat.completions.create(**{**request, "model": endpoint.model, "stream": True})
+                except Exception as e:
+                    if not _is_endpoint_fault(e): raise
+                    endpoint.record_failure()
+                    log.warning(f"Falha ao abrir fluxo em {endpoint.name} ({e}).")
+                    error = e
+                    continue
+                endpoint.record_success(time.monotonic() - started, KIND_STREAM)  # tempo até a resposta começar
+                return endpoint, stream
+        except CircuitOpen as e:
+            error = error or e
+    raise error or RuntimeError("Nenhum endpoint de LLM configurado.")
+
+
+class RoutedCompletions:
+    """
+    Substituto de `client.chat.completions` (síncrono) com o mesmo roteamento e failover, para o ChatOpenAI do
+    LangChain (parâmetro `client`). Sem hedging: as chamadas da Consulta RDPM são interativas e únicas.
+    """
+    def create(self, **request):
+        error = None
+        for endpoint in get_router().ordered():
+            try:
+                with endpoint.admitted():
+                    started = time.monotonic()
+                    try:
+                        response = endpoint.client().chat.completions.create(**{**request, "model": endpoint.model})
+                    except Exception as e:
+                        if not _is_endpoint_fault(e): raise
+                        endpoint.record_failure()
+                        log.warning(f"Falha na API em {endpoint.name} ({e}); tentando o próximo endpoint.")
+                        error = e
+                        continue
+                    endpoint.record_success(time.monotonic() - started, KIND_COMPLETION, request.get("max_tokens"))
+                    return response
+            except CircuitOpen as e:
+                error = error or e
+        raise error or RuntimeError("Nenhum endpoint de LLM configurado.")
@@ -0,0 +1,145 @@
+"""
+Ponte UNO de uma instância do pool de LibreOffice (modules.libreoffice_pool).
+
+Executada pelo Python do sistema, que possui o módulo `uno` (pacote python3-uno), e não pelo Python
+da aplicação. Conecta-se ao `soffice` pelo pipe informado e atende pedidos em JSON, um por linha,
+na entrada padrão, respondendo um JSON por linha na saída padrão:
+    {"cmd": "ping"}
+    {"cmd": "convert", "input": "/caminho/doc.docx", "output": "/caminho/doc.pdf"}
+
+A ponte também amarra a vida do `soffice` (iniciado em sessão própria) à do worker que a criou: quando a entrada
+padrão fecha ou o processo pai morre (worker que caiu ou foi reciclado sem passar pelo atexit), ela encerra o
+grupo de processos do `soffice` e remove o perfil da instância.
+
+Uso: lo_uno_bridge.py <pipe> [<pid do soffice> <diretório do perfil>]
+"""
+import os
+import sys
+import json
+import time
+import shutil
+import signal
+import threading
+
+import uno
+from com.sun.star.beans import PropertyValue
+
+CONNECT_TIMEOUT_SECONDS = 60
+PARENT_CHECK_SECONDS = 2
+SOFFICE_STOP_SECONDS = 10
+CSV_FILTER_OPTIONS = "44,34,76,1"  # separador vírgula, aspas duplas, UTF-8, começa na linha 1
+
+
+def _prop(name, value):
+    prop = PropertyValue()
+    prop.Name = name
+    prop.Value = value
+    return prop
+
+
+def _connect(pipe_name):
+    local_context = uno.getComponentContext()
+    resolver = local_context.ServiceManager.createInstanceWithContext("com.sun.star.bridge.UnoUrlResolver", local_context)
+    deadline = time.time() + CONNECT_TIMEOUT_SECONDS
+    while True:
+        try:
+            context = resolver.resolve(f"uno:pipe,name={pipe_name};urp;StarOffice.ComponentContext")
+            return context.ServiceManager.createInstanceWithContext("com.sun.star.frame.Desktop", context)
+        except Exception:
+            if time.time() > deadline:
+                raise
+            time.sleep(0.25)
+
+
+def _export_filter(document):
+    if document.supportsService("com.sun.star.sheet.SpreadsheetDocument"):
+        return "calc_pdf_Export"
+    if document.supportsService("com.sun.star.presentation.PresentationDocument"):
+        return "impress_pdf_Export"
+    if document.supportsService("com.sun.star.drawing.DrawingDocument"):
+        return "draw_pdf_Export"
+    return "writer_pdf_Export"
+
+
+def _convert(desktop, input_path, output_path):
+    load_props = [_prop("Hidden", True), _prop("ReadOnly", True)]
+    if input_path.lower().endswith(".csv"):
+        load_props += [_prop("FilterName", "Text - txt - csv (StarCalc)"), _prop("FilterOptions", CSV_FILTER_OPTIONS)]
+    document = desktop.loadComponentFromURL(
+        uno.systemPathToFileUrl(os.path.abspath(input_path)), "_blank", 0, tuple(load_props)
+    )
+    if document is None:
+        raise RuntimeError("O LibreOffice não conseguiu abrir o documento.")
+    try:
+        document.storeToURL(
+            uno.systemPathToFileUrl(os.path.abspath(output_path)), (_prop("FilterName", _export_filter(document)),)
+        )
+    finally:
+        document.close(True)
+
+
+def _reply(**payload):
+    sys.stdout.write(json.dumps(payload) + "\n")
+    sys.stdout.flush()
+
+
+def _stop_soffice(soffice_pid, profile_dir):
+    """Encerra o grupo de processos do soffice (SIGTERM, depois SIGKILL) e remove o perfil."""
+    if not soffice_pid:
+        return
+    try:
+        os.killpg(soffice_pid, signal.SIGTERM)
+        deadline = time.time() + SOFFICE_STOP_SECONDS
+        while time.time() < deadline:
+            os.killpg(soffice_pid, 0)  # ProcessLookupError quando o grupo inteiro terminou
+            time.sleep(0.2)
+        os.killpg(soffice_pid, signal.SIGKILL)
+    except OSError:
+        pass
+    if profile_dir:
+        shutil.rmtree(profile_dir, ignore_errors=True)
+
+
+def _watch_parent(soffice_pid, profile_dir):
+    """Se o worker morrer (a ponte é reparentada), encerra o soffice mesmo com a ponte presa numa conversão."""
+    parent = os.getppid()
+    while os.getppid() == parent:
+        time.sleep(PARENT_CHECK_SECONDS)
+    _stop_soffice(soffice_pid, profile_dir)
+    os._exit(1)
+
+
+def main(pipe_name, soffice_pid=None, profile_dir=None):
+    if soffice_pid:
+        threading.Thread(target=_watch_parent, args=(soffice_pid, profile_dir), daemon=True).start()
+    try:
+        return _serve(pipe_name)
+    finally:
+        _stop_soffice(soffice_pid, profile_dir)  # entrada fechada: o pool parou ou o worker morreu
+
+
+def _serve(pipe_name):
+    try:
+        desktop = _connect(pipe_name)
+    except Exception as e:
+        _reply(ok=False, error=f"Falha ao conectar ao soffice: {e}")
+        return 1
+    _reply(ok=True, ready=True)
+    for line in sys.stdin:
+        try:
+            request = json.loads(line)
+            if request.get("cmd") == "ping":
+                desktop.getComponents()  # força uma chamada real pela ponte
+                _reply(ok=True)
+            elif request.get("cmd") == "convert":
+                _convert(desktop, request["input"], request["output"])
+                _reply(ok=True)
+            else:
+                _reply(ok=False, error=f"Comando desconhecido: {request.get('cmd')}")
+        except Exception as e:
+            _reply(ok=False, error=str(e))
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main(sys.argv[1], int(sys.argv[2]) if len(sys.argv) > 2 else None, sys.argv[3] if len(sys.argv) > 3 else None))
@@ -1,40 +1,89 @@
 import os
-import tempfile
+import signal
 import subprocess
 import logging
 import whisper
-import shutil
 import json
+import queue
+import threading
+import multiprocessing
+import numpy as np
 import streamlit as st
+from modules.capabilities import get_capabilities, available_cpus
+from modules.result_cache import get_result_cache
+from modules.scratch import scratch_dir
+from modules.llm_cache import prompt_version
+from modules.text_corrector import CORRECT_TRANSCRIPTION_SYSTEM_PROMPT, CORRECT_TRANSCRIPTION_INSTRUCTION, CORRECT_TRANSCRIPTION_TEMPERATURE
+from modules.process_runner import run_process, streaming_process, ProcessCancelled, FfmpegProgress, SilenceDetector
 
 logging.basicConfig(level=logging.INFO)
 
 WHISPER_MODEL_NAME = "small"
-
-ffmpeg_path = None
-ffprobe_path = None
+WHISPER_SAMPLE_RATE = 16000
+WHISPER_DECODE_OPTIONS = {"language": "pt", "fp16": False}
+# "int8": camadas lineares quantizadas dinamicamente (CPU); gerado uma vez e salvo ao lado dos pesos originais
+WHISPER_QUANTIZE = os.getenv("WHISPER_QUANTIZE", "").strip().lower()
+WHISPER_CACHE_DIR = os.getenv("WHISPER_CACHE_DIR") or os.path.join(os.getenv("XDG_CACHE_HOME", os.path.expanduser("~/.cache")), "whisper")
+# Modo de áudio longo: corta nos silêncios e transcreve os trechos em processos paralelos (um modelo por processo)
+TRANSCRIBE_LONG_MIN_SECONDS = int(os.getenv("TRANSCRIBE_LONG_MIN_SECONDS", "600"))
+TRANSCRIBE_CHUNK_SECONDS = int(os.getenv("TRANSCRIBE_CHUNK_SECONDS", "300"))
+TRANSCRIBE_WORKERS = int(os.getenv("TRANSCRIBE_WORKERS", "0")) or max(1, min(4, available_cpus() // 2))
+TRANSCRIBE_CHUNK_OVERLAP_SECONDS = 2.0  # margem de cada lado; o trecho sobreposto é descartado na junção
+TRANSCRIBE_CUT_SEARCH_FRACTION = 0.25  # procura silêncio até 25% do tamanho do trecho antes/depois do corte ideal
+# Decodificação em fluxo: o ffmpeg entrega PCM em blocos para um buffer limitado, consumido em janelas de 30 s
+STREAM_WINDOW_SECONDS = 30
+STREAM_BUFFER_WINDOWS = 4  # blocos decodificados à frente da transcrição (memória constante, ~8 MB)
+STREAM_MAX_PENDING_SECONDS = 90  # limite do áudio ainda não transcrito carregado de uma janela para a próxima
+STREAM_READ_SIZE = 64 * 1024
+# Resultados parciais: a tarefa grava os segmentos em JSON por linha; a página refina seções prontas em paralelo
+TRANSCRIPT_SEGMENTS_FILE = "segmentos.jsonl"
+REFINE_SECTION_WORDS = int(os.getenv("REFINE_SECTION_WORDS", "600"))
+SILENCE_NOISE_DB = -35
+SILENCE_MIN_SECONDS = 0.6
 
 def _find_ffmpeg():
-    """Encontra o caminho do ffmpeg."""
-    global ffmpeg_path
-    if ffmpeg_path: return ffmpeg_path
-    ffmpeg_path = shutil.which("ffmpeg")
-    if ffmpeg_path:
-        logging.info(f"FFmpeg encontrado em: {ffmpeg_path}")
-    else:
-        logging.error("FFmpeg não encontrado no PATH. Funções de áudio/vídeo não funcionarão.")
-    return ffmpeg_path
+    """Encontra o caminho do ffmpeg (verificado uma vez por processo em modules.capabilities)."""
+    return get_capabilities().path("ffmpeg")
 
 def _find_ffprobe():
-    """Encontra o caminho do ffprobe."""
-    global ffprobe_path
-    if ffprobe_path: return ffprobe_path
-    ffprobe_path = shutil.which("ffprobe")
-    if ffprobe_path:
-        logging.info(f"ffprobe encontrado em: {ffprobe_path}")
-    else:
-        logging.warning("ffprobe não encontrado no PATH. Verificação de stream de áudio não será possível.")
-    return ffprobe_path
+    """Encontra o caminho do ffprobe (verificado uma vez por processo em modules.capabilities)."""
+    return get_capabilities().path("ffprobe")
+
+
+def _quantize_int8(model):
+    """Quantização dinâmica int8 das camadas lineares (pesos int8, ativações quantizadas em tempo de execução)."""
+    import torch
+    # O Whisper usa uma subclasse de nn.Linear, que o quantize_dynamic não reconhece; o forward é equivalente em fp32
+    for module in model.modules():
+        if isinstance(module, torch.nn.Linear): module.__class__ = torch.nn.Linear
+    return torch.quantization.quantize_dynamic(model, {torch.nn.Linear}, dtype=torch.qint8)
+
+
+def load_whisper_weights(model_name=WHISPER_MODEL_NAME, quantize=WHISPER_QUANTIZE):
+    """
+    Carrega o modelo Whisper na CPU. Com `quantize="int8"`, usa a variante quantizada salva em
+    WHISPER_CACHE_DIR/<modelo>.int8.pt, gerando-a a partir dos pesos originais na primeira vez.
+    """
+    if quantize != "int8":
+        return whisper.load_model(model_name, device="cpu", download_root=WHISPER_CACHE_DIR)
+    import torch
+    quantized_path = os.path.join(WHISPER_CACHE_DIR, f"{model_name}.int8.pt")
+    if os.path.exists(quantized_path):
+        try:
+            return torch.load(quantized_path, map_location="cpu", weights_only=False)
+        except Exception as e:
+            logging.warning(f"Modelo quantizado em cache inválido ({quantized_path}), gerando de novo: {e}")
+    logging.info(f"Gerando variante int8 do modelo Whisper '{model_name}'...")
+    model = _quantize_int8(whisper.load_model(model_name, device="cpu", download_root=WHISPER_CACHE_DIR))
+    temp_path = f"{quantized_path}.{os.getpid()}.tmp"
+    try:
+        torch.save(model, temp_path)
+        os.replace(temp_path, quantized_path)  # atômico: outros processos nunca leem um arquivo pela metade
+        logging.info(f"Modelo int8 salvo em {quantized_path}.")
+    except OSError as e:
+        logging.warning(f"Não foi possível salvar o modelo quantizado: {e}")
+        if os.path.exists(temp_path): os.unlink(temp_path)
+    return model
 
 
 @st.cache_resource(show_spinner=False)
@@ -47,8 +96,8 @@ def load_whisper_model():
         if not _find_ffmpeg():
              logging.error("FFmpeg não encontrado, necessário para Whisper.")
              pass
-        model = whisper.load_model(WHISPER_MODEL_NAME)
-        logging.info(f"Modelo Whisper '{WHISPER_MODEL_NAME}' carregado com sucesso e cacheado.")
+        model = load_whisper_weights()
+        logging.info(f"Modelo Whisper '{WHISPER_MODEL_NAME}'{' (int8)' if WHISPER_QUANTIZE == 'int8' else ''} carregado com sucesso e cacheado.")
         return model
     except Exception as e:
         logging.error(f"Erro CRÍTICO ao carregar modelo Whisper '{WHISPER_MODEL_NAME}': {e}", exc_info=True)
@@ -89,9 +138,21 @@ def _has_audio_stream(input_path):
         logging.error(f"Erro inesperado ao verificar streams de áudio: {str(e)}")
         return True, f"Erro inesperado na verificação de áudio: {str(e)}"
 
-def convert_video_to_mp3(input_video_path, output_mp3_path):
-    # ... (código inalterado) ...
-    """Converte um arquivo de vídeo para MP3 usando ffmpeg, verificando antes se há áudio."""
+def _media_duration(input_path):
+    """Duração do arquivo em segundos (ffprobe), ou None se não for possível obtê-la."""
+    ffprobe = _find_ffprobe()
+    if not ffprobe: return None
+    try:
+        process = run_process([ffprobe, '-v', 'quiet', '-print_format', 'json', '-show_format', input_path], timeout=60)
+        return float(json.loads(process.stdout)["format"]["duration"])
+    except (ValueError, KeyError, TypeError, OSError):
+        return None
+
+def convert_video_to_mp3(input_video_path, output_mp3_path, progress_callback=None, should_cancel=None):
+    """
+    Converte um arquivo de vídeo para MP3 usando ffmpeg, verificando antes se há áudio.
+    `progress_callback(fração, mensagem)` recebe o andamento; `should_cancel()` interrompe o ffmpeg (ProcessCancelled).
+    """
     ffmpeg = _find_ffmpeg()
     if not ffmpeg:
         return False, "FFmpeg não encontrado."
@@ -101,11 +162,23 @@ def convert_video_to_mp3(input_video_path, output_mp3_path):
         return False, check_msg
     logging.info(f"Proceguindo com a conversão para MP3 para {input_video_path} ({check_msg})")
     command = [
-        ffmpeg, '-i', input_video_path, '-vn', '-acodec', 'libmp3lame', '-ab', '192k', '-ar', '44100', '-y', output_mp3_path
+        ffmpeg, '-i', input_video_path, '-vn', '-acodec', 'libmp3lame', '-ab', '192k', '-ar', '44100',
+        '-progress', 'pipe:1', '-nostats', '-y', output_mp3_path
     ]
     logging.info(f"Executando conversão video->mp3: {' '.join(command)}")
+    duration = _media_duration(input_video_path) if progress_callback else None
+    on_progress = None
+    if progress_callback and duration:
+        on_progress = lambda event: progress_callback(event["progress"], f"Convertendo: {int(event['seconds'])}s de {int(duration)}s")
     try:
-        process = subprocess.run(command, capture_output=True, check=False, text=True, timeout=300)
+        process = run_process(command, timeout=300, parser=FfmpegProgress(duration) if duration else None,
+                              on_progress=on_progress, should_cancel=should_cancel)
+        if process.timed_out:
+            logging.error("Conversão vídeo->MP3 excedeu o tempo limite.")
+            if os.path.exists(output_mp3_path):
+                 try: os.unlink(output_mp3_path)
+                 except OSError as e: logging.warning(f"Não foi possível remover arquivo de saída parcial (timeout) {output_mp3_path}: {e}")
+            return False, "Conversão excedeu o tempo limite."
         if process.returncode != 0:
             error_msg_detail = process.stderr
             error_msg_user = f"Erro no FFmpeg (código {process.returncode})."
@@ -127,12 +200,12 @@ def convert_video_to_mp3(input_video_path, output_mp3_path):
              return False, error_msg
         logging.info("Conversão vídeo->MP3 concluída com sucesso.")
         return True, "Conversão concluída com sucesso."
-    except subprocess.TimeoutExpired:
-        logging.error("Conversão vídeo->MP3 excedeu o tempo limite.")
+    except ProcessCancelled:
+        logging.info("Conversão vídeo->MP3 cancelada.")
         if os.path.exists(output_mp3_path):
              try: os.unlink(output_mp3_path)
-             except OSError as e: logging.warning(f"Não foi possível remover arquivo de saída parcial (timeout) {output_mp3_path}: {e}")
-        return False, "Conversão excedeu o tempo limite."
+             except OSError: pass
+        return False, "Conversão cancelada."
     except Exception as e:
         error_msg = f"Erro inesperado na conversão vídeo->MP3: {str(e)}"
         logging.exception(error_msg)
@@ -142,19 +215,349 @@ def convert_video_to_mp3(input_video_path, output_mp3_path):
         return False, "Ocorreu um erro inesperado durante o processamento."
 
 
-def transcribe_audio_file(input_audio_path, model):
-    """Transcreve um arquivo de áudio usando um modelo Whisper pré-carregado."""
+def stream_audio_windows(source, window_seconds=STREAM_WINDOW_SECONDS, should_cancel=None):
+    """
+    Decodifica `source` (caminho ou objeto file-like, enviado ao ffmpeg por pipe) em PCM mono 16 kHz e entrega
+    janelas float32 de `window_seconds`. Uma thread lê o ffmpeg e enche um buffer de STREAM_BUFFER_WINDOWS
+    janelas: a decodificação corre junto com a transcrição, e a memória não cresce com a duração do áudio.
+    """
+    from_pipe = not isinstance(source, (str, os.PathLike))
+    command = [
+        _find_ffmpeg(), *([] if from_pipe else ['-nostdin']), '-i', 'pipe:0' if from_pipe else source,
+        '-vn', '-f', 's16le', '-ac', '1', '-acodec', 'pcm_s16le', '-ar', str(WHISPER_SAMPLE_RATE), 'pipe:1'
+    ]
+    window_bytes = window_seconds * WHISPER_SAMPLE_RATE * 2
+    buffer = queue.Queue(maxsize=STREAM_BUFFER_WINDOWS)
+    stop = threading.Event()
+
+    def feed_stdin(process):
+        try:
+            while not stop.is_set():
+                data = source.read(STREAM_READ_SIZE)
+                if not data: break
+                process.stdin.write(data)
+        except (BrokenPipeError, ValueError):
+            pass  # o ffmpeg encerrou antes de ler tudo (erro ou cancelamento)
+        finally:
+            try: process.stdin.close()
+            except OSError: pass
+
+    def put(block):
+        while not stop.is_set():
+            try: buffer.put(block, timeout=0.5); return
+            except queue.Full: continue
+
+    def read_stdout(process):
+        pending = bytearray()
+        try:
+            while not stop.is_set():
+                data = process.stdout.read(STREAM_READ_SIZE)
+                if not data: break
+                pending += data
+                while len(pending) >= window_bytes:
+                    put(bytes(pending[:window_bytes])); del pending[:window_bytes]
+            if pending: put(bytes(pending[:len(pending) // 2 * 2]))
+        except (OSError, ValueError):
+            pass
+        finally:
+            put(None)
+
+    with streaming_process(command, stdin=subprocess.PIPE if from_pipe else subprocess.DEVNULL) as process:
+        threads = [threading.Thread(target=read_stdout, args=(process,), daemon=True)]
+        if from_pipe: threads.append(threading.Thread(target=feed_stdin, args=(process,), daemon=True))
+        for thread in threads: thread.start()
+        try:
+            while True:
+                if should_cancel and should_cancel(): raise ProcessCancelled()
+                try: block = buffer.get(timeout=1)
+                except queue.Empty: continue
+                if block is None: break
+                yield np.frombuffer(block, np.int16).astype(np.float32) / 32768.0
+            if process.wait() != 0:
+                raise RuntimeError(f"FFmpeg falhou ao decodificar o áudio: {''.join(process.stderr_tail)[-300:]}")
+        finally:
+            stop.set()  # a thread leitora desiste de esperar espaço no buffer
+
+
+def iter_transcribe_stream(model, source, progress_callback=None, should_cancel=None, duration=None):
+    """
+    Transcreve `source` janela a janela (stream_audio_windows), como o laço interno do Whisper: cada janela é
+    transcrita com o final do texto anterior como contexto; o áudio depois do último segmento completo é
+    levado para a janela seguinte, para não cortar palavras. Gera os segmentos {"start", "end", "text"}
+    (tempos globais, em segundos) assim que cada janela termina.
+    """
+    sample_rate = WHISPER_SAMPLE_RATE
+    pending = np.empty(0, np.float32); offset = 0.0; recent = []
+
+    def transcribe_pending(final):
+        nonlocal pending, offset
+        prompt = " ".join(recent[-3:]) or None
+        result = model.transcribe(pending, **WHISPER_DECODE_OPTIONS, initial_prompt=prompt, condition_on_previous_text=False)
+        pending_seconds = len(pending) / sample_rate
+        found = [seg for seg in result["segments"] if seg["text"].strip()]
+        # O último segmento pode ter sido cortado no fim da janela: vai de novo com o áudio seguinte
+        keep = found if final or pending_seconds >= STREAM_MAX_PENDING_SECONDS else found[:-1]
+        segments = [{"start": offset + seg["start"], "end": offset + seg["end"], "text": seg["text"].strip()} for seg in keep]
+        recent.extend(segment["text"] for segment in segments)
+        if not final:
+            cut_seconds = keep[-1]["end"] if keep else (0.0 if found else pending_seconds)
+            cut = min(len(pending), int(cut_seconds * sample_rate))
+            pending = pending[cut:]; offset += cut / sample_rate
+        return segments
+
+    for window in stream_audio_windows(source, should_cancel=should_cancel):
+        pending = np.concatenate([pending, window])
+        if len(pending) >= STREAM_WINDOW_SECONDS * sample_rate:
+            yield from transcribe_pending(final=False)
+            if progress_callback and duration:
+                progress_callback(min(1.0, offset / duration), f"Transcritos {int(offset)}s de {int(duration)}s")
+    if len(pending): yield from transcribe_pending(final=True)
+
+
+def transcribe_stream(model, source, progress_callback=None, should_cancel=None, duration=None):
+    """Como iter_transcribe_stream, mas espera o fim. Retorna (texto, segmentos)."""
+    segments = list(iter_transcribe_stream(model, source, progress_callback, should_cancel, duration))
+    return " ".join(segment["text"] for segment in segments), segments
+
+
+def transcribe_audio_file(input_audio_path, model, progress_callback=None, should_cancel=None):
+    """
+    Transcreve um arquivo de áudio (caminho ou objeto file-like) usando um modelo Whisper pré-carregado.
+    O áudio é decodificado em fluxo (transcribe_stream), sem carregar a gravação inteira na memória.
+    """
     if not model:
         return False, "Modelo Whisper não fornecido ou inválido.", ""
-    _find_ffprobe()
+    if not _find_ffmpeg():
+        return False, "FFmpeg não encontrado.", ""
 
-    logging.info(f"Iniciando transcrição com Whisper '{WHISPER_MODEL_NAME}': {input_audio_path}")
+    logging.info(f"Iniciando transcrição com Whisper '{WHISPER_MODEL_NAME}': {getattr(input_audio_path, 'name', input_audio_path)}")
     try:
-        result = model.transcribe(input_audio_path, language='pt', fp16=False)
-        transcribed_text = result["text"]
+        duration = _media_duration(input_audio_path) if progress_callback and isinstance(input_audio_path, str) else None
+        transcribed_text, _ = transcribe_stream(model, input_audio_path, progress_callback, should_cancel, duration)
         logging.info("Transcrição Whisper concluída com sucesso.")
         return True, "Transcrição concluída com sucesso.", transcribed_text
+    except ProcessCancelled:
+        raise
     except Exception as e:
         error_msg = f"Erro durante a transcrição com Whisper: {e}"
         logging.exception(error_msg)
         return False, "Ocorreu um erro durante a transcrição.", ""
+
+
+def _detect_silences(input_path, duration, progress_callback=None, should_cancel=None):
+    """Trechos de silêncio [(início, fim)] em segundos, pelo filtro `silencedetect` do ffmpeg."""
+    detector = SilenceDetector(duration)
+    command = [
+        _find_ffmpeg(), '-nostdin', '-i', input_path, '-vn', '-af',
+        f'silencedetect=noise={SILENCE_NOISE_DB}dB:d={SILENCE_MIN_SECONDS}',
+        '-f', 'null', '-progress', 'pipe:1', '-nostats', '-'
+    ]
+    on_progress = (lambda event: progress_callback(event["progress"])) if progress_callback else None
+    process = run_process(command, timeout=max(300, duration / 10), parser=detector, on_progress=on_progress, should_cancel=should_cancel)
+    if process.returncode != 0 or process.timed_out:
+        logging.warning(f"Detecção de silêncio falhou (código {process.returncode}); cortes serão feitos em tempos fixos.")
+        return []
+    return detector.silences
+
+
+def _plan_chunks(duration, silences, chunk_seconds=TRANSCRIBE_CHUNK_SECONDS):
+    """
+    Divide [0, duração] em trechos de ~`chunk_seconds`, cortando no meio do silêncio mais próximo do corte ideal
+    (ou no próprio corte ideal, se não houver silêncio por perto). Retorna [(início, fim)].
+    """
+    midpoints = sorted((start + end) / 2 for start, end in silences)
+    bounds = [0.0]
+    while duration - bounds[-1] > chunk_seconds * 1.5:
+        ideal = bounds[-1] + chunk_seconds
+        window = chunk_seconds * TRANSCRIBE_CUT_SEARCH_FRACTION
+        nearby = [mid for mid in midpoints if abs(mid - ideal) <= window]
+        bounds.append(min(nearby, key=lambda mid: abs(mid - ideal)) if nearby else ideal)
+    bounds.append(duration)
+    return list(zip(bounds[:-1], bounds[1:]))
+
+
+_chunk_model = None
+
+
+def _exit_on_sigterm(signum, frame):
+    raise SystemExit(1)
+
+
+def _chunk_worker_init(threads):
+    """Inicializador dos processos de transcrição: cada worker carrega o próprio modelo com `threads` threads do torch."""
+    global _chunk_model
+    import torch
+    # Pool.terminate() manda SIGTERM: sair via SystemExit deixa o run_process encerrar o ffmpeg em andamento
+    signal.signal(signal.SIGTERM, _exit_on_sigterm)
+    torch.set_num_threads(threads)
+    _chunk_model = load_whisper_weights()
+
+
+def _load_audio_window(input_path, start, end):
+    """
+    Decodifica só o trecho [início, fim] em PCM mono 16 kHz (float32, como o whisper.load_audio).
+    O PCM vai para um arquivo temporário: o run_process só guarda o fim da saída de texto.
+    """
+    with scratch_dir("trecho_audio", expected_bytes=int((end - start) * WHISPER_SAMPLE_RATE * 2)) as temp_dir:
+        pcm_path = os.path.join(temp_dir, "trecho.pcm")
+        command = [
+            _find_ffmpeg(), '-nostdin', '-y', '-ss', f'{start:.3f}', '-t', f'{end - start:.3f}', '-i', input_path,
+            '-f', 's16le', '-ac', '1', '-acodec', 'pcm_s16le', '-ar', str(WHISPER_SAMPLE_RATE), pcm_path
+        ]
+        process = run_process(command, timeout=300)
+        if process.timed_out or process.returncode != 0:
+            raise RuntimeError(f"FFmpeg falhou ao decodificar o trecho {start:.0f}s-{end:.0f}s: {process.stderr[-500:]}")
+        return np.fromfile(pcm_path, np.int16).astype(np.float32) / 32768.0
+
+
+def _transcribe_chunk(task):
+    """
+    Transcreve um trecho com margem de sobreposição e devolve (índice, segmentos) com tempos globais.
+    Só ficam os segmentos cujo ponto médio cai no trecho próprio [início, fim): a sobreposição não se repete.
+    """
+    index, input_path, start, end, duration = task
+    window_start = max(0.0, start - TRANSCRIBE_CHUNK_OVERLAP_SECONDS)
+    window_end = min(duration, end + TRANSCRIBE_CHUNK_OVERLAP_SECONDS)
+    audio = _load_audio_window(input_path, window_start, window_end)
+    result = _chunk_model.transcribe(audio, **WHISPER_DECODE_OPTIONS)
+    segments = []
+    for segment in result["segments"]:
+        seg_start, seg_end = window_start + segment["start"], window_start + segment["end"]
+        if start <= (seg_start + seg_end) / 2 < end and segment["text"].strip():
+            segments.append({"start": seg_start, "end": seg_end, "text": segment["text"].strip()})
+    return index, segments
+
+
+def iter_long_transcription(input_audio_path, duration, progress_callback=None, should_cancel=None, reserve_slots=None):
+    """
+    Transcrição de áudios longos: corta nos silêncios, transcreve os trechos em TRANSCRIBE_WORKERS processos
+    (cada um com seu modelo e sua parte dos núcleos) e junta os segmentos em ordem, com tempos globais.
+    Gera os segmentos em ordem, assim que todos os trechos anteriores ficam prontos.
+    `progress_callback(fração, mensagem)`; `should_cancel()` encerra os processos (ProcessCancelled).
+    `reserve_slots(n)` (JobContext.reserve_slots, na fila) reserva os núcleos dos processos no limite global de
+    tarefas e devolve quantos foram concedidos; os processos e threads são reduzidos para caber na concessão.
+    """
+    report = progress_callback or (lambda fraction, message: None)
+    report(0.02, "Procurando pausas no áudio para dividir a transcrição...")
+    silences = _detect_silences(input_audio_path, duration, lambda fraction: report(0.02 + 0.08 * fraction, "Procurando pausas no áudio..."), should_cancel)
+    chunks = _plan_chunks(duration, silences)
+    workers = min(TRANSCRIBE_WORKERS, len(chunks))
+    threads = max(1, available_cpus() // workers)
+    if reserve_slots is not None:
+        granted = reserve_slots(workers * threads)
+        workers = max(1, min(workers, granted // threads))
+        threads = max(1, min(threads, granted // workers))
+    logging.info(f"Transcrição longa: {duration:.0f}s em {len(chunks)} trechos, {workers} processo(s) x {threads} thread(s), {len(silences)} silêncios detectados.")
+    tasks = [(idx, input_audio_path, start, end, duration) for idx, (start, end) in enumerate(chunks)]
+    results = {}; done_seconds = 0.0; next_index = 0
+    # Pool (e não ProcessPoolExecutor) para poder encerrar os trechos em andamento no cancelamento.
+    # 'spawn' evita herdar, via fork, o estado multithread do servidor Streamlit
+    pool = multiprocessing.get_context("spawn").Pool(workers, initializer=_chunk_worker_init, initargs=(threads,))
+    try:
+        report(0.1, f"Transcrevendo {len(chunks)} trechos em paralelo...")
+        pending = pool.imap_unordered(_transcribe_chunk, tasks)
+        while len(results) < len(tasks):
+            try:
+                index, segments = pending.next(timeout=1)
+            except multiprocessing.TimeoutError:
+                if should_cancel and should_cancel(): raise ProcessCancelled()
+                continue
+            results[index] = segments
+            done_seconds += chunks[index][1] - chunks[index][0]
+            report(0.1 + 0.9 * done_seconds / duration, f"Transcritos {len(results)} de {len(chunks)} trechos")
+            while next_index in results:
+                yield from results[next_index]; next_index += 1
+    finally:
+        pool.terminate()
+        if reserve_slots is not None: reserve_slots(1)
+    logging.info("Transcrição longa concluída com sucesso.")
+
+
+def transcribe_long_audio(input_audio_path, duration, progress_callback=None, should_cancel=None):
+    """Como iter_long_transcription, mas espera o fim. Retorna (sucesso, mensagem, texto, segmentos)."""
+    segments = list(iter_long_transcription(input_audio_path, duration, progress_callback, should_cancel))
+    return True, "Transcrição concluída com sucesso.", " ".join(segment["text"] for segment in segments), segments
+
+
+def read_transcript_segments(path):
+    """Lê o arquivo de segmentos (JSON por linha) que a tarefa de transcrição grava enquanto transcreve."""
+    segments = []
+    if not os.path.exists(path): return segments
+    with open(path, "r", encoding="utf-8") as f:
+        for line in f:
+            try: segments.append(json.loads(line))
+            except json.JSONDecodeError: break  # última linha ainda sendo gravada
+    return segments
+
+
+def split_transcript_sections(segments, final, section_words=REFINE_SECTION_WORDS):
+    """
+    Agrupa segmentos em seções de ~`section_words` palavras (sempre na fronteira de um segmento) para o
+    refinamento por IA. Seções já fechadas nunca mudam quando chegam novos segmentos; a última, ainda
+    crescendo, só entra quando `final` é True. Retorna a lista de textos das seções.
+    """
+    sections, current, words = [], [], 0
+    for segment in segments:
+        current.append(segment["text"]); words += len(segment["text"].split())
+        if words >= section_words:
+            sections.append(" ".join(current)); current, words = [], 0
+    if final and current: sections.append(" ".join(current))
+    return sections
+
+
+def transcription_cache_key(source):
+    """Chave do cache de transcrições: conteúdo do áudio + modelo, quantização e opções de decodificação."""
+    return get_result_cache("transcription").make_key(
+        "transcription", source, model=WHISPER_MODEL_NAME, quantize=WHISPER_QUANTIZE, **WHISPER_DECODE_OPTIONS
+    )
+
+
+def refined_transcription_cache_key(transcription_key, llm_model):
+    """
+    Chave do texto refinado pela IA: a transcrição bruta de origem + modelo de linguagem + versão do prompt e
+    temperatura do refinamento + divisão em seções. Ajustar o prompt invalida os refinados antigos.
+    """
+    return get_result_cache("transcription").make_key(
+        "transcription_refined", transcription_key.encode("utf-8"), llm_model=llm_model, section_words=REFINE_SECTION_WORDS,
+        prompt=prompt_version(CORRECT_TRANSCRIPTION_SYSTEM_PROMPT, CORRECT_TRANSCRIPTION_INSTRUCTION),
+        temperature=CORRECT_TRANSCRIPTION_TEMPERATURE
+    )
+
+
+def run_transcription_job(params, ctx):
+    """
+    Tarefa da fila (modules.job_queue): transcreve o áudio de entrada com o modelo carregado no próprio worker.
+    Os segmentos são gravados em TRANSCRIPT_SEGMENTS_FILE à medida que saem, para a página exibi-los (e
+    refinar as seções prontas) antes do fim.
+    """
+    input_path = ctx.input_path(params["filename"])
+    cache = get_result_cache("transcription")
+    cache_key = params.get("cache_key") or transcription_cache_key(input_path)
+    if cache.get(cache_key, os.path.dirname(ctx.output_path("transcricao.txt"))):
+        return {"output": "transcricao.txt", "segments": TRANSCRIPT_SEGMENTS_FILE, "cache_key": cache_key,
+                "message": "Transcrição recuperada do cache."}
+    duration = _media_duration(input_path)
+    if duration and duration >= TRANSCRIBE_LONG_MIN_SECONDS and TRANSCRIBE_WORKERS > 1:
+        segments = iter_long_transcription(input_path, duration, ctx.report, ctx.cancel_requested, ctx.reserve_slots)
+    else:
+        ctx.report(0.05, f"Carregando modelo de transcrição ({WHISPER_MODEL_NAME})...")
+        model = load_whisper_model()
+        if model is None:
+            raise RuntimeError(f"Falha ao carregar o modelo Whisper ({WHISPER_MODEL_NAME}).")
+        if not _find_ffmpeg():
+            raise RuntimeError("FFmpeg não encontrado.")
+        ctx.report(0.1, "Transcrevendo áudio...")
+        segments = iter_transcribe_stream(
+            model, input_path, lambda fraction, msg: ctx.report(0.1 + 0.9 * fraction, msg), ctx.cancel_requested, duration
+        )
+    texts = []
+    with open(ctx.output_path(TRANSCRIPT_SEGMENTS_FILE), "w", encoding="utf-8") as f:
+        for segment in segments:
+            f.write(json.dumps(segment, ensure_ascii=False) + "\n"); f.flush()
+            texts.append(segment["text"])
+    with open(ctx.output_path("transcricao.txt"), "w", encoding="utf-8") as f:
+        f.write(" ".join(texts))
+    logging.info("Transcrição Whisper concluída com sucesso.")
+    cache.put(cache_key, [ctx.output_path("transcricao.txt"), ctx.output_path(TRANSCRIPT_SEGMENTS_FILE)], operation="transcription")
+    return {"output": "transcricao.txt", "segments": TRANSCRIPT_SEGMENTS_FILE, "cache_key": cache_key,
+            "message": "Transcrição concluída com sucesso."}
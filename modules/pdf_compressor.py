@@ -1,26 +1,19 @@
 import os
-import tempfile
 import subprocess
-import platform
 import shutil
 from PyPDF2 import PdfReader, PdfWriter
+from modules.capabilities import get_capabilities
+from modules.scratch import scratch_dir
 
 class PDFCompressor:
     def __init__(self):
-        # Determinar o caminho do Ghostscript com base no sistema operacional
-        self.gs_cmd = 'gswin64c' if platform.system() == 'Windows' else 'gs'
+        # Caminho do Ghostscript (gs / gswin64c) vem do registro de ferramentas do processo
+        self.capabilities = get_capabilities()
+        self.gs_cmd = self.capabilities.command("ghostscript") or 'gs'
     
     def is_ocrmypdf_installed(self):
         """Verifica se o OCRmyPDF está instalado e disponível no sistema."""
-        try:
-            result = subprocess.run(['ocrmypdf', '--version'], 
-                                stdout=subprocess.PIPE, 
-                                stderr=subprocess.PIPE, 
-                                text=True,
-                                timeout=5)
-            return True
-        except (subprocess.SubprocessError, FileNotFoundError, Exception):
-            return False
+        return self.capabilities.available("ocrmypdf")
     
     def compress_pdf(self, input_file_path, output_file_path, power=3):
         """
@@ -62,33 +55,30 @@ class PDFCompressor:
         :return: True se bem-sucedido, False caso contrário
         """
         try:
-            # Cria cópia temporária para processar
-            temp_input = input_path + ".tmp.pdf"
-            shutil.copy2(input_path, temp_input)
-            
-            # Configura argumentos do OCRmyPDF
-            args = [
-                'ocrmypdf',            # Comando
-                '--force-ocr',         # Força OCR em todas as páginas
-                '--optimize', '1',     # Otimizar pdf (usar 0-3)
-                '--output-type', 'pdf', # Saída como PDF
-                '--jobs', '2',         # Número de processadores a usar
-                '-l', language,        # Idioma
-                temp_input,            # Arquivo de entrada
-                output_path            # Arquivo de saída
-            ]
-            
-            # Executa OCRmyPDF
-            process = subprocess.run(
-                args,
-                stdout=subprocess.PIPE, 
-                stderr=subprocess.PIPE,
-                text=True
-            )
-            
-            # Limpa o arquivo temporário
-            if os.path.exists(temp_input):
-                os.unlink(temp_input)
+            # Cópia temporária para processar, no diretório de trabalho (removido ao final)
+            with scratch_dir("compressor_ocr", expected_bytes=os.path.getsize(input_path)) as work_dir:
+                temp_input = os.path.join(work_dir, "entrada_ocr.pdf")
+                shutil.copy2(input_path, temp_input)
+                
+                # Configura argumentos do OCRmyPDF
+                args = [
+                    'ocrmypdf',            # Comando
+                    '--force-ocr',         # Força OCR em todas as páginas
+                    '--optimize', '1',     # Otimizar pdf (usar 0-3)
+                    '--output-type', 'pdf', # Saída como PDF
+                    '--jobs', '2',         # Número de processadores a usar
+                    '-l', language,        # Idioma
+                    temp_input,            # Arquivo de entrada
+                    output_path            # Arquivo de saída
+                ]
+                
+                # Executa OCRmyPDF
+                process = subprocess.run(
+                    args,
+                    stdout=subprocess.PIPE, 
+                    stderr=subprocess.PIPE,
+                    text=True
+                )
                 
             if process.returncode != 0:
                 print(f"Erro no OCRmyPDF: {process.stderr}")
@@ -108,16 +98,16 @@ class PDFCompressor:
         :param apply_ocr: Se deve aplicar OCR
         :return: Tupla (sucesso, bytes do arquivo processado, tamanho original, tamanho final)
         """
-        # Cria arquivo temporário para entrada
-        with tempfile.NamedTemporaryFile(delete=False, suffix='.pdf') as temp_input:
-            temp_input.write(file_bytes)
-            input_path = temp_input.name
-        
-        # Caminhos para os arquivos de saída
-        compressed_path = input_path.replace('.pdf', '_comprimido.pdf')
-        final_output_path = input_path.replace('.pdf', '_final.pdf')
-        
-        try:
+        # Intermediários num diretório de trabalho (RAM quando couber), removido ao final
+        with scratch_dir("compressor", expected_bytes=len(file_bytes) * 3) as work_dir:
+            input_path = os.path.join(work_dir, "entrada.pdf")
+            with open(input_path, "wb") as temp_input:
+                temp_input.write(file_bytes)
+            
+            # Caminhos para os arquivos de saída
+            compressed_path = os.path.join(work_dir, "comprimido.pdf")
+            final_output_path = os.path.join(work_dir, "final.pdf")
+            
             original_size = len(file_bytes) / 1024 / 1024  # em MB
             
             # Etapa 1: Compressão
@@ -141,12 +131,3 @@ class PDFCompressor:
                 return (True, processed_bytes, original_size, final_size)
             else:
                 return (False, None, original_size, 0)
-        
-        finally:
-            # Limpeza dos arquivos temporários
-            for path in [input_path, compressed_path, final_output_path]:
-                if os.path.exists(path):
-                    try:
-                        os.unlink(path)
-                    except:
-                        pass
\ No newline at end of file
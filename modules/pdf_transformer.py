@@ -1,53 +1,423 @@
 import os
-import tempfile
 import fitz 
 from docx import Document
 from docx.shared import Inches
 import img2pdf
-from PIL import Image
+from PIL import Image, ImageOps
 import zipfile
 import io
-import subprocess
-import platform
 import shutil
 import logging
-from PyPDF2 import PdfReader, PdfWriter
+import threading
+import multiprocessing
+import pikepdf
+import hashlib
+import zlib
+from concurrent.futures import ThreadPoolExecutor, ProcessPoolExecutor
+from modules.result_cache import get_result_cache
+from modules.libreoffice_pool import get_libreoffice_pool
+from modules.capabilities import get_capabilities, available_cpus
+from modules.process_runner import run_process, ProcessCancelled, GhostscriptProgress, OcrmypdfProgress
+from modules.scratch import scratch_dir, get_scratch_space
 
 logging.basicConfig(level=logging.INFO)
 
-class PDFTransformer:
-    def __init__(self):
-        self.ocrmypdf_cmd = 'ocrmypdf'
-        self.ocrmypdf_installed = self._check_ocrmypdf_installed()
-        self.libreoffice_path = self._find_libreoffice()
-        self.gs_cmd = 'gswin64c' if platform.system() == 'Windows' else 'gs'
-        self.gs_available = self._check_gs_available()
-
-    def _check_ocrmypdf_installed(self):
+GS_TIMEOUT_SECONDS = 300
+GS_PARALLEL_MIN_PAGES = int(os.getenv("GS_PARALLEL_MIN_PAGES", "40"))
+GS_PARALLEL_MIN_PAGES_PER_RANGE = 10
+COPY_CHUNK_SIZE = 1024 * 1024
+# Modo "tamanho alvo": configurações do Ghostscript da melhor para a pior qualidade (nível, DPI das imagens)
+TARGET_SIZE_CANDIDATES = [
+    ("Impressão (300 DPI)", 2, 300), ("E-book (200 DPI)", 3, 200), ("E-book (150 DPI)", 3, 150),
+    ("E-book (120 DPI)", 3, 120), ("Tela (96 DPI)", 4, 96), ("Tela (72 DPI)", 4, 72),
+]
+TARGET_SAMPLE_PAGES = 8
+TARGET_SAFETY_MARGIN = 0.9  # a estimativa pela amostra precisa caber em 90% do alvo
+TARGET_FULL_TRIALS = 3  # no máximo, configurações testadas (uma por vez) no documento inteiro, a partir da melhor estimada
+RENDER_DEFAULT_DPI = 144
+RENDER_PARALLEL_MIN_PAGES = 8
+IMAGE_PARALLEL_MIN_CONVERSIONS = 4
+# Mecanismo de compressão: Ghostscript reescreve o PDF inteiro; "imagens" só recomprime as imagens embutidas
+COMPRESSION_ENGINE_AUTO = "auto"
+COMPRESSION_ENGINE_GS = "ghostscript"
+COMPRESSION_ENGINE_IMAGES = "imagens"
+IMAGE_ENGINE_MIN_SHARE = 0.7  # no modo auto, usa o mecanismo de imagens se elas forem ao menos 70% do arquivo
+# Nível de compressão -> (DPI máximo das imagens ou None, qualidade JPEG), equivalente aos PDFSETTINGS do gs
+IMAGE_RECOMPRESS_LEVELS = {0: (None, 90), 1: (300, 85), 2: (300, 80), 3: (150, 70), 4: (96, 50)}
+IMAGE_RECOMPRESS_MIN_BYTES = 16 * 1024  # imagens menores não compensam
+IMAGE_RECOMPRESS_DPI_TOLERANCE = 1.2  # só reduz se a resolução passar 20% do limite
+OCR_TIMEOUT_SECONDS = 300
+OCR_TEXT_MIN_CHARS = 20  # abaixo disso a página não tem camada de texto útil
+OCR_IMAGE_MIN_COVERAGE = 0.3
+OCR_MODE_AUTO = "auto"  # OCR só nas páginas sem texto (digitalizadas); as demais seguem intactas
+OCR_MODE_FULL = "full"  # refaz o OCR de todas as páginas (--force-ocr)
+
+
+def spool_to_file(source, dest_path):
+    """Grava `source` (caminho, objeto file-like ou bytes) em `dest_path` copiando em blocos, sem leitura integral."""
+    if isinstance(source, (bytes, bytearray, memoryview)):
+        with open(dest_path, "wb") as f: f.write(source)
+    elif isinstance(source, (str, os.PathLike)):
+        _copy_file(source, dest_path)
+    else:
+        if hasattr(source, "seek"): source.seek(0)
+        with open(dest_path, "wb") as f: shutil.copyfileobj(source, f, COPY_CHUNK_SIZE)
+    return dest_path
+
+
+def _source_size(source):
+    """Tamanho em bytes de `source` (caminho, bytes ou file-like com `size`/seek), ou 0 se desconhecido."""
+    if isinstance(source, (bytes, bytearray, memoryview)): return len(source)
+    if isinstance(source, (str, os.PathLike)): return os.path.getsize(source) if os.path.exists(source) else 0
+    if getattr(source, "size", None): return source.size
+    try:
+        position = source.tell(); source.seek(0, os.SEEK_END); size = source.tell(); source.seek(position); return size
+    except (AttributeError, OSError, ValueError):
+        return 0
+
+
+def _as_input_path(source, fallback_path):
+    """Retorna um caminho em disco para `source`, gravando-o em `fallback_path` apenas se ainda não for um arquivo."""
+    if isinstance(source, (str, os.PathLike)): return os.fspath(source)
+    return spool_to_file(source, fallback_path)
+
+
+def _as_readable(source):
+    """Adapta `source` para leitores que aceitam caminho ou stream (PIL, PyPDF2), sem copiar arquivos."""
+    if isinstance(source, (bytes, bytearray, memoryview)): return io.BytesIO(source)
+    if isinstance(source, (str, os.PathLike)): return os.fspath(source)
+    if hasattr(source, "seek"): source.seek(0)
+    return source
+
+
+def _copy_file(src, dst):
+    with open(src, "rb") as fsrc, open(dst, "wb") as fdst: shutil.copyfileobj(fsrc, fdst, COPY_CHUNK_SIZE)
+
+
+def _split_page_ranges(page_count, parts):
+    """Divide 1..page_count em `parts` faixas contíguas (1-indexadas, inclusivas) de tamanho equilibrado."""
+    parts = max(1, min(parts, page_count))
+    base, extra = divmod(page_count, parts)
+    ranges = []; first = 1
+    for idx in range(parts):
+        last = first + base + (1 if idx < extra else 0) - 1
+        ranges.append((first, last)); first = last + 1
+    return ranges
+
+def parse_page_ranges(spec, page_count):
+    """
+    Converte uma seleção como "1-3, 7, 10-" em índices de página 0-indexados, em ordem e sem repetição.
+    Seleção vazia significa todas as páginas. Lança ValueError se a seleção for inválida.
+    """
+    if not spec or not spec.strip(): return list(range(page_count))
+    selected = []; seen = set()
+    for part in spec.replace(";", ",").split(","):
+        part = part.strip()
+        if not part: continue
+        first, sep, last = part.partition("-")
         try:
-            subprocess.run([self.ocrmypdf_cmd, '--version'],
-                           stdout=subprocess.PIPE, stderr=subprocess.PIPE,
-                           check=True, text=True, timeout=5)
-            logging.info("OCRmyPDF detectado.")
-            return True
-        except (subprocess.SubprocessError, FileNotFoundError, Exception) as e:
-            logging.warning(f"OCRmyPDF não detectado ou erro ao verificar: {e}")
-            return False
+            first = int(first) if first.strip() else 1
+            last = (int(last) if last.strip() else page_count) if sep else first
+        except ValueError: raise ValueError(f"Intervalo de páginas inválido: '{part}'")
+        if first < 1 or last > page_count or first > last:
+            raise ValueError(f"Intervalo '{part}' fora do documento (1-{page_count}).")
+        for page_num in range(first - 1, last):
+            if page_num not in seen: seen.add(page_num); selected.append(page_num)
+    if not selected: raise ValueError("Nenhuma página selecionada.")
+    return selected
+
+
+_render_doc = None  # só nos processos de renderização (spawn); nunca no processo do Streamlit, onde as sessões são threads
+
+
+def _render_worker_init(pdf_path):
+    """Inicializador dos processos de renderização: cada worker abre o próprio documento uma única vez."""
+    global _render_doc
+    _render_doc = fitz.open(pdf_path)
+
+
+def _render_page_from(doc, page_num, dpi, image_format):
+    pix = doc.load_page(page_num).get_pixmap(dpi=dpi, alpha=False)
+    return pix.tobytes(image_format)
+
+
+def _render_page(page_num, dpi, image_format):
+    return _render_page_from(_render_doc, page_num, dpi, image_format)
+
+
+def _image_embeds_directly(image_path):
+    """
+    True se o img2pdf pode embutir o arquivo sem decodificá-lo: JPEG (copiado byte a byte) e PNG sem canal alfa.
+    Lê apenas o cabeçalho. Lança exceção se o arquivo não for uma imagem reconhecível.
+    """
+    with Image.open(image_path) as img:
+        if img.format in ('JPEG', 'MPO'): return img.mode in ('L', 'RGB', 'CMYK')
+        if img.format == 'PNG': return img.mode in ('1', 'L', 'RGB', 'P') and 'transparency' not in img.info
+        return False
+
+
+def _convert_image_for_pdf(src_path, dst_path):
+    """
+    Converte uma imagem que o img2pdf não embute direto (alfa, modos exóticos) em PNG RGB, sem perdas.
+    Áreas transparentes ficam brancas. Retorna `dst_path`, ou None se a imagem não pôde ser convertida.
+    """
+    try:
+        with Image.open(src_path) as img:
+            img = ImageOps.exif_transpose(img)
+            if img.mode in ('RGBA', 'LA', 'PA') or (img.mode == 'P' and 'transparency' in img.info):
+                rgba = img.convert('RGBA'); img = Image.new('RGB', rgba.size, (255, 255, 255)); img.paste(rgba, mask=rgba.getchannel('A'))
+            elif img.mode not in ('1', 'L', 'RGB'):
+                img = img.convert('RGB')
+            img.save(dst_path, format='PNG')
+        return dst_path
+    except Exception as e:
+        logging.warning(f"Skip image that could not be converted ({os.path.basename(src_path)}): {e}"); return None
+
+
+def _rects_coverage(rects, page_rect):
+    """Fração da página coberta pelos retângulos (soma das áreas recortadas à página, limitada a 1)."""
+    page_area = abs(page_rect) or 1
+    return min(1.0, sum(abs(fitz.Rect(rect) & page_rect) for rect in rects) / page_area)
+
+
+def classify_pdf_pages(pdf_path):
+    """
+    Classifica cada página pela camada de texto, cobertura de imagens e fontes usadas.
+    `kind` é 'text' (texto nativo ou OCR já existente), 'scan' (só imagem: precisa de OCR) ou 'empty'.
+    """
+    pages = []
+    with fitz.open(pdf_path) as doc:
+        for page in doc:
+            text_blocks = [block for block in page.get_text("blocks") if block[6] == 0 and block[4].strip()]
+            text_chars = sum(len(block[4].strip()) for block in text_blocks)
+            image_coverage = _rects_coverage([info["bbox"] for info in page.get_image_info()], page.rect)
+            font_count = len(page.get_fonts())
+            if text_chars >= OCR_TEXT_MIN_CHARS: kind = "text"
+            elif image_coverage >= OCR_IMAGE_MIN_COVERAGE: kind = "scan"
+            elif text_chars or font_count: kind = "text"
+            else: kind = "empty"
+            pages.append({
+                "page": page.number + 1, "kind": kind, "text_chars": text_chars, "fonts": font_count,
+                "text_coverage": _rects_coverage([block[:4] for block in text_blocks], page.rect),
+                "image_coverage": image_coverage,
+            })
+    return pages
+
 
-    def _apply_ocrmypdf(self, input_path, output_path, language='por'):
+def _format_page_list(page_numbers):
+    """[1, 2, 3, 7] -> '1-3,7' (formato do --pages do OCRmyPDF)."""
+    ranges = []
+    for page_num in page_numbers:
+        if ranges and ranges[-1][1] == page_num - 1: ranges[-1][1] = page_num
+        else: ranges.append([page_num, page_num])
+    return ",".join(f"{first}-{last}" if first != last else str(first) for first, last in ranges)
+
+
+def _object_signature(obj, memo):
+    """Assinatura de conteúdo de um objeto PDF (fluxos pelo hash dos bytes brutos), independente do número do objeto."""
+    if isinstance(obj, (pikepdf.Stream, pikepdf.Dictionary, pikepdf.Array)):
+        objgen = obj.objgen if obj.is_indirect else None
+        if objgen in memo: return memo[objgen]
+        if objgen: memo[objgen] = f"ref{objgen}"  # evita recursão infinita em referências cíclicas
+        digest = hashlib.sha256()
+        if isinstance(obj, pikepdf.Array):
+            digest.update(b"A")
+            for item in obj: digest.update(_object_signature(item, memo).encode())
+        else:
+            if isinstance(obj, pikepdf.Stream): digest.update(b"S"); digest.update(obj.read_raw_bytes())
+            for key in sorted(obj.keys()):
+                if key == "/Length": continue
+                digest.update(key.encode()); digest.update(_object_signature(obj[key], memo).encode())
+        signature = digest.hexdigest()
+        if objgen: memo[objgen] = signature
+        return signature
+    return repr(obj)
+
+
+def _dedupe_shared_streams(pdf):
+    """
+    Faz fontes embutidas e imagens com conteúdo idêntico (comuns ao juntar documentos do mesmo modelo) apontarem
+    para um único objeto. As cópias deixam de ser referenciadas e não são gravadas. Retorna quantas foram unificadas.
+    """
+    canonical = {}; memo = {}; visited = set(); replaced = 0
+
+    def unify(parent, key):
+        nonlocal replaced
+        stream = parent[key]
+        if not isinstance(stream, pikepdf.Stream) or not stream.is_indirect: return
+        first = canonical.setdefault(_object_signature(stream, memo), stream)
+        if first.objgen != stream.objgen: parent[key] = first; replaced += 1
+
+    def walk_resources(resources):
+        if not isinstance(resources, pikepdf.Dictionary): return
+        if resources.is_indirect:
+            if resources.objgen in visited: return
+            visited.add(resources.objgen)
+        fonts = resources.get("/Font")
+        if isinstance(fonts, pikepdf.Dictionary):
+            for font in list(fonts.values()):
+                descriptors = [font.get("/FontDescriptor")] + [desc.get("/FontDescriptor") for desc in font.get("/DescendantFonts", [])]
+                for descriptor in descriptors:
+                    if not isinstance(descriptor, pikepdf.Dictionary): continue
+                    for file_key in ("/FontFile", "/FontFile2", "/FontFile3"):
+                        if file_key in descriptor: unify(descriptor, file_key)
+        xobjects = resources.get("/XObject")
+        if isinstance(xobjects, pikepdf.Dictionary):
+            for name in list(xobjects.keys()):
+                xobject = xobjects[name]
+                if not isinstance(xobject, pikepdf.Stream): continue
+                if xobject.get("/Subtype") == "/Image": unify(xobjects, name)
+                elif xobject.get("/Subtype") == "/Form": walk_resources(xobject.get("/Resources"))
+
+    for page in pdf.pages: walk_resources(page.obj.get("/Resources"))
+    return replaced
+
+
+def image_bytes_share(pdf_path):
+    """Fração do arquivo ocupada por fluxos de imagem (tamanho comprimido). PDFs digitalizados ficam perto de 1."""
+    with fitz.open(pdf_path) as doc:
+        image_bytes = 0
+        for xref in range(1, doc.xref_length()):
+            if doc.xref_get_key(xref, "Subtype") != ('name', '/Image'): continue
+            kind, length = doc.xref_get_key(xref, "Length")
+            if kind == 'int': image_bytes += int(length)
+    return image_bytes / max(1, os.path.getsize(pdf_path))
+
+
+def _image_placements_dpi(pdf_path):
+    """{xref: maior resolução efetiva (DPI) com que a imagem aparece em alguma página}, inclusive dentro de Form XObjects."""
+    placements = {}
+    with fitz.open(pdf_path) as doc:
+        for page in doc:
+            for info in page.get_image_info(xrefs=True):
+                bbox = fitz.Rect(info["bbox"])
+                if not info.get("xref") or bbox.is_empty: continue
+                dpi = max(info["width"] * 72 / bbox.width, info["height"] * 72 / bbox.height)
+                placements[info["xref"]] = max(dpi, placements.get(info["xref"], 0))
+    return placements
+
+
+_recompress_pdf = None
+
+
+def _recompress_worker_init(pdf_path):
+    """Inicializador dos processos de recompressão: cada worker abre o próprio documento uma única vez."""
+    global _recompress_pdf
+    _recompress_pdf = pikepdf.open(pdf_path)
+
+
+def _recompress_worker_close():
+    global _recompress_pdf
+    if _recompress_pdf is not None: _recompress_pdf.close(); _recompress_pdf = None
+
+
+def _recompress_image(objnum, scale, jpeg_quality):
+    """
+    Decodifica a imagem `objnum`, reduz pelo fator `scale` e recodifica: JPEG para cinza/cor, Flate para P&B
+    (1 bit). Retorna (objnum, dados, largura, altura, modo, filtro) ou None se a imagem não é suportada ou não diminuiu.
+    """
+    try:
+        obj = _recompress_pdf.get_object(objnum, 0)
+        if obj.get('/Subtype') != pikepdf.Name.Image or obj.get('/ImageMask', False) or '/Decode' in obj: return None
+        already_jpeg = obj.get('/Filter') in (pikepdf.Name.DCTDecode, pikepdf.Array([pikepdf.Name.DCTDecode]))
+        if already_jpeg and scale >= 1: return None  # recomprimir JPEG sem reduzir só perde qualidade
+        img = pikepdf.PdfImage(obj).as_pil_image()
+        if img.mode == 'P': img = img.convert('RGB')
+        if img.mode not in ('1', 'L', 'RGB'): return None  # CMYK, Lab, 16 bits...: fica como está
+        if scale < 1:
+            size = (max(1, round(img.width * scale)), max(1, round(img.height * scale)))
+            if img.mode == '1': img = img.convert('L').resize(size, Image.LANCZOS).point(lambda v: 255 if v >= 128 else 0).convert('1')
+            else: img = img.resize(size, Image.LANCZOS)
+        if img.mode == '1':
+            # Sem codificador JBIG2 disponível: linhas de 1 bit empacotadas (mesmo layout do PDF) + Flate
+            data, pdf_filter = zlib.compress(img.tobytes(), 9), '/FlateDecode'
+        else:
+            buffer = io.BytesIO(); img.save(buffer, format='JPEG', quality=jpeg_quality, optimize=True)
+            data, pdf_filter = buffer.getvalue(), '/DCTDecode'
+        if len(data) >= len(obj.read_raw_bytes()): return None
+        return objnum, data, img.width, img.height, img.mode, pdf_filter
+    except Exception as e:
+        logging.debug(f"Image {objnum} kept as-is: {e}"); return None
+
+
+class PDFTransformer:
+    def __init__(self, progress_callback=None, should_cancel=None):
+        """
+        `progress_callback(fração, mensagem)` recebe o andamento de Ghostscript/OCRmyPDF; `should_cancel()`, se
+        retornar True, interrompe a ferramenta externa em execução (ProcessCancelled).
+        """
+        # Barato: a detecção de Ghostscript/OCRmyPDF/LibreOffice fica no registro do processo (modules.capabilities)
+        self.capabilities = get_capabilities()
+        self.result_cache = get_result_cache("pdf")
+        self.progress_callback = progress_callback
+        self.should_cancel = should_cancel
+        self.last_compression_info = None
+
+    def _report(self, fraction, message):
+        if self.progress_callback: self.progress_callback(fraction, message)
+
+    @property
+    def ocrmypdf_cmd(self): return self.capabilities.command("ocrmypdf") or 'ocrmypdf'
+
+    @property
+    def ocrmypdf_installed(self): return self.capabilities.available("ocrmypdf")
+
+    @property
+    def libreoffice_path(self): return self.capabilities.command("libreoffice")
+
+    @property
+    def gs_cmd(self): return self.capabilities.command("ghostscript") or 'gs'
+
+    @property
+    def gs_available(self): return self.capabilities.available("ghostscript")
+
+    def _apply_ocrmypdf(self, input_path, output_path, language='por', ocr_mode=OCR_MODE_AUTO):
          if not self.ocrmypdf_installed:
              logging.error("Tentativa de usar OCRmyPDF, mas não está instalado.")
              return False
-         with tempfile.TemporaryDirectory() as temp_ocr_dir:
+         tesseract_languages = self.capabilities.tesseract_languages()
+         missing_languages = [lang for lang in language.split('+') if tesseract_languages and lang not in tesseract_languages]
+         if missing_languages:
+             logging.error(f"Idioma(s) do Tesseract não instalado(s): {', '.join(missing_languages)}.")
+             return False
+         page_args = ['--force-ocr']; ocr_page_count = None
+         if ocr_mode == OCR_MODE_AUTO:
+             try:
+                 pages = classify_pdf_pages(input_path)
+             except Exception as e:
+                 logging.warning(f"Falha ao classificar páginas ({e}). Aplicando OCR em todas."); pages = None
+             if pages is not None:
+                 scan_pages = [page["page"] for page in pages if page["kind"] == "scan"]
+                 logging.info(f"OCR seletivo: {len(scan_pages)} de {len(pages)} página(s) sem camada de texto.")
+                 if not scan_pages:
+                     shutil.copyfile(input_path, output_path)
+                     logging.info("Nenhuma página precisa de OCR; arquivo mantido sem alterações.")
+                     return True
+                 # --skip-text preserva as páginas que já têm texto; --pages limita a rasterização às digitalizadas
+                 page_args = ['--skip-text'] + (['--pages', _format_page_list(scan_pages)] if len(scan_pages) < len(pages) else [])
+                 ocr_page_count = len(scan_pages)
+         if ocr_page_count is None:
+             try:
+                 with fitz.open(input_path) as doc: ocr_page_count = doc.page_count
+             except Exception: ocr_page_count = 0
+         with scratch_dir("ocr", expected_bytes=_source_size(input_path) * 3) as temp_ocr_dir:
              temp_input = os.path.join(temp_ocr_dir, "input_ocr.pdf")
              shutil.copy2(input_path, temp_input)
              temp_output = os.path.join(temp_ocr_dir, "output_ocr.pdf")
              args = [
-                 self.ocrmypdf_cmd, '--force-ocr', '--optimize', '1', '--output-type', 'pdf',
-                 '--jobs', '2', '-l', language, temp_input, temp_output
+                 self.ocrmypdf_cmd, *page_args, '--optimize', '1', '--output-type', 'pdf',
+                 '--jobs', str(available_cpus()), '-l', language, temp_input, temp_output
              ]
+             if self.progress_callback and ocr_page_count: args[1:1] = ['-v', '1']  # log por página, usado no progresso
              try:
-                 process = subprocess.run(args, capture_output=True, text=True, check=False, timeout=300)
+                 process = run_process(
+                     args, timeout=OCR_TIMEOUT_SECONDS, should_cancel=self.should_cancel,
+                     parser=OcrmypdfProgress(ocr_page_count) if ocr_page_count else None,
+                     on_progress=lambda event: self._report(event["pages_done"] / event["total"], f"OCR: página {event['pages_done']} de {event['total']}")
+                 )
+                 if process.timed_out:
+                     logging.error("OCRmyPDF excedeu o tempo limite.")
+                     return False
                  if process.returncode != 0:
                      logging.error(f"Erro no OCRmyPDF (código {process.returncode}):")
                      logging.error(f"Stderr: {process.stderr}")
@@ -60,115 +430,379 @@ class PDFTransformer:
                  else:
                      logging.error("OCRmyPDF terminou sem erros, mas o arquivo de saída não foi encontrado.")
                      return False
-             except subprocess.TimeoutExpired:
-                  logging.error("OCRmyPDF excedeu o tempo limite.")
-                  return False
+             except ProcessCancelled:
+                  raise
              except Exception as e:
                   logging.error(f"Erro ao executar OCRmyPDF: {str(e)}")
                   return False
 
-    def _find_libreoffice(self):
-        for cmd in ['soffice', 'libreoffice']:
-            try:
-                subprocess.run([cmd, '--version'], check=True, stdout=subprocess.PIPE, stderr=subprocess.PIPE, timeout=5)
-                logging.info(f"LibreOffice detectado usando o comando: '{cmd}'")
-                return cmd
-            except (FileNotFoundError, subprocess.CalledProcessError, subprocess.TimeoutExpired):
-                continue
-        logging.warning("Comando do LibreOffice ('soffice' ou 'libreoffice') não encontrado no PATH.")
-        return None
-
-    def _check_gs_available(self):
-        try:
-            subprocess.run([self.gs_cmd, '--version'],
-                           stdout=subprocess.PIPE, stderr=subprocess.PIPE,
-                           check=True, text=True, timeout=5)
-            logging.info(f"Ghostscript detectado usando o comando: '{self.gs_cmd}'")
-            return True
-        except (subprocess.SubprocessError, FileNotFoundError, Exception) as e:
-            logging.warning(f"Ghostscript ({self.gs_cmd}) não detectado ou erro: {e}")
-            return False
-
-    def _compress_pdf_gs(self, input_file_path, output_file_path, power=3):
-        if not self.gs_available:
-            logging.error("Ghostscript não está disponível. Não é possível comprimir.")
-            return False
+    def _gs_command(self, input_file_path, output_file_path, power, first_page=None, last_page=None, image_dpi=None):
         quality = {0: '/default', 1: '/prepress', 2: '/printer', 3: '/ebook', 4: '/screen'}
         power = max(0, min(4, power))
         command = [
             self.gs_cmd, '-sDEVICE=pdfwrite', '-dCompatibilityLevel=1.4',
-            f'-dPDFSETTINGS={quality[power]}', '-dNOPAUSE', '-dQUIET', '-dBATCH',
-            f'-sOutputFile={output_file_path}', input_file_path
+            f'-dPDFSETTINGS={quality[power]}', '-dNOPAUSE', '-dBATCH',  # sem -dQUIET: "Page N" alimenta o progresso
         ]
+        if image_dpi:
+            command += [
+                '-dDownsampleColorImages=true', '-dDownsampleGrayImages=true', '-dDownsampleMonoImages=true',
+                '-dColorImageDownsampleType=/Bicubic', '-dGrayImageDownsampleType=/Bicubic',
+                f'-dColorImageResolution={image_dpi}', f'-dGrayImageResolution={image_dpi}',
+                f'-dMonoImageResolution={max(image_dpi * 2, 300)}',  # texto digitalizado em P&B precisa de mais resolução
+            ]
+        if first_page is not None: command += [f'-dFirstPage={first_page}', f'-dLastPage={last_page}']
+        return command + [f'-sOutputFile={output_file_path}', input_file_path]
+
+    def _run_gs(self, command, output_file_path, on_progress=None):
         logging.info(f"Executando compressão Ghostscript: {' '.join(command)}")
         try:
-            process = subprocess.run(command, capture_output=True, check=False, text=True, timeout=300)
+            process = run_process(command, timeout=GS_TIMEOUT_SECONDS, parser=GhostscriptProgress(),
+                                  on_progress=on_progress, should_cancel=self.should_cancel)
+            if process.timed_out:
+                 logging.error("Compressão com Ghostscript excedeu o tempo limite.")
+                 if os.path.exists(output_file_path): os.unlink(output_file_path)
+                 return False
             if process.returncode != 0:
                  logging.error(f"Erro no Ghostscript (código {process.returncode}):\nStderr: {process.stderr}\nStdout: {process.stdout}")
                  if os.path.exists(output_file_path): os.unlink(output_file_path)
                  return False
             if os.path.exists(output_file_path) and os.path.getsize(output_file_path) > 0:
-                logging.info("Compressão com Ghostscript concluída com sucesso.")
                 return True
             else:
                 logging.error("Ghostscript finalizou sem erro, mas o arquivo de saída não foi criado ou está vazio.")
                 return False
-        except subprocess.TimeoutExpired:
-             logging.error("Compressão com Ghostscript excedeu o tempo limite.")
-             if os.path.exists(output_file_path): os.unlink(output_file_path)
-             return False
+        except ProcessCancelled:
+            if os.path.exists(output_file_path): os.unlink(output_file_path)
+            raise
         except Exception as e:
             logging.error(f"Erro inesperado ao executar Ghostscript: {str(e)}")
             if os.path.exists(output_file_path): os.unlink(output_file_path)
             return False
 
-    def process_compression_ocr(self, file_bytes, compression_level=3, apply_ocr=False, ocr_language='por'):
-        original_size_mb = len(file_bytes) / 1024 / 1024
-        processed_bytes = None; final_size_mb = 0; success = False
-        with tempfile.TemporaryDirectory() as temp_dir:
-            input_path = os.path.join(temp_dir, "input.pdf")
-            with open(input_path, "wb") as f: f.write(file_bytes)
-            current_step_output = input_path; step_successful = True
-            if compression_level >= 0:
-                logging.info(f"Iniciando Etapa de Compressão (Nível {compression_level})...")
+    def _compress_pdf_gs(self, input_file_path, output_file_path, power=3, parallel=None, image_dpi=None):
+        """
+        Comprime o PDF com Ghostscript. Com `parallel=None` o modo é escolhido automaticamente:
+        documentos com pelo menos GS_PARALLEL_MIN_PAGES páginas são divididos em faixas de páginas
+        comprimidas em processos `gs` simultâneos. `image_dpi` limita a resolução das imagens.
+        """
+        if not self.gs_available:
+            logging.error("Ghostscript não está disponível. Não é possível comprimir.")
+            return False
+        page_count = 0
+        try:
+            with fitz.open(input_file_path) as doc: page_count = doc.page_count
+        except Exception as e:
+            logging.warning(f"Não foi possível contar as páginas para compressão paralela: {e}")
+        workers = min(available_cpus(), page_count // GS_PARALLEL_MIN_PAGES_PER_RANGE)
+        if parallel is None: parallel = page_count >= GS_PARALLEL_MIN_PAGES
+        if parallel and workers > 1:
+            if self._compress_pdf_gs_parallel(input_file_path, output_file_path, power, page_count, workers, image_dpi):
+                logging.info("Compressão paralela com Ghostscript concluída com sucesso.")
+                return True
+            logging.warning("Compressão paralela falhou. Repetindo em processo único.")
+        on_progress = lambda event: self._report(
+            (event["page"] - event["first"] + 1) / (event["last"] - event["first"] + 1),
+            f"Comprimindo: página {event['page']} de {event['last']}"
+        )
+        if self._run_gs(self._gs_command(input_file_path, output_file_path, power, image_dpi=image_dpi), output_file_path, on_progress):
+            logging.info("Compressão com Ghostscript concluída com sucesso.")
+            return True
+        return False
+
+    def _compress_pdf_gs_parallel(self, input_file_path, output_file_path, power, page_count, workers, image_dpi=None):
+        """Comprime faixas de páginas em processos `gs` paralelos e remonta o PDF na ordem original."""
+        ranges = _split_page_ranges(page_count, workers)
+        logging.info(f"Compressão paralela: {page_count} páginas em {len(ranges)} faixas ({workers} processos).")
+        with scratch_dir("gs_faixas", expected_bytes=_source_size(input_file_path) * 2) as parts_dir:
+            part_paths = [os.path.join(parts_dir, f"parte_{idx:03d}.pdf") for idx in range(len(ranges))]
+            pages_done = [0] * len(ranges); progress_lock = threading.Lock()
+
+            def on_progress(idx, event):
+                with progress_lock:
+                    pages_done[idx] = event["page"] - event["first"] + 1; done = sum(pages_done)
+                self._report(done / page_count, f"Comprimindo: {done} de {page_count} páginas")
+
+            with ThreadPoolExecutor(max_workers=workers) as executor:
+                results = list(executor.map(
+                    lambda idx: self._run_gs(
+                        self._gs_command(input_file_path, part_paths[idx], power, *ranges[idx], image_dpi=image_dpi), part_paths[idx],
+                        lambda event: on_progress(idx, event)
+                    ),
+                    range(len(ranges))
+                ))
+            if not all(results): return False
+            try:
+                with fitz.open() as merged, fitz.open(input_file_path) as original:
+                    for part_path in part_paths:
+                        with fitz.open(part_path) as part: merged.insert_pdf(part)
+                    if merged.page_count != page_count:
+                        logging.error(f"Remontagem incompleta: {merged.page_count} de {page_count} páginas.")
+                        return False
+                    merged.set_metadata(original.metadata or {})
+                    toc = original.get_toc(simple=False)
+                    if toc: merged.set_toc(toc)
+                    # garbage=4 funde objetos idênticos (fontes e imagens repetidas entre as faixas)
+                    merged.save(output_file_path, garbage=4, deflate=True)
+            except Exception as e:
+                logging.error(f"Erro ao remontar as partes comprimidas: {e}")
+                if os.path.exists(output_file_path): os.unlink(output_file_path)
+                return False
+        return os.path.exists(output_file_path) and os.path.getsize(output_file_path) > 0
+
+    def _compress_pdf_images(self, input_file_path, output_file_path, power=3):
+        """
+        Compressão sem Ghostscript: reduz as imagens acima do DPI do nível e as recodifica (JPEG; Flate para P&B) em
+        processos paralelos, trocando-as no lugar. Fluxos de conteúdo e fontes não são tocados, o que é bem mais rápido
+        que o `gs` em documentos digitalizados.
+        """
+        max_dpi, jpeg_quality = IMAGE_RECOMPRESS_LEVELS[max(0, min(4, power))]
+        try:
+            placements = _image_placements_dpi(input_file_path)
+        except Exception as e:
+            logging.error(f"Não foi possível analisar as imagens do PDF: {e}"); return False
+        tasks = []
+        with fitz.open(input_file_path) as doc:
+            for xref, dpi in placements.items():
+                kind, length = doc.xref_get_key(xref, "Length")
+                if kind != 'int' or int(length) < IMAGE_RECOMPRESS_MIN_BYTES: continue
+                scale = max_dpi / dpi if max_dpi and dpi > max_dpi * IMAGE_RECOMPRESS_DPI_TOLERANCE else 1.0
+                tasks.append((xref, scale))
+        logging.info(f"Recompressão de imagens: {len(tasks)} de {len(placements)} imagem(ns) (DPI máx. {max_dpi}, JPEG {jpeg_quality}).")
+        workers = min(available_cpus(), len(tasks) // IMAGE_PARALLEL_MIN_CONVERSIONS)
+        executor = doc = None
+        try:
+            if workers > 1:
+                # 'spawn' evita herdar, via fork, o estado multithread do servidor Streamlit
+                executor = ProcessPoolExecutor(max_workers=workers, mp_context=multiprocessing.get_context("spawn"),
+                                               initializer=_recompress_worker_init, initargs=(input_file_path,))
+                results = executor.map(_recompress_image, *zip(*tasks), [jpeg_quality] * len(tasks),
+                                       chunksize=max(1, len(tasks) // (workers * 4)))
+            else:
+                _recompress_worker_init(input_file_path)
+                results = (_recompress_image(xref, scale, jpeg_quality) for xref, scale in tasks)
+            replaced = 0
+            with pikepdf.open(input_file_path) as pdf:
+                for done, result in enumerate(results, start=1):
+                    if self.should_cancel and self.should_cancel(): raise ProcessCancelled()
+                    self._report(done / len(tasks), f"Comprimindo imagens: {done} de {len(tasks)}")
+                    if result is None: continue
+                    objnum, data, width, height, mode, pdf_filter = result
+                    obj = pdf.get_object(objnum, 0)
+                    obj.write(data, filter=pikepdf.Name(pdf_filter))
+                    if '/DecodeParms' in obj: del obj.DecodeParms
+                    obj.Width, obj.Height, obj.BitsPerComponent = width, height, 1 if mode == '1' else 8
+                    color_space = obj.get('/ColorSpace')
+                    keep_icc = isinstance(color_space, pikepdf.Array) and color_space[0] == pikepdf.Name.ICCBased \
+                        and int(color_space[1].get('/N', 0)) == len(mode) and mode != '1'
+                    if not keep_icc: obj.ColorSpace = pikepdf.Name.DeviceRGB if mode == 'RGB' else pikepdf.Name.DeviceGray
+                    replaced += 1
+                pdf.save(output_file_path, object_stream_mode=pikepdf.ObjectStreamMode.generate, recompress_flate=False)
+            logging.info(f"Recompressão de imagens concluída: {replaced} imagem(ns) substituída(s).")
+            return True
+        except ProcessCancelled: raise
+        except Exception as e:
+            logging.error(f"Erro na recompressão de imagens: {e}", exc_info=True); return False
+        finally:
+            if executor: executor.shutdown(cancel_futures=True)
+            else: _recompress_worker_close()
+
+    def _choose_compression_engine(self, input_file_path, engine):
+        if engine != COMPRESSION_ENGINE_AUTO: return engine
+        if not self.gs_available: return COMPRESSION_ENGINE_IMAGES
+        try:
+            share = image_bytes_share(input_file_path)
+        except Exception as e:
+            logging.warning(f"Não foi possível medir a fração de imagens do PDF: {e}"); return COMPRESSION_ENGINE_GS
+        logging.info(f"Imagens ocupam {share:.0%} do arquivo.")
+        return COMPRESSION_ENGINE_IMAGES if share >= IMAGE_ENGINE_MIN_SHARE else COMPRESSION_ENGINE_GS
+
+    def _run_gs_trials(self, input_file_path, work_dir, candidates, tag):
+        """
+        Roda as configurações `candidates` em processos `gs` simultâneos (um por configuração, usado só na amostra
+        de páginas). Retorna {índice: tamanho em bytes ou None}.
+        """
+        def trial(idx):
+            output = os.path.join(work_dir, f"{tag}_{idx}.pdf")
+            _, power, image_dpi = TARGET_SIZE_CANDIDATES[idx]
+            if not self._run_gs(self._gs_command(input_file_path, output, power, image_dpi=image_dpi), output): return None
+            return os.path.getsize(output)
+        with ThreadPoolExecutor(max_workers=max(1, min(available_cpus(), len(candidates)))) as executor:
+            return dict(zip(candidates, executor.map(trial, candidates)))
+
+    def compress_to_target_size(self, input_file_path, output_file_path, target_size_mb):
+        """
+        Comprime para caber em `target_size_mb` com a melhor qualidade possível. A taxa de cada configuração
+        é estimada numa amostra de páginas; as mais promissoras rodam no documento inteiro, uma por vez e da melhor
+        para a pior qualidade, cada uma dividida em faixas de páginas paralelas (_compress_pdf_gs), até a primeira
+        que cabe no alvo. Se nenhuma couber, fica a menor; se nenhuma reduzir, fica o original.
+        Retorna (sucesso, info) com info = {"target_met", "preset"}; falha se o Ghostscript falhar em todas.
+        """
+        target_bytes = target_size_mb * 1024 * 1024
+        original_bytes = os.path.getsize(input_file_path)
+        if original_bytes <= target_bytes:
+            _copy_file(input_file_path, output_file_path)
+            return True, {"target_met": True, "preset": "Original (já cabe no limite)"}
+        all_candidates = list(range(len(TARGET_SIZE_CANDIDATES)))
+        with scratch_dir("tamanho_alvo", expected_bytes=original_bytes * (TARGET_FULL_TRIALS + 1)) as work_dir:
+            with fitz.open(input_file_path) as doc: page_count = doc.page_count
+            candidates = all_candidates
+            if page_count > TARGET_SAMPLE_PAGES * 2:
+                self._report(0.05, "Estimando a compressão com uma amostra de páginas...")
+                sample_path = os.path.join(work_dir, "amostra.pdf")
+                step = page_count / TARGET_SAMPLE_PAGES
+                with fitz.open(input_file_path) as doc, fitz.open() as sample:
+                    for idx in range(TARGET_SAMPLE_PAGES):
+                        page_num = int(idx * step); sample.insert_pdf(doc, from_page=page_num, to_page=page_num)
+                    sample.save(sample_path, garbage=3)
+                sample_sizes = self._run_gs_trials(sample_path, work_dir, all_candidates, "amostra")
+                sample_bytes = os.path.getsize(sample_path)
+                estimates = {idx: original_bytes * size / sample_bytes for idx, size in sample_sizes.items() if size}
+                logging.info("Estimativas por configuração (MB): " + ", ".join(
+                    f"{TARGET_SIZE_CANDIDATES[idx][0]}={size / 1024 / 1024:.1f}" for idx, size in estimates.items()))
+                fitting = [idx for idx, size in estimates.items() if size <= target_bytes * TARGET_SAFETY_MARGIN]
+                first = fitting[0] if fitting else all_candidates[-TARGET_FULL_TRIALS]
+                candidates = all_candidates[first:first + TARGET_FULL_TRIALS]
+            sizes = {}
+            progress_callback = self.progress_callback
+            for position, idx in enumerate(candidates):
+                label, power, image_dpi = TARGET_SIZE_CANDIDATES[idx]
+                start = 0.3 + 0.7 * position / len(candidates)
+                self._report(start, f"Testando configuração {position + 1} de {len(candidates)} ({label})...")
+                if progress_callback:
+                    self.progress_callback = lambda fraction, message: progress_callback(start + 0.7 * fraction / len(candidates), f"{label}: {message}")
+                output = os.path.join(work_dir, f"completo_{idx}.pdf")
+                try:
+                    sizes[idx] = os.path.getsize(output) if self._compress_pdf_gs(input_file_path, output, power, image_dpi=image_dpi) else None
+                finally:
+                    self.progress_callback = progress_callback
+                if sizes[idx] and sizes[idx] <= target_bytes: break  # as seguintes só teriam qualidade pior
+            if not any(sizes.values()):
+                logging.error("O Ghostscript falhou em todas as configurações testadas.")
+                return False, None
+            results = {idx: size for idx, size in sizes.items() if size and size < original_bytes}
+            if not results:
+                logging.warning("Nenhuma configuração reduziu o arquivo. Mantendo o original.")
+                _copy_file(input_file_path, output_file_path)
+                return True, {"target_met": False, "preset": "Original (a compressão não reduziu o arquivo)"}
+            fitting = [idx for idx in sorted(results) if results[idx] <= target_bytes]
+            chosen = fitting[0] if fitting else min(results, key=results.get)
+            _copy_file(os.path.join(work_dir, f"completo_{chosen}.pdf"), output_file_path)
+            logging.info(f"Tamanho alvo {target_size_mb} MB: escolhida '{TARGET_SIZE_CANDIDATES[chosen][0]}' "
+                         f"({results[chosen] / 1024 / 1024:.2f} MB, alvo {'atingido' if fitting else 'não atingido'}).")
+            return True, {"target_met": bool(fitting), "preset": TARGET_SIZE_CANDIDATES[chosen][0]}
+
+    def compress_ocr_file(self, source, output_path, compression_level=3, apply_ocr=False, ocr_language='por', parallel=None, ocr_mode=OCR_MODE_AUTO, target_size_mb=None, engine=COMPRESSION_ENGINE_GS):
+        """
+        Comprime e/ou aplica OCR trabalhando apenas com arquivos em disco.
+        `ocr_mode` 'auto' faz OCR só nas páginas digitalizadas; 'full' refaz o OCR de todas.
+        Com `target_size_mb`, o nível é ignorado e vale o modo tamanho alvo (ver compress_to_target_size); o
+        resultado da escolha fica em `self.last_compression_info`.
+        `engine`: 'ghostscript' (padrão), 'imagens' (só recomprime as imagens, ver _compress_pdf_images; escolha
+        explícita do usuário) ou 'auto', que usa o mecanismo de imagens em PDFs compostos principalmente por imagens.
+        `source` pode ser caminho, objeto file-like (ex.: UploadedFile) ou bytes; o resultado é gravado em `output_path`.
+        Retorna (sucesso, caminho_do_resultado, tamanho_original_mb, tamanho_final_mb).
+        """
+        with scratch_dir("compressao_ocr", expected_bytes=_source_size(source) * 4) as temp_dir:
+            input_path = _as_input_path(source, os.path.join(temp_dir, "input.pdf"))
+            original_size_mb = os.path.getsize(input_path) / 1024 / 1024
+            cache_key = self.result_cache.make_key(
+                "compression_ocr", input_path, compression_level=compression_level, apply_ocr=apply_ocr, ocr_language=ocr_language,
+                ocr_mode=ocr_mode if apply_ocr else None, target_size_mb=target_size_mb,
+                engine=None if target_size_mb or compression_level < 0 else engine
+            )
+            self.last_compression_info = None
+            if self.result_cache.get_file(cache_key, output_path):
+                self.last_compression_info = self.result_cache.get_info(cache_key)
+                return True, output_path, original_size_mb, os.path.getsize(output_path) / 1024 / 1024
+            current_step_output = input_path; step_successful = True; ocr_failed = False
+            if target_size_mb:
+                logging.info(f"Iniciando Etapa de Compressão (tamanho alvo {target_size_mb} MB)...")
                 compressed_path = os.path.join(temp_dir, "compressed.pdf")
-                step_successful = self._compress_pdf_gs(current_step_output, compressed_path, compression_level)
-                if step_successful: current_step_output = compressed_path; logging.info("Compressão bem-sucedida.")
+                step_successful, self.last_compression_info = self.compress_to_target_size(current_step_output, compressed_path, target_size_mb)
+                if step_successful: current_step_output = compressed_path; get_scratch_space().check(temp_dir)
+                else: logging.error("Falha na etapa de compressão."); return False, None, original_size_mb, 0
+            elif compression_level >= 0:
+                chosen_engine = self._choose_compression_engine(current_step_output, engine)
+                logging.info(f"Iniciando Etapa de Compressão (Nível {compression_level}, mecanismo {chosen_engine})...")
+                compressed_path = os.path.join(temp_dir, "compressed.pdf")
+                if chosen_engine == COMPRESSION_ENGINE_IMAGES:
+                    step_successful = self._compress_pdf_images(current_step_output, compressed_path, compression_level)
+                else:
+                    step_successful = self._compress_pdf_gs(current_step_output, compressed_path, compression_level, parallel=parallel)
+                if step_successful and os.path.getsize(compressed_path) >= os.path.getsize(current_step_output):
+                    logging.warning("A compressão gerou um arquivo maior que o original. Mantendo o original.")
+                    _copy_file(current_step_output, compressed_path)
+                if step_successful: current_step_output = compressed_path; logging.info("Compressão bem-sucedida."); get_scratch_space().check(temp_dir)
                 else: logging.error("Falha na etapa de compressão."); return False, None, original_size_mb, 0
             if step_successful and apply_ocr:
                 logging.info("Iniciando Etapa de OCR...")
                 ocr_output_path = os.path.join(temp_dir, "ocr_output.pdf")
-                step_successful = self._apply_ocrmypdf(current_step_output, ocr_output_path, ocr_language)
-                if step_successful: current_step_output = ocr_output_path; logging.info("OCR bem-sucedido.")
-                else: logging.warning("Falha na etapa de OCR."); step_successful = True
+                step_successful = self._apply_ocrmypdf(current_step_output, ocr_output_path, ocr_language, ocr_mode)
+                if step_successful: current_step_output = ocr_output_path; logging.info("OCR bem-sucedido."); get_scratch_space().check(temp_dir)
+                else: logging.warning("Falha na etapa de OCR."); step_successful = True; ocr_failed = True
             if step_successful and os.path.exists(current_step_output):
-                 with open(current_step_output, 'rb') as f: processed_bytes = f.read()
-                 final_size_mb = len(processed_bytes) / 1024 / 1024; success = True
-            else: logging.error("Falha no processamento ou arquivo final não encontrado.")
+                 if not ocr_failed: self.result_cache.put(cache_key, [current_step_output], operation="compression_ocr", info=self.last_compression_info)
+                 _copy_file(current_step_output, output_path)
+                 return True, output_path, original_size_mb, os.path.getsize(output_path) / 1024 / 1024
+            logging.error("Falha no processamento ou arquivo final não encontrado.")
+            return False, None, original_size_mb, 0
+
+    def process_compression_ocr(self, file_bytes, compression_level=3, apply_ocr=False, ocr_language='por', parallel=None, ocr_mode=OCR_MODE_AUTO, target_size_mb=None, engine=COMPRESSION_ENGINE_GS):
+        """Variante em memória de `compress_ocr_file` (bytes de entrada, bytes de saída)."""
+        processed_bytes = None
+        with scratch_dir("compressao_ocr_bytes", expected_bytes=len(file_bytes) * 2) as temp_dir:
+            success, output_path, original_size_mb, final_size_mb = self.compress_ocr_file(
+                file_bytes, os.path.join(temp_dir, "output.pdf"), compression_level, apply_ocr, ocr_language, parallel, ocr_mode,
+                target_size_mb, engine
+            )
+            if success:
+                with open(output_path, 'rb') as f: processed_bytes = f.read()
         return success, processed_bytes, original_size_mb, final_size_mb
 
-    def image_to_pdf(self, image_files_bytes, output_pdf_path):
+    def image_to_pdf(self, image_sources, output_pdf_path):
+        """
+        Converte imagens (caminhos, objetos file-like ou bytes) em um PDF gravado em `output_pdf_path`.
+        JPEGs e PNGs sem alfa vão direto para o img2pdf (sem recompressão); só as demais são decodificadas,
+        em paralelo quando forem várias.
+        """
+        executor = None
         try:
-            valid_image_bytes = []
-            for img_bytes in image_files_bytes:
-                try:
-                    img = Image.open(io.BytesIO(img_bytes)); img.verify()
-                    img = Image.open(io.BytesIO(img_bytes))
-                    if img.mode in ('P', 'RGBA', 'LA'):
-                         try: img = img.convert('RGB')
-                         except Exception as convert_err: logging.warning(f"Skip convert RGB: {convert_err}"); continue
-                    byte_io = io.BytesIO(); save_format = 'JPEG' if img.format != 'PNG' else 'PNG'
-                    img.save(byte_io, format=save_format); valid_image_bytes.append(byte_io.getvalue()); img.close()
-                except Exception as img_err: logging.warning(f"Skip invalid image: {img_err}"); continue
-            if not valid_image_bytes: logging.error("No valid images provided."); return False
-            with open(output_pdf_path, "wb") as f: f.write(img2pdf.convert(valid_image_bytes))
+            with scratch_dir("imagens", expected_bytes=sum(_source_size(src) for src in image_sources) * 2) as temp_dir:
+                image_paths = []; pending = []
+                for idx, img_source in enumerate(image_sources):
+                    try:
+                        image_path = _as_input_path(img_source, os.path.join(temp_dir, f"origem_{idx:04d}"))
+                        if _image_embeds_directly(image_path): image_paths.append(image_path)
+                        else:
+                            converted_path = os.path.join(temp_dir, f"convertida_{idx:04d}.png")
+                            image_paths.append(converted_path); pending.append((image_path, converted_path))
+                    except Exception as img_err: logging.warning(f"Skip invalid image: {img_err}"); continue
+                if not image_paths: logging.error("No valid images provided."); return False
+                if pending:
+                    logging.info(f"{len(image_paths) - len(pending)} image(s) embedded as-is, {len(pending)} need conversion.")
+                    workers = min(available_cpus(), len(pending))
+                    if len(pending) >= IMAGE_PARALLEL_MIN_CONVERSIONS and workers > 1:
+                        # 'spawn' evita herdar, via fork, o estado multithread do servidor Streamlit
+                        executor = ProcessPoolExecutor(max_workers=workers, mp_context=multiprocessing.get_context("spawn"))
+                        results = executor.map(_convert_image_for_pdf, *zip(*pending))
+                    else:
+                        results = (_convert_image_for_pdf(src, dst) for src, dst in pending)
+                    failed = {dst for (_, dst), result in zip(pending, results) if result is None}
+                    image_paths = [path for path in image_paths if path not in failed]
+                    if not image_paths: logging.error("No valid images provided."); return False
+                with open(output_pdf_path, "wb") as f:
+                    img2pdf.convert(image_paths, outputstream=f, rotation=img2pdf.Rotation.ifvalid)
             logging.info(f"Images converted to PDF: {output_pdf_path}"); return True
         except Exception as e: logging.error(f"Error image_to_pdf: {str(e)}"); return False
+        finally:
+            if executor: executor.shutdown(cancel_futures=True)
 
     def pdf_to_docx(self, input_pdf_path, output_docx_path, apply_ocr=False):
         pdf_to_process = input_pdf_path; ocr_applied_successfully = False
         try:
-            with tempfile.TemporaryDirectory() as temp_docx_dir:
+            cache_key = self.result_cache.make_key("pdf_to_docx", input_pdf_path, apply_ocr=apply_ocr)
+            if self.result_cache.get_file(cache_key, output_docx_path): return True
+            with scratch_dir("docx", expected_bytes=_source_size(input_pdf_path) * 2) as temp_docx_dir:
                  if apply_ocr:
                       if not self.ocrmypdf_installed: logging.warning("OCR requested but not installed.")
                       else:
@@ -198,74 +832,153 @@ class PDFTransformer:
                  if not has_content:
                       if apply_ocr and not ocr_applied_successfully: logging.warning("DOCX empty: No content found and OCR failed.")
                       else: logging.warning("DOCX maybe empty: No content extracted.")
-                 document.save(output_docx_path); logging.info(f"PDF converted to DOCX: {output_docx_path}"); return True
+                 document.save(output_docx_path); logging.info(f"PDF converted to DOCX: {output_docx_path}")
+                 if not apply_ocr or ocr_applied_successfully: self.result_cache.put(cache_key, [output_docx_path], operation="pdf_to_docx")
+                 return True
         except Exception as e: logging.error(f"Error pdf_to_docx: {str(e)}"); return False
 
-    def pdf_to_image(self, input_pdf_path, output_folder, image_format='png'):
-        generated_images = []; doc = None
+    def pdf_to_image_zip(self, input_pdf_path, output_zip_path, dpi=RENDER_DEFAULT_DPI, pages=None, image_format='png', progress_callback=None):
+        """
+        Renderiza as páginas selecionadas (`pages` no formato de parse_page_ranges) direto para um ZIP, sem arquivos
+        intermediários. Documentos maiores são renderizados em paralelo por processos que mantêm o próprio `fitz`.
+        As imagens já são comprimidas, então entram no ZIP sem deflate. Retorna (sucesso, qtd_imagens, mensagem).
+        """
         try:
-            if not os.path.exists(output_folder): os.makedirs(output_folder)
-            doc = fitz.open(input_pdf_path)
-            logging.info(f"Converting {len(doc)} PDF pages to {image_format.upper()}...")
-            for page_num in range(len(doc)):
-                 page = doc.load_page(page_num); zoom = 2.0; mat = fitz.Matrix(zoom, zoom)
-                 pix = page.get_pixmap(matrix=mat, alpha=False)
-                 output_image_path = os.path.join(output_folder, f"pagina_{page_num + 1}.{image_format}")
-                 pix.save(output_image_path); generated_images.append(output_image_path)
-            logging.info(f"{len(generated_images)} images generated in: {output_folder}"); return generated_images
-        except Exception as e: logging.error(f"Error pdf_to_image: {str(e)}"); return None
-        finally:
-             if doc: doc.close()
-
-    def create_zip_from_files(self, file_paths, output_zip_path):
+            with fitz.open(input_pdf_path) as doc: page_count = len(doc)
+            page_nums = parse_page_ranges(pages, page_count)
+        except ValueError as e: return False, 0, str(e)
+        except Exception as e: logging.error(f"Error opening PDF for rendering: {str(e)}"); return False, 0, "Não foi possível abrir o PDF."
+        cache_key = self.result_cache.make_key("pdf_to_image_zip", input_pdf_path, image_format=image_format, dpi=dpi, pages=page_nums)
+        if self.result_cache.get_file(cache_key, output_zip_path): return True, len(page_nums), "Resultado recuperado do cache."
+        workers = min(available_cpus(), len(page_nums) // RENDER_PARALLEL_MIN_PAGES)
+        logging.info(f"Rendering {len(page_nums)} of {page_count} pages at {dpi} DPI to {image_format.upper()} ({max(workers, 1)} worker(s))...")
+        executor = None
         try:
-            with zipfile.ZipFile(output_zip_path, 'w', zipfile.ZIP_DEFLATED) as zipf:
-                 for file_path in file_paths: zipf.write(file_path, os.path.basename(file_path))
-            logging.info(f"ZIP created: {output_zip_path}"); return True
-        except Exception as e: logging.error(f"Error create_zip: {str(e)}"); return False
+            if workers > 1:
+                # 'spawn' evita herdar, via fork, o estado multithread do servidor Streamlit
+                executor = ProcessPoolExecutor(max_workers=workers, mp_context=multiprocessing.get_context("spawn"),
+                                               initializer=_render_worker_init, initargs=(input_pdf_path,))
+                images = executor.map(_render_page, page_nums, [dpi] * len(page_nums), [image_format] * len(page_nums),
+                                      chunksize=max(1, len(page_nums) // (workers * 4)))
+            else:
+                doc = fitz.open(input_pdf_path)  # documento local: renderizações simultâneas de outras sessões não o compartilham
+                images = (_render_page_from(doc, page_num, dpi, image_format) for page_num in page_nums)
+            with zipfile.ZipFile(output_zip_path, 'w', zipfile.ZIP_STORED) as zipf:
+                for done, (page_num, data) in enumerate(zip(page_nums, images), start=1):
+                    zipf.writestr(f"pagina_{page_num + 1}.{image_format}", data)
+                    if progress_callback: progress_callback(done, len(page_nums))
+            logging.info(f"ZIP with {len(page_nums)} images created: {output_zip_path}")
+            self.result_cache.put(cache_key, [output_zip_path], operation="pdf_to_image_zip")
+            return True, len(page_nums), "Conversão concluída."
+        except Exception as e:
+            logging.error(f"Error pdf_to_image_zip: {str(e)}")
+            if os.path.exists(output_zip_path): os.unlink(output_zip_path)
+            return False, 0, "Falha ao renderizar as páginas do PDF."
+        finally:
+            if executor: executor.shutdown(cancel_futures=True)
+            if doc is not None: doc.close()
 
     def document_to_pdf(self, input_doc_path, output_pdf_path):
         if not self.libreoffice_path: logging.error("LibreOffice not found."); return False
+        input_ext = os.path.splitext(input_doc_path)[1].lower()
+        cache_key = self.result_cache.make_key("document_to_pdf", input_doc_path, input_ext=input_ext)
+        if self.result_cache.get_file(cache_key, output_pdf_path): return True
+        pool = get_libreoffice_pool(self.libreoffice_path)
+        if pool is not None:
+            pool_ok, pool_msg = pool.convert(input_doc_path, output_pdf_path)
+            if pool_ok and os.path.exists(output_pdf_path) and os.path.getsize(output_pdf_path) > 0:
+                logging.info(f"Doc converted to PDF (pool): {output_pdf_path}")
+                self.result_cache.put(cache_key, [output_pdf_path], operation="document_to_pdf"); return True
+            logging.warning(f"LibreOffice pool conversion failed ({pool_msg}). Falling back to CLI.")
         output_dir = os.path.dirname(output_pdf_path)
         input_basename = os.path.splitext(os.path.basename(input_doc_path))[0]
         expected_lo_output = os.path.join(output_dir, f"{input_basename}.pdf")
         if os.path.exists(expected_lo_output): os.unlink(expected_lo_output)
         if os.path.exists(output_pdf_path) and expected_lo_output != output_pdf_path: os.unlink(output_pdf_path)
-        command = [self.libreoffice_path, '--headless', '--convert-to', 'pdf', '--outdir', output_dir, input_doc_path]
+        # Perfil isolado por chamada: conversões simultâneas não disputam o lock do perfil padrão.
+        profile_dir = get_scratch_space().create("lo_perfil")
+        command = [self.libreoffice_path, '--headless', '--norestore', f'-env:UserInstallation=file://{profile_dir}',
+                   '--convert-to', 'pdf', '--outdir', output_dir, input_doc_path]
         logging.info(f"Running conversion: {' '.join(command)}")
         try:
-            process = subprocess.run(command, capture_output=True, check=False, text=True, timeout=120)
+            process = run_process(command, timeout=120, should_cancel=self.should_cancel)
+            if process.timed_out: logging.error("LibreOffice conversion timed out."); return False
             if process.returncode != 0: logging.error(f"LO Error (code {process.returncode}): {process.stderr}"); return False
             if not os.path.exists(expected_lo_output): logging.error(f"Expected output '{expected_lo_output}' not found. Stderr: {process.stderr}"); return False
             if expected_lo_output != output_pdf_path: shutil.move(expected_lo_output, output_pdf_path); logging.info(f"Renamed to: {output_pdf_path}")
-            if os.path.exists(output_pdf_path) and os.path.getsize(output_pdf_path) > 0: logging.info(f"Doc converted to PDF: {output_pdf_path}"); return True
+            if os.path.exists(output_pdf_path) and os.path.getsize(output_pdf_path) > 0:
+                logging.info(f"Doc converted to PDF: {output_pdf_path}")
+                self.result_cache.put(cache_key, [output_pdf_path], operation="document_to_pdf"); return True
             else: logging.error(f"Final file '{output_pdf_path}' not found or empty."); return False
-        except subprocess.TimeoutExpired: logging.error("LibreOffice conversion timed out."); return False
+        except ProcessCancelled: raise
         except Exception as e: logging.error(f"Unexpected error converting document: {str(e)}"); return False
         finally:
+             get_scratch_space().release(profile_dir)
              if os.path.exists(expected_lo_output) and expected_lo_output != output_pdf_path:
                   try: os.unlink(expected_lo_output)
                   except: pass
 
     # --- MÉTODO Juntar PDFs ---
-    def merge_pdfs(self, pdf_byte_streams):
-        """Junta múltiplos arquivos PDF (streams de bytes) em um único PDF."""
-        if not pdf_byte_streams: return False, None, "Nenhum PDF fornecido."
-        merged_writer = PdfWriter(); logging.info(f"Merging {len(pdf_byte_streams)} PDFs.")
+    def merge_pdf_files(self, pdf_sources, output_pdf_path):
+        """
+        Junta múltiplos PDFs (caminhos, objetos file-like ou bytes) gravando o resultado direto em `output_pdf_path`.
+        As páginas são copiadas objeto a objeto (pikepdf/qpdf): os fluxos só são lidos das origens no momento da
+        gravação, sem recompressão, e fontes/imagens idênticas entre os arquivos são gravadas uma única vez.
+        Retorna (sucesso, caminho_do_resultado, mensagem).
+        """
+        if not pdf_sources: return False, None, "Nenhum PDF fornecido."
+        logging.info(f"Merging {len(pdf_sources)} PDFs.")
+        merged = pikepdf.Pdf.new(); source_pdfs = []
         try:
-            for idx, pdf_bytes in enumerate(pdf_byte_streams):
+            for idx, pdf_source in enumerate(pdf_sources):
                 try:
-                    reader = PdfReader(io.BytesIO(pdf_bytes))
-                    if not reader.pages: logging.warning(f"PDF {idx+1} empty/corrupt, skipping."); continue
-                    for page in reader.pages: merged_writer.add_page(page)
-                    logging.debug(f"Added PDF {idx+1} ({len(reader.pages)} pages).")
-                except Exception as read_err: logging.error(f"Error reading PDF {idx+1}: {read_err}. Skipping.");
-            if not merged_writer.pages: return False, None, "No valid content found to merge."
-            output_stream = io.BytesIO(); merged_writer.write(output_stream); merged_writer.close()
-            output_stream.seek(0); result_bytes = output_stream.getvalue()
-            logging.info("PDF merge successful."); return True, result_bytes, "PDFs merged successfully."
+                    source_pdf = pikepdf.open(_as_readable(pdf_source)); source_pdfs.append(source_pdf)  # origens ficam abertas até o save
+                    if not source_pdf.pages: logging.warning(f"PDF {idx+1} empty/corrupt, skipping."); continue
+                    merged.pages.extend(source_pdf.pages)
+                    logging.debug(f"Added PDF {idx+1} ({len(source_pdf.pages)} pages).")
+                except Exception as read_err: logging.error(f"Error reading PDF {idx+1}: {read_err}. Skipping.")
+            if not merged.pages: return False, None, "No valid content found to merge."
+            deduplicated = _dedupe_shared_streams(merged)
+            if deduplicated: logging.info(f"{deduplicated} duplicated font/image stream(s) shared in the merged PDF.")
+            merged.save(output_pdf_path, stream_decode_level=pikepdf.StreamDecodeLevel.none,
+                        object_stream_mode=pikepdf.ObjectStreamMode.generate)
+            logging.info("PDF merge successful."); return True, output_pdf_path, "PDFs merged successfully."
         except Exception as e: error_msg = f"Unexpected error merging PDFs: {e}"; logging.exception(error_msg); return False, None, error_msg
         finally:
-             if 'merged_writer' in locals() and hasattr(merged_writer, 'close'):
-                  try: merged_writer.close()
-                  except: pass
+            merged.close()
+            for source_pdf in source_pdfs: source_pdf.close()
+
+    def merge_pdfs(self, pdf_byte_streams):
+        """Junta múltiplos arquivos PDF (streams de bytes) em um único PDF."""
+        with scratch_dir("juntar", expected_bytes=sum(len(data) for data in pdf_byte_streams)) as temp_dir:
+            success, output_path, message = self.merge_pdf_files(pdf_byte_streams, os.path.join(temp_dir, "merged.pdf"))
+            if not success: return False, None, message
+            with open(output_path, "rb") as f: return True, f.read(), message
+
+
+# --- Tarefas executadas pela fila de processamento (modules.job_queue) ---
+def run_compression_ocr_job(params, ctx):
+    """Tarefa da fila: compressão e/ou OCR de `input.pdf`."""
+    ctx.report(0.05, "Processando PDF...")
+    transformer = PDFTransformer(progress_callback=ctx.report, should_cancel=ctx.cancel_requested)
+    success, output_path, original_size_mb, final_size_mb = transformer.compress_ocr_file(
+        ctx.input_path("input.pdf"), ctx.output_path("resultado.pdf"),
+        compression_level=params.get("compression_level", 3), apply_ocr=params.get("apply_ocr", False),
+        ocr_language=params.get("ocr_language", "por"), ocr_mode=params.get("ocr_mode", OCR_MODE_AUTO),
+        target_size_mb=params.get("target_size_mb"), engine=params.get("engine", COMPRESSION_ENGINE_GS)
+    )
+    if not success: raise RuntimeError("Falha ao processar o PDF.")
+    result = {"output": os.path.basename(output_path), "original_size_mb": original_size_mb, "final_size_mb": final_size_mb}
+    if transformer.last_compression_info: result.update(transformer.last_compression_info)
+    return result
+
+
+def run_document_to_pdf_job(params, ctx):
+    """Tarefa da fila: conversão de documento/planilha para PDF via LibreOffice."""
+    filename = params["filename"]
+    output_name = f"{os.path.splitext(filename)[0]}.pdf"
+    ctx.report(0.05, "Convertendo com LibreOffice...")
+    transformer = PDFTransformer(should_cancel=ctx.cancel_requested)
+    if not transformer.document_to_pdf(ctx.input_path(filename), ctx.output_path(output_name)):
+        raise RuntimeError("Falha ao converter o documento para PDF via LibreOffice.")
+    return {"output": output_name}
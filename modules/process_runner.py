@@ -0,0 +1,217 @@
+import os
+import re
+import time
+import queue
+import atexit
+import signal
+import logging
+import threading
+import subprocess
+import contextlib
+from collections import deque
+
+logging.basicConfig(level=logging.INFO)
+log = logging.getLogger(__name__)
+
+POLL_INTERVAL_SECONDS = 0.5
+KILL_GRACE_SECONDS = 5
+OUTPUT_TAIL_LINES = 200
+
+
+class ProcessCancelled(Exception):
+    """Levantada quando o processo externo foi interrompido por `should_cancel` (ex.: botão Cancelar da fila)."""
+
+
+class ProcessResult:
+    def __init__(self, returncode, stdout, stderr, timed_out=False):
+        self.returncode = returncode
+        self.stdout = stdout
+        self.stderr = stderr
+        self.timed_out = timed_out
+
+
+# --- Leitores de progresso: recebem cada linha de saída e devolvem o estado atual (dict) ou None ---
+class GhostscriptProgress:
+    """Lê "Processing pages A through B." e "Page N" (gs sem -dQUIET). Páginas são absolutas no documento."""
+    _range_re = re.compile(r"Processing pages (\d+) through (\d+)")
+    _page_re = re.compile(r"^Page (\d+)")
+
+    def __init__(self):
+        self.first = self.last = None
+
+    def __call__(self, line):
+        match = self._range_re.search(line)
+        if match: self.first, self.last = int(match.group(1)), int(match.group(2)); return None
+        match = self._page_re.match(line)
+        if match and self.first is not None:
+            return {"page": int(match.group(1)), "first": self.first, "last": self.last}
+        return None
+
+
+class OcrmypdfProgress:
+    """Conta as páginas distintas que aparecem no log detalhado do OCRmyPDF (linhas iniciadas pelo número da página)."""
+    _page_re = re.compile(r"^\s*(\d+)\s+\S")
+
+    def __init__(self, total_pages):
+        self.total_pages = total_pages
+        self.pages_seen = set()
+
+    def __call__(self, line):
+        match = self._page_re.match(line)
+        if not match: return None
+        self.pages_seen.add(int(match.group(1)))
+        return {"pages_done": min(len(self.pages_seen), self.total_pages), "total": self.total_pages}
+
+
+class FfmpegProgress:
+    """Lê a saída de `ffmpeg -progress pipe:1` (out_time_us) e converte em fração da duração total."""
+    def __init__(self, duration_seconds):
+        self.duration_seconds = duration_seconds
+
+    def __call__(self, line):
+        key, _, value = line.strip().partition("=")
+        if key in ("out_time_us", "out_time_ms") and value.isdigit() and self.duration_seconds:
+            seconds = int(value) / 1_000_000  # ambos vêm em microssegundos
+            return {"seconds": seconds, "progress": min(1.0, seconds / self.duration_seconds)}
+        if key == "progress" and value == "end":
+            return {"seconds": self.duration_seconds, "progress": 1.0}
+        return None
+
+
+class SilenceDetector(FfmpegProgress):
+    """
+    Lê a saída do filtro `silencedetect` do ffmpeg e acumula os trechos de silêncio em `silences` [(início, fim)].
+    Com `-progress pipe:1`, também emite o andamento como FfmpegProgress.
+    """
+    _start_re = re.compile(r"silence_start:\s*(-?[\d.]+)")
+    _end_re = re.compile(r"silence_end:\s*([\d.]+)")
+
+    def __init__(self, duration_seconds):
+        super().__init__(duration_seconds)
+        self.silences = []
+        self._open_start = None
+
+    def __call__(self, line):
+        match = self._start_re.search(line)
+        if match: self._open_start = max(0.0, float(match.group(1))); return None
+        match = self._end_re.search(line)
+        if match and self._open_start is not None:
+            self.silences.append((self._open_start, float(match.group(1)))); self._open_start = None; return None
+        return super().__call__(line)
+
+
+# --- Execução ---
+_active = set()
+_active_lock = threading.Lock()
+
+
+def _kill_tree(process):
+    """Encerra o processo e todos os filhos (mesmo grupo de processos): SIGTERM, depois SIGKILL."""
+    if process.poll() is not None: return
+    try:
+        os.killpg(process.pid, signal.SIGTERM)
+        process.wait(timeout=KILL_GRACE_SECONDS)
+    except subprocess.TimeoutExpired:
+        try: os.killpg(process.pid, signal.SIGKILL)
+        except ProcessLookupError: pass
+        process.wait()
+    except ProcessLookupError:
+        pass
+
+
+def _kill_all_active():
+    with _active_lock: processes = list(_active)
+    for process in processes: _kill_tree(process)
+
+
+atexit.register(_kill_all_active)
+
+
+def _pump(stream, events, tail, parser):
+    for line in stream:
+        tail.append(line)
+        if parser is not None:
+            try:
+                event = parser(line)
+            except Exception:
+                event = None
+            if event is not None: events.put(event)
+    stream.close()
+
+
+@contextlib.contextmanager
+def streaming_process(command, stdin=subprocess.DEVNULL):
+    """
+    Abre `command` numa sessão própria com stdout binário para ser consumido aos poucos (ex.: PCM do ffmpeg).
+    Ao sair do bloco (fim, erro ou cancelamento), a árvore de processos é encerrada. As últimas linhas de
+    stderr ficam em `process.stderr_tail`.
+    """
+    process = subprocess.Popen(command, stdin=stdin, stdout=subprocess.PIPE, stderr=subprocess.PIPE, start_new_session=True)
+    process.stderr_tail = deque(maxlen=OUTPUT_TAIL_LINES)
+    with _active_lock: _active.add(process)
+    reader = threading.Thread(
+        target=lambda: process.stderr_tail.extend(line.decode(errors="replace") for line in process.stderr), daemon=True
+    )
+    reader.start()
+    try:
+        yield process
+    finally:
+        _kill_tree(process)
+        with _active_lock: _active.discard(process)
+        reader.join(timeout=KILL_GRACE_SECONDS)
+        process.stdout.close()
+
+
+def run_process(command, timeout=None, parser=None, on_progress=None, should_cancel=None, cwd=None):
+    """
+    Executa `command` numa sessão própria, sem bloquear em `communicate`, para poder interrompê-lo a qualquer momento.
+
+    - `parser`: leitor de progresso aplicado a cada linha de stdout/stderr (ex.: GhostscriptProgress()).
+    - `on_progress(evento)`: chamado na thread de quem executa (seguro para Streamlit), no máximo a cada
+      POLL_INTERVAL_SECONDS, com o evento mais recente.
+    - `should_cancel()`: consultado periodicamente; se True, a árvore de processos é encerrada e ProcessCancelled é levantada.
+
+    Qualquer exceção durante a espera (incluindo a interrupção do script quando a sessão do Streamlit termina
+    ou o usuário clica em outro botão) também encerra a árvore de processos.
+    Retorna ProcessResult (stdout/stderr com as últimas OUTPUT_TAIL_LINES linhas).
+    """
+    process = subprocess.Popen(
+        command, stdout=subprocess.PIPE, stderr=subprocess.PIPE, text=True, errors="replace",
+        cwd=cwd, start_new_session=True
+    )
+    with _active_lock: _active.add(process)
+    events = queue.Queue()
+    stdout_tail, stderr_tail = deque(maxlen=OUTPUT_TAIL_LINES), deque(maxlen=OUTPUT_TAIL_LINES)
+    readers = [
+        threading.Thread(target=_pump, args=(process.stdout, events, stdout_tail, parser), daemon=True),
+        threading.Thread(target=_pump, args=(process.stderr, events, stderr_tail, parser), daemon=True),
+    ]
+    for reader in readers: reader.start()
+    deadline = time.time() + timeout if timeout else None
+    timed_out = False
+    try:
+        while True:
+            try:
+                process.wait(timeout=POLL_INTERVAL_SECONDS)
+                finished = True
+            except subprocess.TimeoutExpired:
+                finished = False
+            latest = None
+            while True:
+                try: latest = events.get_nowait()
+                except queue.Empty: break
+            if latest is not None and on_progress is not None: on_progress(latest)
+            if finished: break
+            if should_cancel is not None and should_cancel():
+                log.info(f"Cancelando processo {process.pid} ({os.path.basename(command[0])}) a pedido do usuário.")
+                _kill_tree(process)
+                raise ProcessCancelled()
+            if deadline and time.time() > deadline:
+                log.error(f"Processo {os.path.basename(command[0])} excedeu o tempo limite de {timeout}s.")
+                _kill_tree(process); timed_out = True
+                break
+    finally:
+        _kill_tree(process)
+        with _active_lock: _active.discard(process)
+    for reader in readers: reader.join(timeout=KILL_GRACE_SECONDS)
+    return ProcessResult(process.returncode, "".join(stdout_tail), "".join(stderr_tail), timed_out=timed_out)
@@ -1,47 +1,23 @@
-import os
 import logging
 import streamlit as st
-from langchain_community.document_loaders import PyPDFLoader
-from langchain.text_splitter import RecursiveCharacterTextSplitter
-from langchain_community.vectorstores import FAISS
-from langchain_community.embeddings import HuggingFaceEmbeddings
 from langchain_openai import ChatOpenAI
 from langchain.prompts import ChatPromptTemplate
-from modules.text_corrector import TextCorrector
+from modules.llm_client import get_llm_client, get_router, RoutedCompletions
+from modules.rdpm_index import PDF_PATH, load_or_build_index
 
 
 logging.basicConfig(level=logging.INFO)
 log = logging.getLogger(__name__)
 
-PDF_PATH = "files/rdpm.pdf"
-EMBEDDING_MODEL_NAME = "sentence-transformers/paraphrase-multilingual-mpnet-base-v2"
-CACHE_DIR = "/app/.cache/huggingface"
-
 
 @st.cache_resource(show_spinner=False)
 def load_and_get_retriever():
-    """Carrega PDF, splita, cria embeddings e retorna o Retriever FAISS."""
-    log.info(f"Cache Check: Tentando carregar/indexar PDF: {PDF_PATH}")
-    if not os.path.exists(PDF_PATH):
-        log.error(f"Arquivo PDF não encontrado em: {PDF_PATH}")
-        return None
+    """Carrega o índice FAISS persistido do RDPM (ou o constrói, se necessário) e retorna o Retriever."""
+    log.info(f"Cache Check: Tentando carregar índice do PDF: {PDF_PATH}")
     try:
-        loader = PyPDFLoader(PDF_PATH)
-        docs = loader.load()
-        if not docs: log.error("..."); return None
-        text_splitter = RecursiveCharacterTextSplitter(chunk_size=1000, chunk_overlap=150)
-        splits = text_splitter.split_documents(docs)
-        if not splits: log.error("..."); return None
-        log.info(f"Carregado e dividido em {len(splits)} chunks.")
-
-        log.info(f"Inicializando embeddings: {EMBEDDING_MODEL_NAME}...")
-        embeddings = HuggingFaceEmbeddings(
-            model_name=EMBEDDING_MODEL_NAME, cache_folder=CACHE_DIR, model_kwargs={'device': 'cpu'}
-        )
-        log.info("Embeddings inicializados.")
-
-        log.info("Criando índice FAISS e retriever...")
-        vector_index = FAISS.from_documents(splits, embeddings)
+        vector_index = load_or_build_index()
+        if vector_index is None:
+            return None
         retriever = vector_index.as_retriever(search_type="similarity", search_kwargs={'k': 5})
         log.info("Retriever criado com sucesso a partir do índice FAISS.")
         return retriever
@@ -51,10 +27,9 @@ def load_and_get_retriever():
 
 @st.cache_resource(show_spinner=False)
 def get_llm_client_cached():
-    """Obtém o cliente LLM configurado."""
+    """Obtém o cliente LLM do processo (o mesmo do Corretor: pool de conexões e retentativas compartilhados)."""
     log.info("Cache Check: Tentando obter LLM client...")
-    corrector = TextCorrector()
-    client = corrector.get_llm_client()
+    client = get_llm_client()
     if client:
         log.info("LLM client obtido.")
         return client
@@ -89,9 +64,10 @@ def get_rag_chain():
     try:
         # Define o modelo LLM Langchain
         llm = ChatOpenAI(
+            client=RoutedCompletions(),  # chamadas pelo cliente compartilhado, com roteamento e failover entre endpoints
             openai_api_key=llm_client.api_key,
             openai_api_base=str(llm_client.base_url),
-            model_name=os.getenv("OPENAI_MODEL_NAME", "deepseek-chat"),
+            model_name=get_router().endpoints[0].model,  # informativo: cada endpoint usa o próprio modelo
             temperature=0.1, max_tokens=1000
         )
 
@@ -0,0 +1,192 @@
+import os
+import json
+import shutil
+import hashlib
+import logging
+import argparse
+import tempfile
+from importlib import metadata
+
+logging.basicConfig(level=logging.INFO)
+log = logging.getLogger(__name__)
+
+PDF_PATH = "files/rdpm.pdf"
+EMBEDDING_MODEL_NAME = "sentence-transformers/paraphrase-multilingual-mpnet-base-v2"
+CACHE_DIR = "/app/.cache/huggingface"
+INDEX_DIR = os.getenv("RDPM_INDEX_DIR", "/app/.cache/rdpm_index")
+
+CHUNK_SIZE = 1000
+CHUNK_OVERLAP = 150
+INDEX_FORMAT_VERSION = 1
+
+INDEX_FILENAME = "index.faiss"
+CHUNKS_FILENAME = "chunks.json"
+MANIFEST_FILENAME = "manifest.json"
+
+# Bibliotecas cujas versões influenciam o conteúdo do índice (parsing, split, embeddings, formato FAISS)
+_FINGERPRINT_PACKAGES = ("pypdf", "langchain", "langchain-community", "sentence-transformers", "faiss-cpu")
+
+
+def _package_version(name):
+    try:
+        return metadata.version(name)
+    except metadata.PackageNotFoundError:
+        return "n/a"
+
+
+def compute_fingerprint(pdf_path=PDF_PATH):
+    """Calcula a impressão digital do índice: bytes do PDF, modelo, configuração do splitter e versões."""
+    digest = hashlib.sha256()
+    with open(pdf_path, "rb") as f:
+        for block in iter(lambda: f.read(1024 * 1024), b""):
+            digest.update(block)
+    description = {
+        "pdf_sha256": digest.hexdigest(),
+        "embedding_model": EMBEDDING_MODEL_NAME,
+        "chunk_size": CHUNK_SIZE,
+        "chunk_overlap": CHUNK_OVERLAP,
+        "format": INDEX_FORMAT_VERSION,
+        "versions": {pkg: _package_version(pkg) for pkg in _FINGERPRINT_PACKAGES},
+    }
+    payload = json.dumps(description, sort_keys=True).encode("utf-8")
+    return hashlib.sha256(payload).hexdigest(), description
+
+
+def get_embeddings():
+    """Instancia o modelo de embeddings usado tanto na construção quanto nas consultas."""
+    from langchain_community.embeddings import HuggingFaceEmbeddings
+    log.info(f"Inicializando embeddings: {EMBEDDING_MODEL_NAME}...")
+    return HuggingFaceEmbeddings(
+        model_name=EMBEDDING_MODEL_NAME, cache_folder=CACHE_DIR, model_kwargs={'device': 'cpu'}
+    )
+
+
+def _index_path(fingerprint):
+    return os.path.join(INDEX_DIR, fingerprint[:32])
+
+
+def build_index(embeddings, pdf_path=PDF_PATH, fingerprint=None, description=None):
+    """Parseia o PDF, gera os embeddings e grava índice FAISS + metadados dos chunks em disco."""
+    import faiss
+    from langchain_community.document_loaders import PyPDFLoader
+    from langchain.text_splitter import RecursiveCharacterTextSplitter
+    from langchain_community.vectorstores import FAISS
+
+    if fingerprint is None:
+        fingerprint, description = compute_fingerprint(pdf_path)
+
+    docs = PyPDFLoader(pdf_path).load()
+    if not docs:
+        log.error(f"Nenhuma página carregada de {pdf_path}.")
+        return None
+    splits = RecursiveCharacterTextSplitter(chunk_size=CHUNK_SIZE, chunk_overlap=CHUNK_OVERLAP).split_documents(docs)
+    if not splits:
+        log.error(f"Nenhum chunk gerado a partir de {pdf_path}.")
+        return None
+    log.info(f"Carregado e dividido em {len(splits)} chunks. Gerando embeddings...")
+    vector_index = FAISS.from_documents(splits, embeddings)
+
+    chunks = []
+    for position in range(vector_index.index.ntotal):
+        doc_id = vector_index.index_to_docstore_id[position]
+        doc = vector_index.docstore.search(doc_id)
+        chunks.append({"id": doc_id, "page_content": doc.page_content, "metadata": doc.metadata})
+
+    os.makedirs(INDEX_DIR, exist_ok=True)
+    final_dir = _index_path(fingerprint)
+    staging_dir = tempfile.mkdtemp(prefix=".build_", dir=INDEX_DIR)
+    try:
+        faiss.write_index(vector_index.index, os.path.join(staging_dir, INDEX_FILENAME))
+        with open(os.path.join(staging_dir, CHUNKS_FILENAME), "w", encoding="utf-8") as f:
+            json.dump(chunks, f, ensure_ascii=False)
+        # O manifesto é gravado por último: sua presença marca o índice como completo
+        with open(os.path.join(staging_dir, MANIFEST_FILENAME), "w", encoding="utf-8") as f:
+            json.dump({"fingerprint": fingerprint, **(description or {}), "chunks": len(chunks)}, f, indent=2)
+        if os.path.isdir(final_dir):
+            shutil.rmtree(final_dir, ignore_errors=True)
+        os.replace(staging_dir, final_dir)
+    except Exception:
+        shutil.rmtree(staging_dir, ignore_errors=True)
+        raise
+    log.info(f"Índice RDPM gravado em {final_dir} ({len(chunks)} chunks).")
+    _remove_stale_indexes(keep=final_dir)
+    return vector_index
+
+
+def _remove_stale_indexes(keep):
+    """Remove índices de impressões digitais antigas (e construções interrompidas)."""
+    for name in os.listdir(INDEX_DIR):
+        path = os.path.join(INDEX_DIR, name)
+        if path != keep and os.path.isdir(path):
+            log.info(f"Removendo índice RDPM obsoleto: {path}")
+            shutil.rmtree(path, ignore_errors=True)
+
+
+def _read_faiss_index(path):
+    """Lê o índice FAISS mapeado em memória (mmap); recorre à leitura normal se o tipo não suportar."""
+    import faiss
+    try:
+        return faiss.read_index(path, faiss.IO_FLAG_MMAP | faiss.IO_FLAG_READ_ONLY)
+    except Exception as e:
+        log.warning(f"Leitura mmap do índice FAISS indisponível ({e}). Carregando em memória.")
+        return faiss.read_index(path)
+
+
+def load_index(embeddings, fingerprint):
+    """Carrega o índice persistido para a impressão digital informada. Retorna None se não existir."""
+    from langchain_community.vectorstores import FAISS
+    from langchain_community.docstore.in_memory import InMemoryDocstore
+    from langchain_core.documents import Document
+
+    index_dir = _index_path(fingerprint)
+    manifest_path = os.path.join(index_dir, MANIFEST_FILENAME)
+    if not os.path.exists(manifest_path):
+        return None
+    try:
+        with open(manifest_path, "r", encoding="utf-8") as f:
+            if json.load(f).get("fingerprint") != fingerprint:
+                return None
+        with open(os.path.join(index_dir, CHUNKS_FILENAME), "r", encoding="utf-8") as f:
+            chunks = json.load(f)
+        index = _read_faiss_index(os.path.join(index_dir, INDEX_FILENAME))
+        if index.ntotal != len(chunks):
+            log.warning(f"Índice RDPM inconsistente ({index.ntotal} vetores, {len(chunks)} chunks). Será reconstruído.")
+            return None
+        docstore = InMemoryDocstore({
+            chunk["id"]: Document(page_content=chunk["page_content"], metadata=chunk["metadata"]) for chunk in chunks
+        })
+        index_to_docstore_id = {position: chunk["id"] for position, chunk in enumerate(chunks)}
+        log.info(f"Índice RDPM carregado do disco: {index_dir} ({len(chunks)} chunks).")
+        return FAISS(embedding_function=embeddings, index=index, docstore=docstore,
+                     index_to_docstore_id=index_to_docstore_id)
+    except Exception as e:
+        log.warning(f"Falha ao carregar índice RDPM persistido ({e}). Será reconstruído.", exc_info=True)
+        return None
+
+
+def load_or_build_index(embeddings=None, pdf_path=PDF_PATH, force_rebuild=False):
+    """
+    Retorna o vectorstore FAISS do RDPM, reaproveitando o índice em disco quando a impressão
+    digital (PDF, modelo, splitter, versões) não mudou e reconstruindo-o caso contrário.
+    """
+    if not os.path.exists(pdf_path):
+        log.error(f"Arquivo PDF não encontrado em: {pdf_path}")
+        return None
+    fingerprint, description = compute_fingerprint(pdf_path)
+    if embeddings is None:
+        embeddings = get_embeddings()
+    if not force_rebuild:
+        vector_index = load_index(embeddings, fingerprint)
+        if vector_index is not None:
+            return vector_index
+    log.info(f"Construindo índice RDPM (impressão digital {fingerprint[:12]})...")
+    return build_index(embeddings, pdf_path, fingerprint, description)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Constrói o índice FAISS persistido do RDPM.")
+    parser.add_argument("--pdf", default=PDF_PATH, help="Caminho do PDF do RDPM.")
+    parser.add_argument("--force", action="store_true", help="Reconstrói mesmo se o índice atual for válido.")
+    args = parser.parse_args()
+    result = load_or_build_index(pdf_path=args.pdf, force_rebuild=args.force)
+    raise SystemExit(0 if result is not None else 1)
@@ -0,0 +1,258 @@
+import os
+import json
+import time
+import uuid
+import shutil
+import hashlib
+import logging
+import threading
+
+logging.basicConfig(level=logging.INFO)
+log = logging.getLogger(__name__)
+
+RESULT_CACHE_DIR = os.getenv("RESULT_CACHE_DIR", "/app/.cache/results")
+RESULT_CACHE_MAX_MB = float(os.getenv("RESULT_CACHE_MAX_MB", "2048"))
+RESULT_CACHE_TTL_HOURS = float(os.getenv("RESULT_CACHE_TTL_HOURS", "72"))
+
+CACHE_FORMAT_VERSION = 1
+META_FILENAME = "meta.json"
+HASH_BLOCK_SIZE = 1024 * 1024
+
+
+def hash_source(source):
+    """SHA-256 do conteúdo de `source` (bytes, caminho ou objeto file-like), lido em blocos."""
+    digest = hashlib.sha256()
+    if isinstance(source, (bytes, bytearray, memoryview)):
+        digest.update(source)
+    elif isinstance(source, (str, os.PathLike)):
+        with open(source, "rb") as f:
+            for block in iter(lambda: f.read(HASH_BLOCK_SIZE), b""):
+                digest.update(block)
+    else:
+        position = source.tell() if hasattr(source, "tell") else None
+        for block in iter(lambda: source.read(HASH_BLOCK_SIZE), b""):
+            digest.update(block)
+        if position is not None:
+            source.seek(position)
+    return digest.hexdigest()
+
+
+def _link_or_copy(src, dst):
+    try:
+        os.link(src, dst)
+    except OSError:
+        shutil.copy2(src, dst)
+
+
+class ResultCache:
+    """
+    Cache em disco, endereçado por conteúdo, para resultados de operações custosas.
+    Cada entrada é um diretório com os arquivos de saída e um `meta.json`; as escritas são
+    atômicas (staging + rename), a expiração é por TTL e a remoção por LRU ao exceder o orçamento.
+    """
+    def __init__(self, root, max_bytes, ttl_seconds):
+        self.root = root
+        self.max_bytes = max_bytes
+        self.ttl_seconds = ttl_seconds
+        self._lock = threading.Lock()
+        self._stats = {"hits": 0, "misses": 0, "writes": 0, "evictions": 0}
+        self._staging_root = os.path.join(root, ".staging")
+        try:
+            os.makedirs(self._staging_root, exist_ok=True)
+            self.enabled = True
+        except OSError as e:
+            log.warning(f"Cache de resultados desabilitado: não foi possível criar '{root}': {e}")
+            self.enabled = False
+
+    def make_key(self, operation, source, **params):
+        """Monta a chave a partir do hash da entrada, da operação e dos parâmetros."""
+        description = {
+            "v": CACHE_FORMAT_VERSION, "op": operation,
+            "input": hash_source(source), "params": params,
+        }
+        return hashlib.sha256(json.dumps(description, sort_keys=True, default=str).encode("utf-8")).hexdigest()
+
+    def _entry_dir(self, key):
+        return os.path.join(self.root, key[:2], key)
+
+    def _count(self, name, amount=1):
+        with self._lock:
+            self._stats[name] += amount
+
+    def _read_meta(self, entry_dir):
+        with open(os.path.join(entry_dir, META_FILENAME), "r", encoding="utf-8") as f:
+            return json.load(f)
+
+    def get(self, key, dest_dir):
+        """Copia os arquivos da entrada para `dest_dir`. Retorna a lista de caminhos, ou None se ausente/expirada."""
+        if not self.enabled:
+            return None
+        entry_dir = self._entry_dir(key)
+        try:
+            meta = self._read_meta(entry_dir)
+            if time.time() - meta["created"] > self.ttl_seconds:
+                shutil.rmtree(entry_dir, ignore_errors=True)
+                self._count("misses")
+                return None
+            os.makedirs(dest_dir, exist_ok=True)
+            paths = []
+            for name in meta["files"]:
+                dest_path = os.path.join(dest_dir, name)
+                if os.path.exists(dest_path):
+                    os.unlink(dest_path)
+                _link_or_copy(os.path.join(entry_dir, name), dest_path)
+                paths.append(dest_path)
+            # O mtime do meta.json registra o último acesso (base da política LRU)
+            os.utime(os.path.join(entry_dir, META_FILENAME))
+        except (OSError, ValueError, KeyError):
+            self._count("misses")
+            return None
+        self._count("hits")
+        log.info(f"Cache de resultados: HIT {key[:12]} ({meta.get('operation')}).")
+        return paths
+
+    def get_file(self, key, dest_path):
+        """Variante de `get` para entradas de arquivo único, gravado exatamente em `dest_path`."""
+        if not self.enabled:
+            return False
+        staging = os.path.join(self._staging_root, f"get_{uuid.uuid4().hex}")
+        try:
+            paths = self.get(key, staging)
+            if not paths:
+                return False
+            if os.path.exists(dest_path):
+                os.unlink(dest_path)
+            shutil.move(paths[0], dest_path)
+            return True
+        finally:
+            shutil.rmtree(staging, ignore_errors=True)
+
+    def get_bytes(self, key):
+        """Retorna o conteúdo de uma entrada de arquivo único, ou None."""
+        if not self.enabled:
+            return None
+        staging = os.path.join(self._staging_root, f"get_{uuid.uuid4().hex}")
+        try:
+            paths = self.get(key, staging)
+            if not paths:
+                return None
+            with open(paths[0], "rb") as f:
+                return f.read()
+        finally:
+            shutil.rmtree(staging, ignore_errors=True)
+
+    def get_info(self, key):
+        """Retorna o `info` gravado junto com a entrada (ver `put`), ou None."""
+        if not self.enabled:
+            return None
+        try:
+            return self._read_meta(self._entry_dir(key)).get("info")
+        except (OSError, ValueError):
+            return None
+
+    def put(self, key, file_paths, operation=None, info=None):
+        """
+        Grava os arquivos informados como resultado de `key`, com `info` (dict serializável, opcional) no meta.
+        Falhas de cache nunca interrompem o chamador.
+        """
+        if not self.enabled or not file_paths:
+            return False
+        entry_dir = self._entry_dir(key)
+        staging = os.path.join(self._staging_root, f"put_{uuid.uuid4().hex}")
+        try:
+            os.makedirs(staging)
+            names = []
+            size = 0
+            for path in file_paths:
+                name = os.path.basename(path)
+                _link_or_copy(path, os.path.join(staging, name))
+                names.append(name)
+                size += os.path.getsize(path)
+            if size > self.max_bytes:
+                log.info(f"Resultado de {size / 1024 / 1024:.1f} MB excede o orçamento do cache. Não armazenado.")
+                return False
+            with open(os.path.join(staging, META_FILENAME), "w", encoding="utf-8") as f:
+                json.dump({"created": time.time(), "operation": operation, "files": names, "size": size, "info": info}, f)
+            os.makedirs(os.path.dirname(entry_dir), exist_ok=True)
+            if os.path.isdir(entry_dir):
+                shutil.rmtree(entry_dir, ignore_errors=True)
+            os.replace(staging, entry_dir)
+        except OSError as e:
+            log.warning(f"Falha ao gravar entrada {key[:12]} no cache de resultados: {e}")
+            return False
+        finally:
+            shutil.rmtree(staging, ignore_errors=True)
+        self._count("writes")
+        self._evict()
+        return True
+
+    def put_bytes(self, key, data, filename, operation=None):
+        """Grava `data` como entrada de arquivo único chamado `filename`."""
+        if not self.enabled:
+            return False
+        staging = os.path.join(self._staging_root, f"bytes_{uuid.uuid4().hex}")
+        try:
+            os.makedirs(staging)
+            path = os.path.join(staging, filename)
+            with open(path, "wb") as f:
+                f.write(data)
+            return self.put(key, [path], operation=operation)
+        except OSError as e:
+            log.warning(f"Falha ao gravar entrada {key[:12]} no cache de resultados: {e}")
+            return False
+        finally:
+            shutil.rmtree(staging, ignore_errors=True)
+
+    def _evict(self):
+        """Remove entradas expiradas e, depois, as menos usadas até caber no orçamento."""
+        entries = []
+        total = 0
+        now = time.time()
+        for prefix in os.listdir(self.root):
+            prefix_dir = os.path.join(self.root, prefix)
+            if prefix.startswith(".") or not os.path.isdir(prefix_dir):
+                continue
+            for key in os.listdir(prefix_dir):
+                entry_dir = os.path.join(prefix_dir, key)
+                try:
+                    meta = self._read_meta(entry_dir)
+                    last_access = os.path.getmtime(os.path.join(entry_dir, META_FILENAME))
+                except (OSError, ValueError):
+                    continue
+                if now - meta.get("created", 0) > self.ttl_seconds:
+                    shutil.rmtree(entry_dir, ignore_errors=True)
+                    self._count("evictions")
+                    continue
+                entries.append((last_access, meta.get("size", 0), entry_dir))
+                total += meta.get("size", 0)
+        entries.sort()
+        while total > self.max_bytes and entries:
+            _, size, entry_dir = entries.pop(0)
+            shutil.rmtree(entry_dir, ignore_errors=True)
+            total -= size
+            self._count("evictions")
+            log.info(f"Cache de resultados: entrada removida por LRU ({size / 1024 / 1024:.1f} MB).")
+
+    def stats(self):
+        """Contadores do processo atual (hits, misses, writes, evictions) e taxa de acerto."""
+        with self._lock:
+            stats = dict(self._stats)
+        lookups = stats["hits"] + stats["misses"]
+        stats["hit_rate"] = stats["hits"] / lookups if lookups else 0.0
+        return stats
+
+
+_caches = {}
+_caches_lock = threading.Lock()
+
+
+def get_result_cache(namespace="pdf"):
+    """Retorna a instância (única por processo) do cache de resultados para o namespace informado."""
+    with _caches_lock:
+        if namespace not in _caches:
+            _caches[namespace] = ResultCache(
+                os.path.join(RESULT_CACHE_DIR, namespace),
+                max_bytes=int(RESULT_CACHE_MAX_MB * 1024 * 1024),
+                ttl_seconds=RESULT_CACHE_TTL_HOURS * 3600,
+            )
+        return _caches[namespace]
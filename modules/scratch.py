@@ -0,0 +1,181 @@
+import os
+import time
+import uuid
+import shutil
+import logging
+import tempfile
+import threading
+import contextlib
+
+logging.basicConfig(level=logging.INFO)
+log = logging.getLogger(__name__)
+
+MB = 1024 * 1024
+
+# Área em RAM (tmpfs) para intermediários pequenos; o restante vai para o disco
+SCRATCH_RAM_DIR = os.getenv("SCRATCH_RAM_DIR", "/dev/shm/tools-p6")
+SCRATCH_DISK_DIR = os.getenv("SCRATCH_DISK_DIR", os.path.join(tempfile.gettempdir(), "tools-p6"))
+SCRATCH_RAM_MAX_MB = int(os.getenv("SCRATCH_RAM_MAX_MB", "1024"))
+# Quotas: por diretório de trabalho e total (RAM + disco, todos os processos)
+SCRATCH_DIR_QUOTA_MB = int(os.getenv("SCRATCH_DIR_QUOTA_MB", "3072"))
+SCRATCH_TOTAL_QUOTA_MB = int(os.getenv("SCRATCH_TOTAL_QUOTA_MB", "10240"))
+# Diretórios de processos mortos (ou mais velhos que isto) são removidos pelo faxineiro
+SCRATCH_ORPHAN_HOURS = float(os.getenv("SCRATCH_ORPHAN_HOURS", "6"))
+JANITOR_INTERVAL_SECONDS = 300
+USAGE_CACHE_SECONDS = 5
+RAM_FREE_MARGIN = 0.25  # nunca ocupa mais que 75% do espaço livre do tmpfs
+
+
+class ScratchQuotaExceeded(Exception):
+    """Levantada quando um diretório de trabalho (ou a área total) ultrapassa a quota configurada."""
+
+
+def _dir_size(path):
+    total = 0
+    for root, _, files in os.walk(path):
+        for name in files:
+            try: total += os.lstat(os.path.join(root, name)).st_size
+            except OSError: pass
+    return total
+
+
+def _pid_alive(pid):
+    try:
+        os.kill(pid, 0)
+        return True
+    except ProcessLookupError:
+        return False
+    except PermissionError:
+        return True
+
+
+class ScratchSpace:
+    """
+    Distribui diretórios de trabalho temporários entre tmpfs (/dev/shm) e disco, conforme o tamanho esperado,
+    aplica quotas por diretório e total, e remove periodicamente diretórios órfãos (processos que morreram).
+    Os diretórios se chamam <prefixo>-<pid>-<token>, o que permite identificar o processo dono.
+    """
+    def __init__(self, ram_dir=SCRATCH_RAM_DIR, disk_dir=SCRATCH_DISK_DIR):
+        self.disk_dir = disk_dir
+        os.makedirs(disk_dir, exist_ok=True)
+        self.ram_dir = ram_dir if self._prepare_ram_dir(ram_dir) else None
+        self._lock = threading.Lock()
+        self._active = {}  # caminho -> bytes reservados
+        self._usage_cache = (0.0, 0)
+        self.sweep_orphans()
+        threading.Thread(target=self._janitor_loop, name="scratch-janitor", daemon=True).start()
+
+    @staticmethod
+    def _prepare_ram_dir(ram_dir):
+        try:
+            os.makedirs(ram_dir, exist_ok=True)
+            return os.access(ram_dir, os.W_OK)
+        except OSError as e:
+            log.info(f"Área em RAM ({ram_dir}) indisponível, usando apenas disco: {e}")
+            return False
+
+    def _roots(self):
+        return [root for root in (self.ram_dir, self.disk_dir) if root]
+
+    def total_usage(self):
+        """Bytes ocupados em todas as áreas (todos os processos); recalculado no máximo a cada USAGE_CACHE_SECONDS."""
+        checked_at, usage = self._usage_cache
+        if time.time() - checked_at > USAGE_CACHE_SECONDS:
+            usage = sum(_dir_size(root) for root in self._roots())
+            self._usage_cache = (time.time(), usage)
+        return usage
+
+    def _ram_fits(self, expected_bytes):
+        if not self.ram_dir: return False
+        try:
+            stats = os.statvfs(self.ram_dir)
+        except OSError:
+            return False
+        with self._lock:
+            reserved_ram = sum(size for path, size in self._active.items() if path.startswith(self.ram_dir))
+        free_bytes = stats.f_bavail * stats.f_frsize * (1 - RAM_FREE_MARGIN) - reserved_ram
+        ram_used = _dir_size(self.ram_dir)
+        return expected_bytes <= free_bytes and ram_used + expected_bytes <= SCRATCH_RAM_MAX_MB * MB
+
+    def create(self, prefix="scratch", expected_bytes=0):
+        """
+        Cria um diretório de trabalho. `expected_bytes` (entradas + intermediários + saída) decide entre RAM e disco
+        e é reservado na quota total. Levanta ScratchQuotaExceeded se a área total não comporta a reserva.
+        """
+        with self._lock:
+            reserved = sum(self._active.values())
+        if self.total_usage() + reserved + expected_bytes > SCRATCH_TOTAL_QUOTA_MB * MB:
+            raise ScratchQuotaExceeded("Espaço temporário do servidor esgotado. Tente novamente em alguns minutos.")
+        root = self.ram_dir if expected_bytes and self._ram_fits(expected_bytes) else self.disk_dir
+        path = os.path.join(root, f"{prefix}-{os.getpid()}-{uuid.uuid4().hex[:8]}")
+        os.makedirs(path)
+        with self._lock:
+            self._active[path] = expected_bytes
+        return path
+
+    def check(self, path):
+        """Levanta ScratchQuotaExceeded se o diretório passou da quota por diretório (chamar entre etapas pesadas)."""
+        used = _dir_size(path)
+        if used > SCRATCH_DIR_QUOTA_MB * MB:
+            raise ScratchQuotaExceeded(f"Arquivos temporários excederam {SCRATCH_DIR_QUOTA_MB} MB.")
+        return used
+
+    def release(self, path):
+        with self._lock:
+            self._active.pop(path, None)
+        shutil.rmtree(path, ignore_errors=True)
+
+    def sweep_orphans(self):
+        """Remove diretórios cujo processo dono morreu ou que passaram de SCRATCH_ORPHAN_HOURS."""
+        removed = 0; now = time.time()
+        for root in self._roots():
+            try:
+                entries = os.listdir(root)
+            except OSError:
+                continue
+            for name in entries:
+                path = os.path.join(root, name)
+                with self._lock:
+                    if path in self._active: continue
+                parts = name.rsplit("-", 2)
+                try:
+                    owner_dead = len(parts) == 3 and not _pid_alive(int(parts[1]))
+                    too_old = now - os.path.getmtime(path) > SCRATCH_ORPHAN_HOURS * 3600
+                except (ValueError, OSError):
+                    continue
+                if owner_dead or too_old:
+                    shutil.rmtree(path, ignore_errors=True) if os.path.isdir(path) else os.unlink(path)
+                    removed += 1
+        if removed: log.info(f"{removed} diretório(s) temporário(s) órfão(s) removido(s).")
+        return removed
+
+    def _janitor_loop(self):
+        while True:
+            time.sleep(JANITOR_INTERVAL_SECONDS)
+            try:
+                self.sweep_orphans()
+            except Exception as e:
+                log.warning(f"Erro na limpeza de temporários: {e}")
+
+
+_scratch = None
+_scratch_lock = threading.Lock()
+
+
+def get_scratch_space():
+    global _scratch
+    with _scratch_lock:
+        if _scratch is None:
+            _scratch = ScratchSpace()
+        return _scratch
+
+
+@contextlib.contextmanager
+def scratch_dir(prefix="scratch", expected_bytes=0):
+    """Substituto de tempfile.TemporaryDirectory: RAM quando couber, disco caso contrário, sempre removido ao sair."""
+    space = get_scratch_space()
+    path = space.create(prefix, expected_bytes)
+    try:
+        yield path
+    finally:
+        space.release(path)
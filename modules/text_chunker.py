@@ -0,0 +1,78 @@
+import re
+
+# Estimativa de tokens sem depender do tokenizador de cada provedor (português fica perto de 3,5 caracteres/token)
+CHARS_PER_TOKEN = 3.5
+
+# Fronteiras preferidas, da mais forte para a mais fraca: parágrafo, frase, palavra
+_BOUNDARIES = [re.compile(r"(\n\s*\n)"), re.compile(r"(?<=[.!?…])(\s+)"), re.compile(r"(\s+)")]
+
+
+def estimate_tokens(text):
+    return int(len(text) / CHARS_PER_TOKEN) + 1
+
+
+class TextChunk:
+    """
+    Trecho de um texto maior. `separator` é o espaço em branco que o precedia no original (para remontar
+    o texto com os mesmos parágrafos) e `context` é o final do trecho anterior, enviado só como contexto.
+    """
+    def __init__(self, text, separator="", context=""):
+        self.text = text
+        self.separator = separator
+        self.context = context
+
+
+def _units(text, max_tokens, level=0):
+    """Gera (separador, pedaço) cortando na fronteira mais forte possível para que cada pedaço caiba em `max_tokens`."""
+    parts = _BOUNDARIES[level].split(text)  # [pedaço, separador, pedaço, separador, ...]
+    separator = ""
+    for idx in range(0, len(parts), 2):
+        piece = parts[idx]
+        if piece:
+            if estimate_tokens(piece) > max_tokens and level + 1 < len(_BOUNDARIES):
+                for sub_idx, (sub_separator, sub_piece) in enumerate(_units(piece, max_tokens, level + 1)):
+                    yield (separator + sub_separator if sub_idx == 0 else sub_separator), sub_piece
+            else:
+                yield separator, piece
+            separator = ""
+        if idx + 1 < len(parts): separator += parts[idx + 1]
+
+
+def _tail(text, max_chars):
+    """Final de `text` com até `max_chars` caracteres, começando numa palavra inteira."""
+    if len(text) <= max_chars: return text
+    cut = text.find(" ", len(text) - max_chars)
+    return text[cut + 1:] if cut != -1 else text[-max_chars:]
+
+
+def split_text(text, max_tokens, context_tokens=60):
+    """
+    Divide `text` em TextChunks de até ~`max_tokens`, preferindo quebrar entre parágrafos, depois entre frases e só
+    em último caso entre palavras. Cada trecho leva o final do anterior (~`context_tokens`) como contexto.
+    """
+    chunks, current, current_tokens = [], [], 0
+
+    def flush():
+        body = current[0][1] + "".join(separator + piece for separator, piece in current[1:])
+        context = _tail(chunks[-1].text, int(context_tokens * CHARS_PER_TOKEN)) if chunks and context_tokens else ""
+        chunks.append(TextChunk(body, current[0][0], context))
+
+    for separator, piece in _units(text.strip(), max_tokens):
+        tokens = estimate_tokens(separator + piece)
+        if current and current_tokens + tokens > max_tokens:
+            flush(); current, current_tokens = [], 0
+        current.append((separator, piece)); current_tokens += tokens
+    if current: flush()
+    if chunks: chunks[0].separator = ""
+    return chunks
+
+
+def split_paragraphs(text):
+    """Lista de (separador, parágrafo) do texto, com o espaço em branco original antes de cada parágrafo."""
+    parts = _BOUNDARIES[0].split(text.strip())
+    return [(parts[idx - 1] if idx else "", parts[idx]) for idx in range(0, len(parts), 2) if parts[idx]]
+
+
+def join_chunks(chunks, texts):
+    """Remonta o texto na ordem original, com os separadores originais entre os trechos (`texts` corrigidos)."""
+    return "".join((chunk.separator if idx else "") + text.strip() for idx, (chunk, text) in enumerate(zip(chunks, texts)))
@@ -1,12 +1,28 @@
 import os
+import queue
+import asyncio
 import logging
+import threading
 from openai import OpenAI
-from dotenv import load_dotenv
+from modules.llm_client import get_router, get_llm_client, create_completion, open_stream, run_async, submit_async
+from modules.text_chunker import split_text, split_paragraphs, join_chunks, estimate_tokens
+from modules.llm_cache import get_llm_cache, prompt_version, split_response_paragraphs
 
 # Configuração básica de logging
 logging.basicConfig(level=logging.INFO)
 log = logging.getLogger(__name__) # Logger específico para este módulo
 
+# Textos longos são divididos em trechos (parágrafos/frases) enviados em paralelo, com limite de chamadas simultâneas
+LLM_CHUNK_TOKENS = int(os.getenv("LLM_CHUNK_TOKENS", "1500"))
+LLM_MAX_CONCURRENCY = int(os.getenv("LLM_MAX_CONCURRENCY", "4"))
+
+CORRECT_TEXT_SYSTEM_PROMPT = "Você é um revisor de texto experiente, focado em corrigir erros gramaticais e ortográficos do Português Brasileiro, mantendo o sentido original."
+CORRECT_TEXT_INSTRUCTION = "Corrija o seguinte texto aplicando as normas padrões da língua portuguesa. Retorne APENAS o texto corrigido, sem introduções, explicações ou formatação extra (como ```)"
+CORRECT_TRANSCRIPTION_SYSTEM_PROMPT = """Você é um especialista em transcrever e revisar textos de áudios em português brasileiro, especialmente de contextos formais como audiências ou depoimentos. Sua tarefa é pegar a transcrição bruta fornecida e corrigi-la para torná-la clara, gramaticalmente correta e com pontuação adequada. Preste atenção especial a possíveis nomes próprios, patentes militares (Ex: Capitão, Sargento), termos jurídicos ou técnicos, e tente interpretá-los corretamente mesmo que a transcrição inicial esteja confusa. Mantenha o sentido original do que foi dito."""
+# Temperatura um pouco maior para permitir alguma reestruturação/interpretação (também entra na chave do refinado em cache)
+CORRECT_TRANSCRIPTION_TEMPERATURE = 0.5
+CORRECT_TRANSCRIPTION_INSTRUCTION = "Corrija e refine a seguinte transcrição de áudio. Retorne APENAS o texto final corrigido e refinado, sem introduções, comentários ou formatação extra (como ```)"
+
 class TextCorrector:
     """
     Classe responsável por interagir com uma API de LLM (compatível com OpenAI)
@@ -15,26 +31,17 @@ class TextCorrector:
     """
     def __init__(self):
         """
-        Inicializa o TextCorrector carregando as configurações da API
-        e instanciando o cliente OpenAI.
+        Inicializa o TextCorrector com as configurações da API. Construção barata (as páginas criam um a cada
+        rerun): os clientes, o pool de conexões e o roteamento entre endpoints (LLM_ENDPOINTS) são compartilhados
+        no processo (modules.llm_client). Os atributos abaixo descrevem o endpoint principal.
         """
-        load_dotenv() # Carrega variáveis do arquivo .env, se existir
-
-        # Lê as configurações do ambiente
-        self.api_key = os.getenv("OPENAI_API_KEY")
-        self.base_url = os.getenv("OPENAI_BASE_URL", "https://api.deepseek.com") # Default DeepSeek
-        self.model_name = os.getenv("OPENAI_MODEL_NAME", "deepseek-chat") # Default DeepSeek model
-
-        self.client = None # Inicializa o cliente como None
-
-        # Tenta inicializar o cliente OpenAI se a chave API for fornecida
-        if self.api_key:
-            try:
-                self.client = OpenAI(api_key=self.api_key, base_url=self.base_url)
-                log.info(f"Cliente OpenAI inicializado. Base URL: {self.base_url}, Modelo padrão: {self.model_name}")
-            except Exception as e:
-                 log.error(f"Erro ao inicializar cliente OpenAI com Base URL '{self.base_url}': {e}", exc_info=True)
-        else:
+        self.router = get_router()
+        primary = self.router.endpoints[0] if self.router.endpoints else None
+        self.api_key = primary.api_key if primary else None
+        self.base_url = primary.base_url if primary else None
+        self.model_name = primary.model if primary else None
+        self.client = get_llm_client()
+        if not self.api_key:
             log.warning("API Key (OPENAI_API_KEY) não encontrada no ambiente ou arquivo .env. Funções de correção via API estarão desabilitadas.")
 
     def is_configured(self) -> bool:
@@ -56,13 +63,239 @@ class TextCorrector:
         """
         return self.client
 
-    def correct_text(self, text: str) -> str | None:
+    def _chunk_messages(self, chunk, system_prompt, instruction):
+        """Mensagens de um trecho. O final do trecho anterior vai como contexto, para não ser repetido na resposta."""
+        context = ""
+        if chunk.context:
+            context = f'Trecho imediatamente anterior, apenas para contexto (NÃO o inclua na resposta): "{chunk.context}"\n\n'
+        return [
+            {"role": "system", "content": system_prompt},
+            {"role": "user", "content": f"{context}{instruction}: {chunk.text}"},
+        ]
+
+    async def _complete_chunks(self, chunks, system_prompt, instruction, temperature, extra_tokens):
+        """
+        Envia os trechos em paralelo (no máximo LLM_MAX_CONCURRENCY ao mesmo tempo). Retorna, por trecho,
+        (texto, modelo que respondeu); trechos com erro viram None.
+        """
+        semaphore = asyncio.Semaphore(LLM_MAX_CONCURRENCY)
+
+        async def complete(idx, chunk):
+            async with semaphore:
+                try:
+                    endpoint, response = await create_completion(
+                        messages=self._chunk_messages(chunk, system_prompt, instruction),
+                        temperature=temperature,
+                        max_tokens=int(estimate_tokens(chunk.text) * 1.5) + extra_tokens
+                    )
+                except Exception as e:
+                    log.error(f"Erro ao chamar API no trecho {idx + 1}/{len(chunks)} (todos os endpoints): {e}")
+                    return None
+            if response.choices and response.choices[0].message and response.choices[0].message.content:
+                return response.choices[0].message.content.strip(), endpoint.model
+            log.warning(f"Resposta da API inesperada ou vazia no trecho {idx + 1}/{len(chunks)}: {response}")
+            return None
+        return await asyncio.gather(*(complete(idx, chunk) for idx, chunk in enumerate(chunks)))
+
+    def _cache_plan(self, text, system_prompt, instruction, temperature):
+        """
+        Consulta o cache de respostas: primeiro o documento inteiro, depois cada parágrafo. Retorna
+        (chave exata, texto em cache ou None, segmentos). Cada segmento é um parágrafo reaproveitado ("cached") ou
+        uma sequência de parágrafos consecutivos sem cache, já dividida em trechos ("chunks") para a API.
+        """
+        cache = get_llm_cache()
+        prompt = prompt_version(system_prompt, instruction)
+        exact_key = cache.make_key(self.model_name, prompt, temperature, text)
+        cached_text = cache.get(exact_key, level="exact")
+        if cached_text is not None:
+            log.info("Cache de respostas da IA: texto idêntico já corrigido.")
+            return exact_key, cached_text, None
+        paragraphs = [(separator, paragraph, cache.make_key(self.model_name, prompt, temperature, paragraph)) for separator, paragraph in split_paragraphs(text)]
+        found = cache.get_many([key for _, _, key in paragraphs], level="paragraph")
+        segments = []
+        for separator, paragraph, key in paragraphs:
+            if key in found:
+                segments.append({"separator": separator, "cached": found[key]})
+            elif segments and segments[-1]["cached"] is None:
+                segments[-1]["text"] += separator + paragraph
+                segments[-1]["keys"].append(key)
+            else:
+                segments.append({"separator": separator, "cached": None, "text": paragraph, "keys": [key]})
+        for segment in segments:
+            if segment["cached"] is None: segment["chunks"] = split_text(segment["text"], LLM_CHUNK_TOKENS)
+        reused = sum(key in found for _, _, key in paragraphs)
+        if reused: log.info(f"Cache de respostas da IA: {reused} de {len(paragraphs)} parágrafo(s) reaproveitado(s).")
+        return exact_key, None, segments
+
+    def _store_segment(self, segment, corrected, models):
+        """
+        Guarda a resposta de cada parágrafo da sequência, se a IA manteve a divisão em parágrafos e se todos os
+        trechos vieram do modelo principal (`models`): as chaves são do modelo principal, e uma resposta de
+        failover guardada nelas passaria a ser servida como se fosse dele.
+        """
+        if models != {self.model_name}:
+            log.info(f"Resposta de outro modelo ({', '.join(sorted(models))}); não guardada no cache.")
+            return
+        corrected_paragraphs = split_response_paragraphs(corrected)
+        if len(corrected_paragraphs) == len(segment["keys"]):
+            get_llm_cache().put_many(list(zip(segment["keys"], corrected_paragraphs)))
+        else:
+            log.info(f"Resposta com {len(corrected_paragraphs)} parágrafo(s) para {len(segment['keys'])} enviados; não guardada por parágrafo.")
+
+    def _correct_in_chunks(self, text, system_prompt, instruction, temperature, extra_tokens, models=None):
+        """
+        Divide o texto em trechos de até LLM_CHUNK_TOKENS nas fronteiras de parágrafo/frase, corrige todos em
+        paralelo e remonta na ordem original. O tempo total acompanha o maior trecho, não o tamanho do texto.
+        Parágrafos já corrigidos antes (cache) não são reenviados. `models` (conjunto) recebe os modelos que responderam.
+        Retorna None se algum trecho falhar (o texto parcialmente corrigido seria enganoso).
+        """
+        models = set() if models is None else models
+        exact_key, cached_text, segments = self._cache_plan(text, system_prompt, instruction, temperature)
+        if cached_text is not None:
+            models.add(self.model_name)
+            return cached_text
+        chunks = [chunk for segment in segments if segment["cached"] is None for chunk in segment["chunks"]]
+        results = []
+        if chunks:
+            log.info(f"Enviando {len(chunks)} trecho(s) para a API (até {LLM_MAX_CONCURRENCY} simultâneos)...")
+            results = run_async(self._complete_chunks(chunks, system_prompt, instruction, temperature, extra_tokens))
+            if any(result is None for result in results):
+                log.error(f"{sum(result is None for result in results)} de {len(chunks)} trecho(s) falharam na API.")
+                return None
+        results = iter(results)
+        parts, used = [], set()
+        for segment in segments:
+            if segment["cached"] is None:
+                answers = [next(results) for _ in segment["chunks"]]
+                segment_models = {model for _, model in answers}
+                corrected = join_chunks(segment["chunks"], [answer for answer, _ in answers])
+                self._store_segment(segment, corrected, segment_models)
+            else:
+                corrected, segment_models = segment["cached"], {self.model_name}
+            used |= segment_models
+            parts.append(segment["separator"] + corrected)
+        corrected_text = "".join(parts)
+        if used == {self.model_name}: get_llm_cache().put(exact_key, corrected_text)
+        models |= used
+        return corrected_text
+
+    def _stream_chunks(self, chunks, system_prompt, instruction, temperature, extra_tokens, chunk_models):
+        """
+        Versão em fluxo de _complete_chunks: os trechos continuam sendo corrigidos em paralelo (no loop asyncio
+        compartilhado do cliente), mas o texto é entregue na ordem original, token a token, como pares
+        (índice do trecho, pedaço), com (índice, None) ao fim de cada trecho. O primeiro trecho aparece assim
+        que a API começa a responder; os seguintes já chegam prontos ou em andamento.
+        `chunk_models[índice]` recebe o modelo que respondeu cada trecho (preenchido antes do fim do trecho).
+        Levanta RuntimeError se algum trecho falhar.
+        """
+        if not chunks: return
+        deltas = [queue.Queue() for _ in chunks]  # um fluxo por trecho; None marca o fim
+        stop = threading.Event()
+
+        async def produce():
+            semaphore = asyncio.Semaphore(LLM_MAX_CONCURRENCY)
+
+            async def stream_chunk(idx, chunk):
+                async with semaphore:
+                    if stop.is_set(): return
+                    try:
+                        endpoint, stream = await open_stream(
+                            messages=self._chunk_messages(chunk, system_prompt, instruction),
+                            temperature=temperature,
+                            max_tokens=int(estimate_tokens(chunk.text) * 1.5) + extra_tokens
+                        )
+                        chunk_models[idx] = endpoint.model
+                        try:
+                            async for event in stream:
+                                if stop.is_set(): await stream.response.aclose(); return
+                                if event.choices and event.choices[0].delta.content: deltas[idx].put(event.choices[0].delta.content)
+                        except Exception:
+                            endpoint.record_failure()  # tokens já entregues: não dá para continuar em outro endpoint
+                            raise
+                        deltas[idx].put(None)
+                    except Exception as e:
+                        log.error(f"Erro ao chamar API (fluxo) no trecho {idx + 1}/{len(chunks)}: {e}")
+                        deltas[idx].put(e)
+            await asyncio.gather(*(stream_chunk(idx, chunk) for idx, chunk in enumerate(chunks)))
+
+        log.info(f"Enviando {len(chunks)} trecho(s) para a API em fluxo (até {LLM_MAX_CONCURRENCY} simultâneos)...")
+        submit_async(produce())
+        try:
+            for idx in range(len(chunks)):
+                started = False
+                while (delta := deltas[idx].get()) is not None:
+                    if isinstance(delta, Exception): raise RuntimeError("Falha na API de correção.") from delta
+                    if not started: delta = delta.lstrip(); started = bool(delta)
+                    if delta: yield idx, delta
+                yield idx, None
+        finally:
+            stop.set()  # leitor abandonou o fluxo (ex.: rerun do Streamlit): os trechos restantes são interrompidos
+
+    def _stream_in_chunks(self, text, system_prompt, instruction, temperature, extra_tokens, models=None):
+        """
+        Gera o texto corrigido em ordem: parágrafos em cache saem na hora, os demais token a token (_stream_chunks).
+        `models` (conjunto) recebe os modelos que responderam.
+        """
+        models = set() if models is None else models
+        exact_key, cached_text, segments = self._cache_plan(text, system_prompt, instruction, temperature)
+        if cached_text is not None:
+            models.add(self.model_name)
+            yield cached_text
+            return
+        chunks = [chunk for segment in segments if segment["cached"] is None for chunk in segment["chunks"]]
+        chunk_models = [None] * len(chunks)
+        pending = self._stream_chunks(chunks, system_prompt, instruction, temperature, extra_tokens, chunk_models)
+        parts, used, next_chunk = [], set(), 0
+        try:
+            for segment in segments:
+                yield segment["separator"]
+                if segment["cached"] is not None:
+                    yield segment["cached"]
+                    parts.append(segment["separator"] + segment["cached"])
+                    used.add(self.model_name)
+                    continue
+                texts = []
+                for position, chunk in enumerate(segment["chunks"]):
+                    if position: yield chunk.separator
+                    pieces = []
+                    for _, delta in pending:
+                        if delta is None: break
+                        pieces.append(delta)
+                        yield delta
+                    texts.append("".join(pieces))
+                segment_models = set(chunk_models[next_chunk:next_chunk + len(segment["chunks"])])
+                next_chunk += len(segment["chunks"])
+                corrected = join_chunks(segment["chunks"], texts)
+                self._store_segment(segment, corrected, segment_models)
+                used |= segment_models
+                parts.append(segment["separator"] + corrected)
+        finally:
+            pending.close()
+            models |= used
+        if used == {self.model_name}: get_llm_cache().put(exact_key, "".join(parts))
+
+    def stream_correct_text(self, text: str, models: set | None = None):
+        """Como correct_text, mas gera o texto corrigido aos pedaços (para st.write_stream). Levanta RuntimeError em falha."""
+        if not self.is_configured(): raise RuntimeError("API de correção não configurada.")
+        if not text or not text.strip(): return
+        yield from self._stream_in_chunks(text, CORRECT_TEXT_SYSTEM_PROMPT, CORRECT_TEXT_INSTRUCTION, temperature=0.3, extra_tokens=150, models=models)
+
+    def stream_correct_transcription(self, text: str, models: set | None = None):
+        """Como correct_transcription, mas gera o texto refinado aos pedaços. Levanta RuntimeError em falha."""
+        if not self.is_configured(): raise RuntimeError("API de correção não configurada.")
+        if not text or not text.strip(): return
+        yield from self._stream_in_chunks(
+            text, CORRECT_TRANSCRIPTION_SYSTEM_PROMPT, CORRECT_TRANSCRIPTION_INSTRUCTION, temperature=CORRECT_TRANSCRIPTION_TEMPERATURE, extra_tokens=250, models=models
+        )
+
+    def correct_text(self, text: str, models: set | None = None) -> str | None:
         """
         Corrige um texto genérico usando a API configurada.
-        Foca em aplicar normas padrão da língua portuguesa.
+        Foca em aplicar normas padrão da língua portuguesa. Textos longos são corrigidos em trechos paralelos.
 
         Args:
             text: O texto a ser corrigido.
+            models: Conjunto opcional que recebe os modelos que de fato responderam (failover entre endpoints).
 
         Returns:
             O texto corrigido como string, ou None se ocorrer um erro ou a API não estiver configurada.
@@ -74,41 +307,22 @@ class TextCorrector:
             log.debug("correct_text chamado com texto vazio.")
             return "" # Retorna string vazia para input vazio
 
-        try:
-            log.info(f"Enviando texto para correção genérica via API...")
-            response = self.client.chat.completions.create(
-                model=self.model_name, # Usa o modelo definido na inicialização
-                messages=[
-                    {"role": "system",
-                     "content": "Você é um revisor de texto experiente, focado em corrigir erros gramaticais e ortográficos do Português Brasileiro, mantendo o sentido original."},
-                    {"role": "user",
-                     "content": f'Corrija o seguinte texto aplicando as normas padrões da língua portuguesa. Retorne APENAS o texto corrigido, sem introduções, explicações ou formatação extra (como ```): {text}'}
-                ],
-                temperature=0.3, # Temperatura baixa para manter o texto próximo ao original
-                max_tokens=int(len(text.split()) * 1.5) + 150 # Estimativa segura para max_tokens
-            )
-
-            # Extrai e limpa a resposta
-            if response.choices and response.choices[0].message and response.choices[0].message.content:
-                corrected_text = response.choices[0].message.content.strip()
-                log.info("Texto corrigido (genérico) recebido da API.")
-                return corrected_text
-            else:
-                log.warning(f"Resposta da API de correção genérica inesperada ou vazia: {response}")
-                return None # Retorna None se a resposta não for válida
+        corrected_text = self._correct_in_chunks(
+            text, CORRECT_TEXT_SYSTEM_PROMPT, CORRECT_TEXT_INSTRUCTION,
+            temperature=0.3, # Temperatura baixa para manter o texto próximo ao original
+            extra_tokens=150, models=models
+        )
+        if corrected_text is not None: log.info("Texto corrigido (genérico) recebido da API.")
+        return corrected_text
 
-        except Exception as e:
-            # Captura e loga erros durante a chamada da API
-            log.error(f"Erro ao chamar API de correção genérica ({self.base_url}): {e}", exc_info=True)
-            return None # Retorna None para indicar erro na API
-
-    def correct_transcription(self, text: str) -> str | None:
+    def correct_transcription(self, text: str, models: set | None = None) -> str | None:
         """
         Refina e corrige uma transcrição de áudio (possivelmente de audiência) usando a API.
-        Usa um prompt específico para o contexto de transcrições.
+        Usa um prompt específico para o contexto de transcrições. Transcrições longas são refinadas em trechos paralelos.
 
         Args:
             text: A transcrição bruta a ser corrigida/refinada.
+            models: Conjunto opcional que recebe os modelos que de fato responderam (failover entre endpoints).
 
         Returns:
             O texto refinado como string, ou None se ocorrer um erro ou a API não estiver configurada.
@@ -120,31 +334,10 @@ class TextCorrector:
             log.debug("correct_transcription chamado com texto vazio.")
             return "" # Retorna string vazia para input vazio
 
-        try:
-            log.info(f"Enviando transcrição para correção/refinamento via API...")
-            response = self.client.chat.completions.create(
-                model=self.model_name, # Usa o modelo definido na inicialização
-                messages=[
-                    {"role": "system",
-                     "content": """Você é um especialista em transcrever e revisar textos de áudios em português brasileiro, especialmente de contextos formais como audiências ou depoimentos. Sua tarefa é pegar a transcrição bruta fornecida e corrigi-la para torná-la clara, gramaticalmente correta e com pontuação adequada. Preste atenção especial a possíveis nomes próprios, patentes militares (Ex: Capitão, Sargento), termos jurídicos ou técnicos, e tente interpretá-los corretamente mesmo que a transcrição inicial esteja confusa. Mantenha o sentido original do que foi dito."""
-                    },
-                    {"role": "user",
-                     "content": f'Corrija e refine a seguinte transcrição de áudio. Retorne APENAS o texto final corrigido e refinado, sem introduções, comentários ou formatação extra (como ```): {text}'}
-                ],
-                temperature=0.5, # Temperatura um pouco maior para permitir alguma reestruturação/interpretação
-                max_tokens=int(len(text.split()) * 1.5) + 250 # Estimativa mais generosa para refinamento
-            )
-
-            # Extrai e limpa a resposta
-            if response.choices and response.choices[0].message and response.choices[0].message.content:
-                corrected_text = response.choices[0].message.content.strip()
-                log.info("Transcrição corrigida/refinada recebida da API.")
-                return corrected_text
-            else:
-                 log.warning(f"Resposta da API de correção de transcrição inesperada ou vazia: {response}")
-                 return None # Retorna None se a resposta não for válida
-
-        except Exception as e:
-            # Captura e loga erros durante a chamada da API
-            log.error(f"Erro ao chamar API de correção de transcrição ({self.base_url}): {e}", exc_info=True)
-            return None # Retorna None para indicar erro na API
+        corrected_text = self._correct_in_chunks(
+            text, CORRECT_TRANSCRIPTION_SYSTEM_PROMPT, CORRECT_TRANSCRIPTION_INSTRUCTION,
+            temperature=CORRECT_TRANSCRIPTION_TEMPERATURE,
+            extra_tokens=250, models=models
+        )
+        if corrected_text is not None: log.info("Transcrição corrigida/refinada recebida da API.")
+        return corrected_text
@@ -0,0 +1,89 @@
+import os
+import re
+import time
+import logging
+import argparse
+import unicodedata
+import whisper
+from modules.media_converter import WHISPER_MODEL_NAME, load_whisper_weights
+
+logging.basicConfig(level=logging.INFO)
+log = logging.getLogger(__name__)
+
+VARIANTS = {"fp32": "", "int8": "int8"}
+
+
+def _normalize_words(text):
+    """Minúsculas, sem acentos nem pontuação: a comparação mede palavras, não formatação."""
+    text = unicodedata.normalize("NFKD", text.lower())
+    text = "".join(char for char in text if not unicodedata.combining(char))
+    return re.findall(r"[a-z0-9]+", text)
+
+
+def word_error_rate(reference, hypothesis):
+    """WER = (substituições + inserções + remoções) / palavras da referência (distância de edição por palavra)."""
+    ref, hyp = _normalize_words(reference), _normalize_words(hypothesis)
+    if not ref: return 0.0 if not hyp else 1.0
+    previous = list(range(len(hyp) + 1))
+    for i, ref_word in enumerate(ref, start=1):
+        current = [i] + [0] * len(hyp)
+        for j, hyp_word in enumerate(hyp, start=1):
+            current[j] = min(previous[j] + 1, current[j - 1] + 1, previous[j - 1] + (ref_word != hyp_word))
+        previous = current
+    return previous[-1] / len(ref)
+
+
+def _reference_for(audio_path):
+    """Transcrição de referência opcional: arquivo .txt com o mesmo nome do áudio."""
+    reference_path = os.path.splitext(audio_path)[0] + ".txt"
+    if not os.path.exists(reference_path): return None
+    with open(reference_path, "r", encoding="utf-8") as f: return f.read()
+
+
+def run_benchmark(audio_paths, variants, model_name=WHISPER_MODEL_NAME, threads=None):
+    """
+    Transcreve cada áudio com cada variante e mede carga do modelo, tempo de transcrição, fator de tempo real e WER.
+    Sem referência (.txt ao lado do áudio), a WER é medida contra a saída da primeira variante.
+    """
+    import torch
+    if threads: torch.set_num_threads(threads)
+    audios = {path: whisper.load_audio(path) for path in audio_paths}
+    outputs, rows = {}, []
+    for variant in variants:
+        started = time.perf_counter()
+        model = load_whisper_weights(model_name, quantize=VARIANTS[variant])
+        load_seconds = time.perf_counter() - started
+        for path, audio in audios.items():
+            started = time.perf_counter()
+            text = model.transcribe(audio, language='pt', fp16=False)["text"]
+            seconds = time.perf_counter() - started
+            outputs[(variant, path)] = text
+            reference = _reference_for(path)
+            baseline = reference if reference is not None else outputs[(variants[0], path)]
+            rows.append({
+                "variant": variant, "audio": os.path.basename(path), "load_s": load_seconds, "transcribe_s": seconds,
+                "rtf": seconds / (len(audio) / whisper.audio.SAMPLE_RATE),
+                "wer": word_error_rate(baseline, text), "wer_ref": "referência" if reference is not None else variants[0],
+            })
+        del model
+    return rows
+
+
+def _print_table(rows):
+    print(f"{'variante':<8} {'áudio':<30} {'carga(s)':>9} {'transcr.(s)':>11} {'RTF':>6} {'WER':>7}  base WER")
+    for row in rows:
+        print(f"{row['variant']:<8} {row['audio'][:30]:<30} {row['load_s']:>9.1f} {row['transcribe_s']:>11.1f} "
+              f"{row['rtf']:>6.2f} {row['wer']:>6.1%}  {row['wer_ref']}")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(
+        description="Compara velocidade e precisão do Whisper fp32 e int8 em áudios de exemplo "
+                    "(referência opcional: .txt com o mesmo nome do áudio)."
+    )
+    parser.add_argument("audio", nargs="+", help="Arquivos de áudio em português.")
+    parser.add_argument("--model", default=WHISPER_MODEL_NAME, help="Modelo Whisper (padrão: o da aplicação).")
+    parser.add_argument("--variants", nargs="+", choices=list(VARIANTS), default=list(VARIANTS), help="Variantes a comparar.")
+    parser.add_argument("--threads", type=int, default=None, help="Threads do torch (padrão: todas).")
+    args = parser.parse_args()
+    _print_table(run_benchmark(args.audio, args.variants, args.model, args.threads))
@@ -1,5 +1,10 @@
 import streamlit as st
-from modules.pdf_transformer import PDFTransformer
+from modules.pdf_transformer import (
+    PDFTransformer, spool_to_file, OCR_MODE_AUTO, OCR_MODE_FULL, COMPRESSION_ENGINE_GS, COMPRESSION_ENGINE_IMAGES
+)
+from modules.job_queue import get_job_manager, STATUS_DONE, STATUS_CANCELLED
+from modules.job_ui import remember_job, recall_job, forget_job, render_job_lookup, wait_for_job
+from modules.scratch import get_scratch_space
 import os
 import tempfile
 import io
@@ -12,6 +17,7 @@ MAX_SIZE_BYTES = 500 * 1024 * 1024
 COMPRESS_MIN_SIZE_BYTES = 1 * 1024 * 1024 # 1 MB (Mínimo para compressão)
 MAX_SIZE_MB = MAX_SIZE_BYTES / (1024 * 1024)
 COMPRESS_MIN_SIZE_MB = COMPRESS_MIN_SIZE_BYTES / (1024 * 1024)
+PDF_JOB_KEY = "pdf_job"
 
 
 def validate_file_size(uploaded_file, operation_type):
@@ -23,6 +29,68 @@ def validate_file_size(uploaded_file, operation_type):
         return False
     return True # Retorna True se estiver dentro do limite máximo
 
+def render_compression_metrics(original_size, final_size):
+    reduction_percent = (1 - (final_size / original_size)) * 100 if original_size > 0 else 0
+    st.markdown('<div class="compress-metrics">', unsafe_allow_html=True)
+    cols = st.columns(3)
+    with cols[0]: st.metric("Tam. Original", f"{original_size:.2f} MB")
+    with cols[1]: st.metric("Tam. Final", f"{final_size:.2f} MB", f"-{reduction_percent:.1f}%" if reduction_percent >= 0.1 else None, delta_color="inverse")
+    with cols[2]: st.metric("Economia", f"{(original_size - final_size):.2f} MB")
+    st.progress(min(max(reduction_percent, 0) / 100, 1.0))
+    st.markdown('</div>', unsafe_allow_html=True)
+
+def submit_pdf_job(task, params, inputs):
+    """Envia a operação para a fila de processamento e recarrega a página para acompanhar o andamento."""
+    job_id = get_job_manager().submit(task, params, inputs)
+    remember_job(PDF_JOB_KEY, job_id)
+    st.rerun()
+
+def render_pdf_job(job_id):
+    """Acompanha a tarefa da fila e, ao final, exibe o resultado com o botão de download."""
+    with st.container(border=True):
+        job = get_job_manager().get(job_id)
+        st.markdown(f"**Tarefa: {(job or {}).get('params', {}).get('label', 'Processamento de arquivo')}**")
+        job = wait_for_job(job_id, PDF_JOB_KEY)
+        if job is None:
+            st.error("❌ Tarefa não encontrada.")
+        elif job["status"] == STATUS_DONE:
+            params, result = job["params"], job["result"] or {}
+            st.success(f"✅ {params.get('success_message', 'Processamento concluído!')}")
+            if params.get("show_metrics") and "original_size_mb" in result:
+                render_compression_metrics(result["original_size_mb"], result["final_size_mb"])
+                if result.get("preset"): st.caption(f"Configuração escolhida: {result['preset']}")
+                if result.get("target_met") is False:
+                    st.warning(f"⚠️ Não foi possível chegar a {params['target_size_mb']:.0f} MB; este é o menor arquivo obtido.")
+            elif "original_size_mb" in result:
+                st.info(f"Tamanho original: {result['original_size_mb']:.2f} MB | Tamanho final: {result['final_size_mb']:.2f} MB")
+            result_path = get_job_manager().output_path(job_id, result.get("output", ""))
+            if os.path.exists(result_path):
+                with open(result_path, "rb") as result_file:
+                    st.download_button(
+                        label=f"📄 Baixar {params.get('download_name', 'resultado')}", data=result_file,
+                        file_name=params.get("download_name", "resultado"), mime=params.get("mimetype", "application/octet-stream"),
+                        key="download_job_button", use_container_width=True
+                    )
+            else: st.error("❌ O arquivo de resultado não está mais disponível.")
+        elif job["status"] == STATUS_CANCELLED:
+            st.warning("⚠️ Tarefa cancelada.")
+        else:
+            st.error(f"❌ {job['params'].get('failure_message', 'Falha no processamento.')}")
+            if job.get("error"): st.caption(f"Detalhe: {job['error']}")
+        if st.button("Nova operação", key="new_operation_btn", use_container_width=True):
+            forget_job(PDF_JOB_KEY)
+            st.rerun()
+
+def get_work_dir(expected_bytes=0):
+    """
+    Diretório de trabalho desta execução (em RAM quando couber, ver modules/scratch.py); entradas e resultados
+    ficam nele até o botão de download ser montado.
+    """
+    global temp_dir_path
+    if not temp_dir_path:
+        temp_dir_path = get_scratch_space().create("ferramentas_pdf", expected_bytes)
+    return temp_dir_path
+
 # --- Configuração da Página ---
 st.set_page_config(
     page_title="Ferramentas PDF - 7ºBPM/P-6", page_icon="📄",
@@ -91,6 +159,13 @@ st.markdown("Selecione a operação desejada e faça upload dos arquivos.")
 # --- Inicialização e Seleção ---
 pdf_processor = PDFTransformer()
 
+# --- Tarefa em andamento (OCR, compressão e conversões via LibreOffice rodam na fila de processamento) ---
+active_job_id = recall_job(PDF_JOB_KEY)
+if active_job_id:
+    render_pdf_job(active_job_id)
+    st.stop()
+render_job_lookup(PDF_JOB_KEY)
+
 operation_type = st.selectbox(
     "Escolha a operação PDF:",
     (
@@ -110,7 +185,7 @@ operation_type = st.selectbox(
 # --- Lógica e UI ---
 uploaded_file = None
 uploaded_files = []
-output_file_data = None
+output_file_path = None
 output_filename = "resultado"
 output_mimetype = "application/octet-stream"
 processing_triggered = False
@@ -138,36 +213,45 @@ try:
                 # Verifica o tamanho MÁXIMO
                 if validate_file_size(uploaded_file, operation_type):
                     with options_placeholder.container():
-                        compression_level = st.slider(
-                            "Nível de compressão (0=Menor, 4=Maior)", 0, 4, 3, key="compress_level",
-                            help="0: Qualidade alta, menor compressão. 4: Qualidade baixa, maior compressão."
+                        compress_mode = st.radio(
+                            "Modo de compressão", ["Tamanho máximo (MB)", "Nível de compressão"], horizontal=True,
+                            key="compress_mode"
                         )
+                        compression_level, target_size_mb, engine = 3, None, COMPRESSION_ENGINE_GS
+                        if compress_mode == "Tamanho máximo (MB)":
+                            target_size_mb = st.number_input(
+                                "Tamanho máximo do arquivo final (MB)", min_value=1.0, max_value=float(MAX_SIZE_MB),
+                                value=min(10.0, max(1.0, round(file_size_mb / 2))), step=1.0, key="compress_target_mb",
+                                help="Escolhe automaticamente a melhor qualidade que cabe no limite (ex.: limite de anexo do SEI ou do e-mail)."
+                            )
+                        else:
+                            compression_level = st.slider(
+                                "Nível de compressão (0=Menor, 4=Maior)", 0, 4, 3, key="compress_level",
+                                help="0: Qualidade alta, menor compressão. 4: Qualidade baixa, maior compressão."
+                            )
+                            # Sem Ghostscript, o modo por nível ainda funciona recomprimindo só as imagens
+                            images_only = st.checkbox(
+                                "Recomprimir apenas as imagens (mais rápido em PDFs digitalizados)",
+                                value=not pdf_processor.gs_available, disabled=not pdf_processor.gs_available, key="compress_images_only",
+                                help="Reduz e recodifica as imagens (JPEG) sem reescrever o restante do PDF. Textos e fontes ficam intactos."
+                            )
+                            if images_only: engine = COMPRESSION_ENGINE_IMAGES
+                        compress_available = pdf_processor.gs_available or not target_size_mb
+                        if not compress_available: st.error("❌ Ghostscript não detectado. Compressão por tamanho máximo indisponível.")
+                        elif not pdf_processor.gs_available: st.warning("⚠️ Ghostscript não detectado. Apenas as imagens do PDF serão recomprimidas.")
                     processing_triggered = button_placeholder.button(
                         "Comprimir PDF", key="compress_btn", use_container_width=True,
-                        disabled=not pdf_processor.gs_available
+                        disabled=not compress_available
                     )
-                    if not pdf_processor.gs_available: options_placeholder.error("❌ Ghostscript não detectado. Compressão indisponível.")
-
-                    if processing_triggered and pdf_processor.gs_available:
-                        pdf_bytes = uploaded_file.getvalue()
-                        with result_placeholder, st.spinner(f"Comprimindo PDF (Nível {compression_level})..."):
-                            # ... (lógica de compressão e métricas) ...
-                            success, processed_bytes, original_size, final_size = pdf_processor.process_compression_ocr(
-                                pdf_bytes, compression_level=compression_level, apply_ocr=False
-                            )
-                            if success and processed_bytes:
-                                st.success("✅ PDF comprimido com sucesso!")
-                                output_filename = f"comprimido_{uploaded_file.name}"
-                                output_mimetype = "application/pdf"; output_file_data = processed_bytes
-                                reduction_percent = (1 - (final_size / original_size)) * 100 if original_size > 0 else 0
-                                st.markdown('<div class="compress-metrics">', unsafe_allow_html=True)
-                                cols = st.columns(3)
-                                with cols[0]: st.metric("Tam. Original", f"{original_size:.2f} MB")
-                                with cols[1]: st.metric("Tam. Final", f"{final_size:.2f} MB", f"-{reduction_percent:.1f}%" if reduction_percent >= 0.1 else None, delta_color="inverse")
-                                with cols[2]: st.metric("Economia", f"{(original_size - final_size):.2f} MB")
-                                st.progress(min(reduction_percent / 100, 1.0))
-                                st.markdown('</div>', unsafe_allow_html=True)
-                            else: st.error("❌ Falha ao comprimir o PDF.")
+
+                    if processing_triggered and compress_available:
+                        submit_pdf_job("compression_ocr", {
+                            "label": f"Compressão (até {target_size_mb:.0f} MB)" if target_size_mb else f"Compressão (Nível {compression_level})",
+                            "compression_level": compression_level, "target_size_mb": target_size_mb, "engine": engine, "apply_ocr": False,
+                            "download_name": f"comprimido_{uploaded_file.name}", "mimetype": "application/pdf",
+                            "show_metrics": True, "success_message": "PDF comprimido com sucesso!",
+                            "failure_message": "Falha ao comprimir o PDF.",
+                        }, {"input.pdf": uploaded_file})
 
     # --- OCR ---
     elif operation_type == "Tornar PDF Pesquisável (OCR)":
@@ -177,6 +261,11 @@ try:
             )
         if uploaded_file:
             if validate_file_size(uploaded_file, operation_type):
+                 with options_placeholder.container():
+                      force_full_ocr = st.checkbox(
+                           "Refazer OCR em todas as páginas", value=False, key="ocr_force_full",
+                           help="Por padrão, o OCR é aplicado só nas páginas digitalizadas (sem texto); as demais ficam intactas."
+                      )
                  processing_triggered = button_placeholder.button(
                      "Aplicar OCR", key="ocr_btn", use_container_width=True,
                      disabled=not pdf_processor.ocrmypdf_installed
@@ -184,17 +273,14 @@ try:
                  if not pdf_processor.ocrmypdf_installed: options_placeholder.error("❌ OCRmyPDF não detectado. Função indisponível.")
             if processing_triggered and pdf_processor.ocrmypdf_installed:
                  # ... (lógica OCR) ...
-                 pdf_bytes = uploaded_file.getvalue()
-                 with result_placeholder, st.spinner("Aplicando OCR ao PDF... Isso pode demorar."):
-                     success, processed_bytes, original_size, final_size = pdf_processor.process_compression_ocr(
-                         pdf_bytes, compression_level=-1, apply_ocr=True, ocr_language='por'
-                     )
-                     if success and processed_bytes:
-                         st.success("✅ OCR aplicado com sucesso! O PDF agora é pesquisável.")
-                         output_filename = f"ocr_{uploaded_file.name}"
-                         output_mimetype = "application/pdf"; output_file_data = processed_bytes
-                         st.info(f"Tamanho original: {original_size:.2f} MB | Tamanho final: {final_size:.2f} MB")
-                     else: st.error("❌ Falha ao aplicar OCR no PDF.")
+                 submit_pdf_job("compression_ocr", {
+                     "label": "OCR",
+                     "compression_level": -1, "apply_ocr": True, "ocr_language": "por",
+                     "ocr_mode": OCR_MODE_FULL if force_full_ocr else OCR_MODE_AUTO,
+                     "download_name": f"ocr_{uploaded_file.name}", "mimetype": "application/pdf",
+                     "success_message": "OCR aplicado com sucesso! O PDF agora é pesquisável.",
+                     "failure_message": "Falha ao aplicar OCR no PDF.",
+                 }, {"input.pdf": uploaded_file})
 
     # --- JUNTAR PDFs ---
     elif operation_type == "Juntar PDFs":
@@ -219,13 +305,14 @@ try:
 
             if processing_triggered and total_size <= MAX_SIZE_BYTES:
                  # ... (lógica de merge) ...
-                pdf_byte_streams = [file.getvalue() for file in ordered_files]
-                with result_placeholder, st.spinner(f"Juntando {len(pdf_byte_streams)} PDFs..."):
-                    success, result_bytes, message = pdf_processor.merge_pdfs(pdf_byte_streams)
-                    if success and result_bytes:
+                work_dir = get_work_dir(total_size * 2)
+                pdf_paths = [spool_to_file(file, os.path.join(work_dir, f"entrada_{idx:03d}.pdf")) for idx, file in enumerate(ordered_files)]
+                with result_placeholder, st.spinner(f"Juntando {len(pdf_paths)} PDFs..."):
+                    success, result_path, message = pdf_processor.merge_pdf_files(pdf_paths, os.path.join(work_dir, "juntado.pdf"))
+                    if success and result_path:
                         st.success(f"✅ {message}")
                         output_filename = f"pdf_juntado_{int(time.time())}.pdf"
-                        output_mimetype = "application/pdf"; output_file_data = result_bytes
+                        output_mimetype = "application/pdf"; output_file_path = result_path
                     else: st.error(f"❌ Falha ao juntar PDFs: {message}")
         elif uploaded_files and len(uploaded_files) < 2:
             options_placeholder.warning("Selecione pelo menos 2 arquivos PDF para juntar.")
@@ -247,19 +334,18 @@ try:
             if processing_triggered and total_size <= MAX_SIZE_BYTES:
                 # ... (lógica de conversão de imagem) ...
                  with result_placeholder, st.spinner("Convertendo imagens para PDF..."):
-                    image_bytes_list = [file.getvalue() for file in uploaded_files]
-                    with tempfile.NamedTemporaryFile(delete=False, suffix=".pdf") as temp_pdf_file:
-                        output_pdf_path = temp_pdf_file.name
-                    try:
-                        success = pdf_processor.image_to_pdf(image_bytes_list, output_pdf_path)
-                        if success and os.path.exists(output_pdf_path) and os.path.getsize(output_pdf_path) > 0:
-                            st.success("✅ Imagens convertidas para PDF!")
-                            output_filename = f"imagens_convertidas_{int(time.time())}.pdf"
-                            output_mimetype = "application/pdf";
-                            with open(output_pdf_path, "rb") as f: output_file_data = f.read()
-                        else: st.error("❌ Falha ao converter imagens.")
-                    finally:
-                        if os.path.exists(output_pdf_path): os.unlink(output_pdf_path)
+                    work_dir = get_work_dir(total_size * 2)
+                    image_paths = [
+                        spool_to_file(file, os.path.join(work_dir, f"imagem_{idx:04d}{os.path.splitext(file.name)[1].lower()}"))
+                        for idx, file in enumerate(uploaded_files)
+                    ]
+                    output_pdf_path = os.path.join(work_dir, "imagens.pdf")
+                    success = pdf_processor.image_to_pdf(image_paths, output_pdf_path)
+                    if success and os.path.exists(output_pdf_path) and os.path.getsize(output_pdf_path) > 0:
+                        st.success("✅ Imagens convertidas para PDF!")
+                        output_filename = f"imagens_convertidas_{int(time.time())}.pdf"
+                        output_mimetype = "application/pdf"; output_file_path = output_pdf_path
+                    else: st.error("❌ Falha ao converter imagens.")
 
 
     # --- PDF TO DOCX ---
@@ -275,22 +361,20 @@ try:
                  processing_triggered = button_placeholder.button("Converter PDF para DOCX", key="pdf_to_docx_btn", use_container_width=True)
             if processing_triggered:
                  # ... (lógica de conversão pdf->docx) ...
-                 pdf_bytes = uploaded_file.getvalue()
                  with result_placeholder, st.spinner(f"Convertendo PDF para DOCX{' com tentativa de OCR' if apply_ocr_docx else ''}..."):
-                      with tempfile.TemporaryDirectory() as temp_proc_dir:
-                           input_pdf_path = os.path.join(temp_proc_dir, uploaded_file.name)
-                           base_name = os.path.splitext(uploaded_file.name)[0]
-                           output_docx_path = os.path.join(temp_proc_dir, f"{base_name}_{int(time.time())}.docx")
-                           with open(input_pdf_path, "wb") as f: f.write(pdf_bytes)
-                           success = pdf_processor.pdf_to_docx(input_pdf_path, output_docx_path, apply_ocr=apply_ocr_docx)
-                           if success and os.path.exists(output_docx_path) and os.path.getsize(output_docx_path) > 100:
-                                st.success(f"✅ PDF convertido para DOCX!")
-                                output_filename = f"{base_name}.docx"
-                                output_mimetype = "application/vnd.openxmlformats-officedocument.wordprocessingml.document"
-                                with open(output_docx_path, "rb") as f: output_file_data = f.read()
-                           elif success:
-                                st.warning("⚠️ Conversão concluída, mas o arquivo DOCX parece vazio ou muito pequeno. O PDF original pode não conter texto extraível.")
-                           else: st.error("❌ Falha ao converter para DOCX.")
+                      work_dir = get_work_dir(uploaded_file.size * 2)
+                      base_name = os.path.splitext(uploaded_file.name)[0]
+                      input_pdf_path = spool_to_file(uploaded_file, os.path.join(work_dir, uploaded_file.name))
+                      output_docx_path = os.path.join(work_dir, f"{base_name}_{int(time.time())}.docx")
+                      success = pdf_processor.pdf_to_docx(input_pdf_path, output_docx_path, apply_ocr=apply_ocr_docx)
+                      if success and os.path.exists(output_docx_path) and os.path.getsize(output_docx_path) > 100:
+                           st.success(f"✅ PDF convertido para DOCX!")
+                           output_filename = f"{base_name}.docx"
+                           output_mimetype = "application/vnd.openxmlformats-officedocument.wordprocessingml.document"
+                           output_file_path = output_docx_path
+                      elif success:
+                           st.warning("⚠️ Conversão concluída, mas o arquivo DOCX parece vazio ou muito pequeno. O PDF original pode não conter texto extraível.")
+                      else: st.error("❌ Falha ao converter para DOCX.")
 
 
     # --- PDF TO IMAGES (PNG) ---
@@ -299,25 +383,32 @@ try:
              uploaded_file = st.file_uploader(f"Carregue PDF (Máx: {MAX_SIZE_MB:.0f} MB)", type="pdf", key="pdf_upload_img")
         if uploaded_file:
              if validate_file_size(uploaded_file, operation_type):
+                 with options_placeholder.container():
+                      image_dpi = st.select_slider(
+                           "Resolução (DPI)", options=[72, 96, 144, 200, 300], value=144, key="pdf_img_dpi",
+                           help="Resoluções maiores geram imagens mais nítidas, porém maiores e mais lentas de gerar."
+                      )
+                      page_selection = st.text_input(
+                           "Páginas (opcional)", key="pdf_img_pages", placeholder="Ex.: 1-5, 8, 10-  (vazio = todas)"
+                      )
                  processing_triggered = button_placeholder.button("Converter PDF para Imagens", key="pdf_to_img_btn", use_container_width=True)
              if processing_triggered:
                  # ... (lógica pdf->img) ...
-                  pdf_bytes = uploaded_file.getvalue()
-                  with result_placeholder, st.spinner("Convertendo PDF para imagens PNG..."):
-                       with tempfile.TemporaryDirectory() as temp_img_dir:
-                           input_pdf_path = os.path.join(temp_img_dir, "input.pdf");
-                           with open(input_pdf_path, "wb") as f: f.write(pdf_bytes)
-                           image_paths = pdf_processor.pdf_to_image(input_pdf_path, temp_img_dir, image_format='png')
-                           if image_paths:
-                                zip_path = os.path.join(temp_img_dir, "pdf_imagens.zip")
-                                zip_success = pdf_processor.create_zip_from_files(image_paths, zip_path)
-                                if zip_success and os.path.exists(zip_path):
-                                     st.success(f"✅ PDF convertido para {len(image_paths)} imagem(ns) PNG!")
-                                     output_filename = f"{os.path.splitext(uploaded_file.name)[0]}_imgs.zip"
-                                     output_mimetype = "application/zip";
-                                     with open(zip_path, "rb") as f: output_file_data = f.read()
-                                else: st.error("❌ Falha ao criar arquivo ZIP com as imagens.")
-                           else: st.error("❌ Falha ao converter PDF para imagens.")
+                  with result_placeholder.container(), st.spinner("Convertendo PDF para imagens PNG..."):
+                       work_dir = get_work_dir(uploaded_file.size * 2)
+                       input_pdf_path = spool_to_file(uploaded_file, os.path.join(work_dir, "input.pdf"))
+                       zip_path = os.path.join(work_dir, "pdf_imagens.zip")
+                       render_progress = st.progress(0.0)
+                       success, image_count, message = pdf_processor.pdf_to_image_zip(
+                            input_pdf_path, zip_path, dpi=image_dpi, pages=page_selection, image_format='png',
+                            progress_callback=lambda done, total: render_progress.progress(done / total, text=f"Página {done} de {total}")
+                       )
+                       render_progress.empty()
+                       if success and os.path.exists(zip_path):
+                            st.success(f"✅ PDF convertido para {image_count} imagem(ns) PNG!")
+                            output_filename = f"{os.path.splitext(uploaded_file.name)[0]}_imgs.zip"
+                            output_mimetype = "application/zip"; output_file_path = zip_path
+                       else: st.error(f"❌ Falha ao converter PDF para imagens: {message}")
 
 
     # --- DOCUMENT TO PDF ---
@@ -334,19 +425,13 @@ try:
                   processing_triggered = button_placeholder.button(f"Converter {uploaded_file.name} para PDF", key="doc_to_pdf_btn", use_container_width=True, disabled=not pdf_processor.libreoffice_path)
              if processing_triggered and pdf_processor.libreoffice_path:
                  # ... (lógica doc->pdf) ...
-                  doc_bytes = uploaded_file.getvalue()
-                  with result_placeholder, st.spinner(f"Convertendo {uploaded_file.name} para PDF usando LibreOffice..."):
-                       with tempfile.TemporaryDirectory() as temp_conv_dir:
-                            input_doc_path = os.path.join(temp_conv_dir, uploaded_file.name)
-                            output_pdf_path = os.path.join(temp_conv_dir, f"{os.path.splitext(uploaded_file.name)[0]}.pdf")
-                            with open(input_doc_path, "wb") as f: f.write(doc_bytes)
-                            success = pdf_processor.document_to_pdf(input_doc_path, output_pdf_path)
-                            if success and os.path.exists(output_pdf_path) and os.path.getsize(output_pdf_path) > 0:
-                                 st.success(f"✅ Documento convertido para PDF!")
-                                 output_filename = f"{os.path.splitext(uploaded_file.name)[0]}.pdf"
-                                 output_mimetype = "application/pdf";
-                                 with open(output_pdf_path, "rb") as f: output_file_data = f.read()
-                            else: st.error("❌ Falha ao converter documento para PDF via LibreOffice.")
+                  submit_pdf_job("document_to_pdf", {
+                      "label": f"Conversão de {uploaded_file.name} para PDF",
+                      "filename": uploaded_file.name,
+                      "download_name": f"{os.path.splitext(uploaded_file.name)[0]}.pdf", "mimetype": "application/pdf",
+                      "success_message": "Documento convertido para PDF!",
+                      "failure_message": "Falha ao converter documento para PDF via LibreOffice.",
+                  }, {uploaded_file.name: uploaded_file})
 
 
     # --- PLANILHA PARA PDF ---
@@ -375,41 +460,32 @@ try:
                   )
              if processing_triggered and pdf_processor.libreoffice_path:
                  # ... (lógica sheet->pdf) ...
-                  sheet_bytes = uploaded_file.getvalue()
-                  with result_placeholder, st.spinner(f"Convertendo planilha {uploaded_file.name} para PDF usando LibreOffice..."):
-                       with tempfile.TemporaryDirectory() as temp_conv_dir:
-                            input_sheet_path = os.path.join(temp_conv_dir, uploaded_file.name)
-                            output_pdf_path = os.path.join(temp_conv_dir, f"{os.path.splitext(uploaded_file.name)[0]}.pdf")
-                            with open(input_sheet_path, "wb") as f: f.write(sheet_bytes)
-                            success = pdf_processor.document_to_pdf(input_sheet_path, output_pdf_path)
-                            if success and os.path.exists(output_pdf_path) and os.path.getsize(output_pdf_path) > 0:
-                                 st.success(f"✅ Planilha convertida para PDF!")
-                                 output_filename = f"{os.path.splitext(uploaded_file.name)[0]}.pdf"
-                                 output_mimetype = "application/pdf";
-                                 with open(output_pdf_path, "rb") as f: output_file_data = f.read()
-                            else:
-                                 st.error("❌ Falha ao converter planilha para PDF via LibreOffice.")
-                                 if uploaded_file.name.lower().endswith('.csv'):
-                                     st.info("Dica para CSV: Verifique se o arquivo CSV está formatado corretamente (delimitadores, codificação).")
+                  failure_message = "Falha ao converter planilha para PDF via LibreOffice."
+                  if uploaded_file.name.lower().endswith('.csv'):
+                      failure_message += " Dica para CSV: Verifique se o arquivo CSV está formatado corretamente (delimitadores, codificação)."
+                  submit_pdf_job("document_to_pdf", {
+                      "label": f"Conversão da planilha {uploaded_file.name} para PDF",
+                      "filename": uploaded_file.name,
+                      "download_name": f"{os.path.splitext(uploaded_file.name)[0]}.pdf", "mimetype": "application/pdf",
+                      "success_message": "Planilha convertida para PDF!", "failure_message": failure_message,
+                  }, {uploaded_file.name: uploaded_file})
 
 
     # --- Download Button ---
-    if output_file_data:
+    if output_file_path and os.path.exists(output_file_path):
         result_placeholder.empty()
-        button_placeholder.download_button(
-            label=f"📄 Baixar {output_filename}", data=output_file_data,
-            file_name=output_filename, mime=output_mimetype,
-            key="download_button", use_container_width=True
-        )
+        with open(output_file_path, "rb") as output_file:
+            button_placeholder.download_button(
+                label=f"📄 Baixar {output_filename}", data=output_file,
+                file_name=output_filename, mime=output_mimetype,
+                key="download_button", use_container_width=True
+            )
 
 finally:
     # --- Limpeza Final ---
-    if temp_dir_path and os.path.exists(temp_dir_path):
-        try:
-            shutil.rmtree(temp_dir_path)
-            logging.info(f"Diretório temporário manual {temp_dir_path} removido.")
-        except Exception as e:
-            logging.warning(f"Erro ao remover diretório temporário manual {temp_dir_path}: {e}")
+    if temp_dir_path:
+        get_scratch_space().release(temp_dir_path)
+        logging.info(f"Diretório de trabalho {temp_dir_path} removido.")
 
 # --- Rodapé ---
 st.markdown("---")
@@ -125,10 +125,17 @@ if st.button('Corrigir Texto', use_container_width=True):
     if not user_input.strip():
         st.warning("⚠️ Por favor, insira algum texto para corrigir.")
     else:
-        with st.spinner('Corrigindo o texto... Aguarde.'):
-            corrected_text = corrector.correct_text(user_input)
-
-        if corrected_text:
+        # O texto corrigido aparece enquanto a IA escreve; ao final, dá lugar à caixa de texto abaixo
+        stream_placeholder = st.empty()
+        try:
+            with stream_placeholder.container():
+                st.markdown('<p class="text-area-label">📝 Corrigindo o texto...</p>', unsafe_allow_html=True)
+                corrected_text = st.write_stream(corrector.stream_correct_text(user_input))
+        except RuntimeError:
+            corrected_text = None
+        stream_placeholder.empty()
+
+        if corrected_text and isinstance(corrected_text, str) and corrected_text.strip():
             st.success("✅ Texto corrigido com sucesso!")
 
             st.markdown('<p class="text-area-label">📝 Texto corrigido:</p>', unsafe_allow_html=True)
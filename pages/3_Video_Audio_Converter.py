@@ -1,5 +1,6 @@
 import streamlit as st
 from modules import media_converter
+from modules.scratch import scratch_dir
 import os
 import tempfile
 import time
@@ -106,7 +107,7 @@ if uploaded_file and ffmpeg_ok:
 
 # --- Processamento ---
 if processing_triggered and ffmpeg_ok and uploaded_file: # Garante que uploaded_file existe
-    with tempfile.TemporaryDirectory() as temp_dir:
+    with scratch_dir("video_mp3", expected_bytes=uploaded_file.size * 2) as temp_dir:
         output_mp3_path = os.path.join(temp_dir, f"output_{int(time.time())}.mp3")
         success = False
         message = "Falha desconhecida."
@@ -115,9 +116,16 @@ if processing_triggered and ffmpeg_ok and uploaded_file: # Garante que uploaded_
         input_video_path = os.path.join(temp_dir, uploaded_file.name)
         with open(input_video_path, "wb") as f:
             f.write(uploaded_file.getvalue())
-        with result_placeholder, st.spinner("Convertendo vídeo para MP3..."):
-            success, message = media_converter.convert_video_to_mp3(input_video_path, output_mp3_path)
+        # Clicar em "Cancelar" (ou sair da página) reinicia o script e interrompe o ffmpeg em execução
+        button_placeholder.button("Cancelar conversão", key="cancel_video_btn", use_container_width=True)
+        with result_placeholder.container(), st.spinner("Convertendo vídeo para MP3..."):
+            conversion_progress = st.progress(0.0)
+            success, message = media_converter.convert_video_to_mp3(
+                input_video_path, output_mp3_path,
+                progress_callback=lambda fraction, text: conversion_progress.progress(fraction, text=text)
+            )
             output_filename = f"{os.path.splitext(uploaded_file.name)[0]}.mp3"
+        button_placeholder.empty()
 
         # --- Lógica de resultado/download ---
         if success and os.path.exists(output_mp3_path):
@@ -1,13 +1,21 @@
 import streamlit as st
-from modules.media_converter import load_whisper_model, transcribe_audio_file, WHISPER_MODEL_NAME
+from concurrent.futures import ThreadPoolExecutor
+from modules.media_converter import (
+    WHISPER_MODEL_NAME, TRANSCRIPT_SEGMENTS_FILE, read_transcript_segments, split_transcript_sections,
+    transcription_cache_key, refined_transcription_cache_key
+)
+from modules.result_cache import get_result_cache
+from modules.scratch import scratch_dir
 from modules.text_corrector import TextCorrector
+from modules.job_queue import get_job_manager, STATUS_DONE, STATUS_CANCELLED
+from modules.job_ui import remember_job, recall_job, forget_job, render_job_lookup, wait_for_job
 import os
-import tempfile
-import time
 import logging 
 
 MAX_AUDIO_SIZE_BYTES = 200 * 1024 * 1024
 MAX_AUDIO_SIZE_MB = MAX_AUDIO_SIZE_BYTES / (1024 * 1024)
+TRANSCRIPTION_JOB_KEY = "transcription_job"
+REFINE_WORKERS = 2  # seções refinadas simultaneamente enquanto a transcrição continua
 
 def validate_audio_file_size(uploaded_file):
     if not uploaded_file: return False
@@ -18,6 +26,61 @@ def validate_audio_file_size(uploaded_file):
         return False
     return True
 
+def format_timestamp(seconds):
+    seconds = int(seconds)
+    return f"{seconds // 3600:02d}:{seconds % 3600 // 60:02d}:{seconds % 60:02d}"
+
+def schedule_refinement(job_id, segments, final):
+    """
+    Envia para a IA as seções da transcrição que já estão completas (split_transcript_sections), em threads,
+    sem esperar o fim da transcrição. O estado fica na sessão; seções já enviadas não são reenviadas.
+    """
+    state_key = f"refine_sections_{job_id}"
+    if state_key not in st.session_state:
+        st.session_state[state_key] = {"executor": ThreadPoolExecutor(max_workers=REFINE_WORKERS), "futures": [], "models": set()}
+    state = st.session_state[state_key]
+    for section in split_transcript_sections(segments, final)[len(state["futures"]):]:
+        state["futures"].append(state["executor"].submit(corrector.correct_transcription, section, state["models"]))
+    return state_key
+
+def discard_refinement(job_id):
+    """Abandona as seções ainda pendentes (ex.: texto refinado veio do cache ou o usuário começou outra transcrição)."""
+    state = st.session_state.pop(f"refine_sections_{job_id}", None)
+    if state: state["executor"].shutdown(wait=False, cancel_futures=True)
+
+def stream_refinement(job_id, segments, raw_text, outcome):
+    """
+    Gera o texto refinado na ordem original, para st.write_stream: primeiro as seções já enviadas durante a
+    transcrição (à medida que ficam prontas) e depois o restante, token a token. Seções que falharam ficam com
+    o texto original. Ao final, `outcome` recebe "text" (None se nada foi refinado), "partial" e "models" (os
+    modelos que de fato responderam).
+    """
+    if not segments: segments = [{"text": raw_text}]  # tarefas antigas, sem o arquivo de segmentos
+    state = st.session_state.pop(f"refine_sections_{job_id}", None) or {"executor": None, "futures": [], "models": set()}
+    sections = split_transcript_sections(segments, final=True)
+    refined = []
+    for idx, future in enumerate(state["futures"]):
+        refined.append(future.result())
+        yield ("\n\n" if idx else "") + (refined[-1] if refined[-1] is not None else sections[idx])
+    if state["executor"]: state["executor"].shutdown()
+    remaining = "\n\n".join(sections[len(refined):])
+    if remaining.strip():
+        if refined: yield "\n\n"
+        streamed = []
+        try:
+            for delta in corrector.stream_correct_transcription(remaining, state["models"]):
+                streamed.append(delta)
+                yield delta
+            refined.append("".join(streamed))
+        except RuntimeError:
+            refined.append(None)
+            if not streamed: yield remaining
+    if all(text is None for text in refined):
+        outcome.update(text=None, partial=False, models=state["models"])
+        return
+    raws = sections[:len(state["futures"])] + [remaining]
+    outcome.update(text="\n\n".join(text if text is not None else raw for text, raw in zip(refined, raws)), partial=None in refined, models=state["models"])
+
 # --- Configuração da Página ---
 st.set_page_config(
     page_title="Transcritor e Corretor de Áudio - 7ºBPM/P-6",
@@ -65,45 +128,27 @@ st.caption("Transcrições e correções de áudios grandes podem demorar alguns
 # --- Inicializações ---
 corrector = TextCorrector()
 api_corrector_ok = corrector.is_configured()
-whisper_model = None # Variável para guardar o modelo carregado
-
-# --- <<< Carregamento do Modelo Whisper com Spinner >>> ---
-model_load_status_placeholder = st.empty()
-try:
-    with model_load_status_placeholder, st.spinner(f"Carregando modelo de transcrição ({WHISPER_MODEL_NAME})... Aguarde. Isso pode levar alguns minutos na primeira vez."):
-        whisper_model = load_whisper_model() # Chama a função cacheada
-except Exception as load_err:
-     # Captura exceções que possam ocorrer fora da função cacheada
-     logging.error(f"Erro inesperado durante tentativa de carregar modelo: {load_err}", exc_info=True)
-     whisper_model = None # Garante que está None
-
-# --- Verifica se o modelo carregou antes de mostrar o resto ---
-if whisper_model is None:
-    model_load_status_placeholder.error(f"❌ Falha crítica ao carregar o modelo de transcrição Whisper ({WHISPER_MODEL_NAME}). A funcionalidade de transcrição está indisponível. Verifique os logs do servidor.")
-    # Impede a exibição do restante da página se o modelo essencial não carregar
-    st.stop()
-else:
-    # Limpa a mensagem do spinner se carregou com sucesso
-    model_load_status_placeholder.empty()
-    logging.info("Modelo Whisper pronto para uso.")
-    # Aviso sobre API do Corretor
-    if not api_corrector_ok:
-        st.warning("⚠️ API de correção não configurada (verifique OPENAI_API_KEY no .env). O refinamento pós-transcrição será pulado.")
-
-
-    # --- Placeholders da UI Principal ---
-    upload_placeholder = st.empty()
-    button_placeholder = st.empty()
-    result_placeholder = st.empty()
-    output_placeholder = st.empty()
-
-    # --- Variáveis de Controle ---
-    uploaded_file = None
-    raw_transcribed_text = None
-    corrected_transcribed_text = None
-    processing_triggered = False
-
-    # --- Lógica da UI (Uploader e Botão) ---
+job_manager = get_job_manager()
+
+if not api_corrector_ok:
+    st.warning("⚠️ API de correção não configurada (verifique OPENAI_API_KEY no .env). O refinamento pós-transcrição será pulado.")
+
+# --- Variáveis de Controle ---
+uploaded_file = None
+raw_transcribed_text = None
+corrected_transcribed_text = None
+processing_triggered = False
+active_job_id = recall_job(TRANSCRIPTION_JOB_KEY)
+
+# --- Placeholders da UI Principal ---
+upload_placeholder = st.empty()
+button_placeholder = st.empty()
+result_placeholder = st.empty()
+output_placeholder = st.empty()
+
+# --- Lógica da UI (Uploader e Botão) ---
+if not active_job_id:
+    render_job_lookup(TRANSCRIPTION_JOB_KEY)
     with upload_placeholder.container():
         uploaded_file = st.file_uploader(
             f"Carregue um arquivo de áudio (MP3, WAV, M4A, etc. - Máx: {MAX_AUDIO_SIZE_MB:.0f} MB)",
@@ -116,87 +161,121 @@ else:
             # Botão só aparece se o arquivo for válido
             processing_triggered = button_placeholder.button("Transcrever e Corrigir Áudio", key="transcribe_correct_btn", use_container_width=True)
 
-    # --- Processamento em duas etapas ---
-    if processing_triggered:
-        output_placeholder.empty()
-        raw_transcribed_text = None
-        corrected_transcribed_text = None
+# --- Etapa 1: Transcrição na fila de processamento (o modelo Whisper é carregado no worker) ---
+if processing_triggered:
+    input_name = f"audio{os.path.splitext(uploaded_file.name)[1].lower()}"
+    params = {"filename": input_name, "original_name": uploaded_file.name, "cache_key": transcription_cache_key(uploaded_file)}
+    # Mesmo áudio já transcrito (outra sessão, outro usuário, antes de um reinício): resultado direto, sem fila
+    with scratch_dir("transcricao_cache") as cache_dir:
+        cached_files = get_result_cache("transcription").get(params["cache_key"], cache_dir)
+        if cached_files:
+            job_id = job_manager.submit_completed("transcription", params, {
+                "output": "transcricao.txt", "segments": TRANSCRIPT_SEGMENTS_FILE, "cache_key": params["cache_key"],
+                "message": "Transcrição recuperada do cache."
+            }, {os.path.basename(path): path for path in cached_files})
+        else:
+            job_id = job_manager.submit("transcription", params, {input_name: uploaded_file})
+    remember_job(TRANSCRIPTION_JOB_KEY, job_id)
+    st.rerun()
 
-        with tempfile.NamedTemporaryFile(delete=False, suffix=os.path.splitext(uploaded_file.name)[1]) as temp_audio:
-            temp_audio.write(uploaded_file.getvalue())
-            input_audio_path = temp_audio.name
+if active_job_id:
+    segments_path = job_manager.output_path(active_job_id, TRANSCRIPT_SEGMENTS_FILE)
 
-        try:
-            # Etapa 1: Transcrição com Whisper (passando o modelo carregado)
-            with result_placeholder, st.spinner("Etapa 1/2: Transcrevendo áudio..."):
-                 # <<< Passa o whisper_model carregado >>>
-                transcribe_success, transcribe_message, raw_text = transcribe_audio_file(
-                    input_audio_path,
-                    model=whisper_model
-                )
+    def show_partial_transcription(job):
+        """Mostra os segmentos já transcritos e, com a API configurada, adianta o refinamento das seções prontas."""
+        segments = read_transcript_segments(segments_path)
+        if not segments: return
+        with output_placeholder.container(height=300):
+            st.markdown("\n\n".join(f"`{format_timestamp(seg['start'])}` {seg['text']}" for seg in segments))
+        if api_corrector_ok: schedule_refinement(active_job_id, segments, final=False)
 
-            if transcribe_success:
-                raw_transcribed_text = raw_text
-                st.success(f"✅ {transcribe_message}")
+    with result_placeholder.container():
+        st.caption(f"Etapa 1/2: Transcrevendo áudio com Whisper ({WHISPER_MODEL_NAME})...")
+        job = wait_for_job(active_job_id, TRANSCRIPTION_JOB_KEY, on_poll=show_partial_transcription)
+    output_placeholder.empty()
 
-                # Etapa 2: Correção com API
-                if api_corrector_ok:
-                    with result_placeholder, st.spinner("Etapa 2/2: Refinando transcrição com IA..."):
-                         corrected_text = corrector.correct_transcription(raw_transcribed_text)
+    if job is None:
+        result_placeholder.error("❌ Tarefa de transcrição não encontrada.")
+    elif job["status"] == STATUS_DONE:
+        result_placeholder.empty()
+        with open(job_manager.output_path(active_job_id, job["result"]["output"]), "r", encoding="utf-8") as f:
+            raw_transcribed_text = f.read()
+        st.success(f"✅ {job['result'].get('message', 'Transcrição concluída com sucesso.')}")
 
-                    if corrected_text is not None:
-                        corrected_transcribed_text = corrected_text
-                        st.success("✅ Transcrição refinada pela IA com sucesso!")
-                    else:
-                        st.warning("⚠️ Falha ao refinar transcrição com IA. Exibindo apenas a transcrição original.")
+        # Etapa 2: Correção com API (o resultado fica na sessão para não repetir a chamada a cada rerun)
+        refined_key = f"refined_{active_job_id}"
+        if api_corrector_ok:
+            if refined_key not in st.session_state:
+                refined_cache = get_result_cache("transcription")
+                refined_cache_key = job["result"].get("cache_key") and refined_transcription_cache_key(job["result"]["cache_key"], corrector.model_name)
+                cached_refined = refined_cache.get_bytes(refined_cache_key) if refined_cache_key else None
+                if cached_refined is not None:
+                    discard_refinement(active_job_id)
+                    st.session_state[refined_key] = (cached_refined.decode("utf-8"), False)
                 else:
-                     st.info("Refinamento com IA pulado (API não configurada).")
-
+                    # O refinado aparece enquanto a IA escreve; ao final, a área dá lugar aos resultados abaixo
+                    outcome = {}
+                    with output_placeholder.container(height=300):
+                        st.caption("Etapa 2/2: Refinando transcrição com IA...")
+                        st.write_stream(stream_refinement(active_job_id, read_transcript_segments(segments_path), raw_transcribed_text, outcome))
+                    st.session_state[refined_key] = (outcome["text"], outcome["partial"])
+                    refined_text, refined_partially = st.session_state[refined_key]
+                    # A chave é do modelo principal: um refinamento feito (mesmo em parte) por outro modelo não é guardado
+                    if refined_cache_key and refined_text is not None and not refined_partially and outcome["models"] == {corrector.model_name}:
+                        refined_cache.put_bytes(refined_cache_key, refined_text.encode("utf-8"), "transcricao_refinada.txt", operation="transcription_refined")
+            corrected_transcribed_text, refined_partially = st.session_state[refined_key]
+            if corrected_transcribed_text is not None and refined_partially:
+                st.warning("⚠️ Parte da transcrição não pôde ser refinada pela IA; esses trechos aparecem como transcritos.")
+            elif corrected_transcribed_text is not None:
+                st.success("✅ Transcrição refinada pela IA com sucesso!")
             else:
-                result_placeholder.error(f"❌ Falha na transcrição: {transcribe_message}")
-
-        finally:
-            if os.path.exists(input_audio_path):
-                try: os.unlink(input_audio_path)
-                except Exception as e: logging.warning(f"Não foi possível remover o arquivo de áudio temporário {input_audio_path}: {e}")
+                st.warning("⚠️ Falha ao refinar transcrição com IA. Exibindo apenas a transcrição original.")
+        else:
+             st.info("Refinamento com IA pulado (API não configurada).")
+    elif job["status"] == STATUS_CANCELLED:
+        result_placeholder.warning("⚠️ Transcrição cancelada.")
+    else:
+        result_placeholder.error(f"❌ Falha na transcrição: {job.get('error') or 'erro desconhecido'}")
 
+    if st.button("Nova transcrição", key="new_transcription_btn", use_container_width=True):
+        discard_refinement(active_job_id)
+        forget_job(TRANSCRIPTION_JOB_KEY)
+        st.rerun()
 
-    # --- Exibir Resultado ---
-    if raw_transcribed_text is not None:
-        upload_placeholder.empty()
-        button_placeholder.empty()
-        result_placeholder.empty()
 
-        with output_placeholder.container():
-            st.subheader("Resultados:")
-            # Caixa 1: Transcrição Original (Whisper)
+# --- Exibir Resultado ---
+if raw_transcribed_text is not None:
+    base_name = os.path.splitext(job["params"].get("original_name", "audio"))[0]
+    with output_placeholder.container():
+        st.subheader("Resultados:")
+        # Caixa 1: Transcrição Original (Whisper)
+        with st.container(border=True):
+             st.markdown("**Transcrição Original**")
+             st.text_area("", value=raw_transcribed_text, height=300, key="transcription_raw_output", disabled=True)
+             st.download_button(
+                 label="📄 Baixar Transcrição Original (.txt)",
+                 data=raw_transcribed_text.encode('utf-8'),
+                 file_name=f"{base_name}_transcricao_whisper.txt",
+                 mime="text/plain",
+                 key="download_raw_text_button",
+                 use_container_width=True
+             )
+        st.markdown("---")
+        # Caixa 2: Transcrição Refinada (IA)
+        if corrected_transcribed_text is not None:
             with st.container(border=True):
-                 st.markdown("**Transcrição Original**")
-                 st.text_area("", value=raw_transcribed_text, height=300, key="transcription_raw_output", disabled=True)
-                 st.download_button(
-                     label="📄 Baixar Transcrição Original (.txt)",
-                     data=raw_transcribed_text.encode('utf-8'),
-                     file_name=f"{os.path.splitext(uploaded_file.name)[0]}_transcricao_whisper.txt",
-                     mime="text/plain",
-                     key="download_raw_text_button",
-                     use_container_width=True
-                 )
-            st.markdown("---")
-            # Caixa 2: Transcrição Refinada (IA)
-            if corrected_transcribed_text is not None:
-                with st.container(border=True):
-                    st.markdown("**Transcrição Refinada**") # Título atualizado
-                    st.text_area("", value=corrected_transcribed_text, height=300, key="transcription_corrected_output", disabled=True)
-                    st.download_button(
-                        label="📄 Baixar Transcrição Refinada (.txt)",
-                        data=corrected_transcribed_text.encode('utf-8'),
-                        file_name=f"{os.path.splitext(uploaded_file.name)[0]}_transcricao_corrigida_api.txt",
-                        mime="text/plain",
-                        key="download_corrected_text_button",
-                        use_container_width=True
-                    )
-            elif api_corrector_ok:
-                 st.info("A correção via IA não produziu resultado para este áudio.")
+                st.markdown("**Transcrição Refinada**") # Título atualizado
+                st.text_area("", value=corrected_transcribed_text, height=300, key="transcription_corrected_output", disabled=True)
+                st.download_button(
+                    label="📄 Baixar Transcrição Refinada (.txt)",
+                    data=corrected_transcribed_text.encode('utf-8'),
+                    file_name=f"{base_name}_transcricao_corrigida_api.txt",
+                    mime="text/plain",
+                    key="download_corrected_text_button",
+                    use_container_width=True
+                )
+        elif api_corrector_ok:
+             st.info("A correção via IA não produziu resultado para este áudio.")
 
 
 # --- Rodapé ---
@@ -0,0 +1,109 @@
+"""
+Cenário automatizado do roteamento entre endpoints de LLM (modules.llm_client): sobe dois servidores substitutos
+(scripts/llm_standin.py) com latências e taxas de erro diferentes e confere, com asserts:
+
+  1. a ordem por latência EWMA penalizada pelo erro (o rápido e confiável passa à frente do principal configurado);
+  2. o failover (nenhuma chamada falha enquanto um dos endpoints responde);
+  3. o disjuntor: o endpoint que só falha sai da ordem, aceita uma única chamada de teste por vez depois do
+     resfriamento e volta a ser escolhido quando se recupera;
+  4. o modelo que de fato respondeu (para as chaves de cache).
+
+Uso: python scripts/llm_routing_scenario.py   (termina com código 0 se tudo passar)
+"""
+import os
+import sys
+import time
+import logging
+import threading
+
+logging.basicConfig(level=logging.WARNING)  # antes dos imports, que configurariam INFO
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+from llm_standin import make_server  # noqa: E402  (mesmo diretório)
+
+COOLDOWN_SECONDS = 3.0
+REQUEST = {"messages": [{"role": "user", "content": "Olá"}], "max_tokens": 50}
+
+
+def _start(latency, error_rate):
+    server = make_server(0, latency=latency, error_rate=error_rate)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return server, f"http://127.0.0.1:{server.server_address[1]}/v1"
+
+
+def main():
+    # Principal configurado: lento e instável. Reserva: rápida e sem erros.
+    slow, slow_url = _start(latency=0.25, error_rate=0.3)
+    fast, fast_url = _start(latency=0.02, error_rate=0.0)
+    # A configuração é lida na importação de modules.llm_client
+    os.environ.update(
+        OPENAI_API_KEY="cenario", LLM_ENDPOINTS=f"{slow_url}|lento,{fast_url}|rapido", LLM_MAX_RETRIES="0",
+        LLM_BREAKER_FAILURES="2", LLM_BREAKER_COOLDOWN_SECONDS=str(COOLDOWN_SECONDS), LLM_ROUTER_PROBE_EVERY="5",
+    )
+    from modules import llm_client
+    from modules.llm_client import CircuitOpen, create_completion, open_stream, get_router, run_async
+
+    router = get_router()
+    slow_endpoint, fast_endpoint = router.endpoints
+
+    def call():
+        endpoint, response = run_async(create_completion(**REQUEST))
+        assert response.model == endpoint.model, f"modelo informado ({endpoint.model}) difere da resposta ({response.model})"
+        return endpoint
+
+    # 1 e 2: o rápido assume a frente; as falhas do lento são cobertas pelo failover
+    for _ in range(10): call()
+    answered = [call() for _ in range(20)]
+    share = sum(endpoint is fast_endpoint for endpoint in answered) / len(answered)
+    print(f"Ordem após aquecimento: {[endpoint.model for endpoint in router.ordered()]}; rápido respondeu {share:.0%}.")
+    assert share >= 0.7, f"o endpoint rápido deveria responder a maioria das chamadas ({share:.0%})"
+    # O lento pode ter aberto o disjuntor ou falhado em todas as tentativas (sem medida): nos dois casos fica atrás
+    assert slow_endpoint.is_tripped() or slow_endpoint.latency[llm_client.KIND_COMPLETION] is None \
+        or fast_endpoint.score() < slow_endpoint.score(), "a pontuação do rápido deveria ser menor"
+
+    # 3a: o rápido passa a falhar sempre; o lento (agora confiável) atende tudo e o disjuntor do rápido abre
+    slow.RequestHandlerClass.error_rate = 0.0
+    fast.RequestHandlerClass.error_rate = 1.0
+    if slow_endpoint.is_tripped():
+        time.sleep(COOLDOWN_SECONDS)  # o lento abriu o disjuntor no aquecimento: espera o meio-aberto
+    answered = [call() for _ in range(6)]
+    assert all(endpoint is slow_endpoint for endpoint in answered), "com o rápido fora, só o lento deveria responder"
+    assert fast_endpoint.is_open(), "o disjuntor do rápido deveria estar aberto"
+    assert fast_endpoint not in router.ordered(), "endpoint com disjuntor aberto não deveria estar na ordem"
+    print("Failover e abertura do disjuntor: ok.")
+
+    # 3b: depois do resfriamento, meio-aberto: uma chamada de teste por vez, atrás dos fechados
+    time.sleep(COOLDOWN_SECONDS + 0.1)
+    assert router.ordered(llm_client.KIND_COMPLETION)[-1] is fast_endpoint, "meio-aberto deveria vir depois dos fechados"
+    with fast_endpoint.admitted():
+        try:
+            with fast_endpoint.admitted(): pass
+            raise AssertionError("o meio-aberto deveria admitir uma única chamada de teste por vez")
+        except CircuitOpen:
+            pass
+    print("Meio-aberto com uma chamada de teste por vez: ok.")
+
+    # 3c: o rápido se recupera; a sonda periódica o mede de novo e ele volta à frente
+    fast.RequestHandlerClass.error_rate = 0.0
+    for _ in range(15):
+        if call() is fast_endpoint: break
+    assert not fast_endpoint.is_tripped(), "a chamada de teste bem-sucedida deveria fechar o disjuntor"
+    answered = [call() for _ in range(10)]
+    assert sum(endpoint is fast_endpoint for endpoint in answered) >= 7, "o rápido recuperado deveria voltar à frente"
+    print("Recuperação pelo disjuntor meio-aberto e pela sonda: ok.")
+
+    # 4: fluxo aberto no melhor endpoint, com o tempo até o início medido à parte
+    endpoint, stream = run_async(open_stream(**REQUEST))
+    run_async(stream.response.aclose())
+    assert endpoint.latency[llm_client.KIND_STREAM] is not None, "o fluxo deveria registrar o tempo até o início"
+    print(f"Fluxo aberto em {endpoint.model}: ok.")
+
+    for server in (slow, fast): server.shutdown()
+    print("Cenário de roteamento concluído com sucesso.")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
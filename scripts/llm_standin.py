@@ -0,0 +1,102 @@
+"""
+Servidor local compatível com a API OpenAI (chat/completions) com latência e falhas injetadas, para testar o
+roteamento entre endpoints (LLM_ENDPOINTS) sem chamar a API real. Ferramenta de desenvolvimento: fica fora de
+modules/ e não vai para a imagem.
+
+Uso: python scripts/llm_standin.py --port 8001 --latency 2 --error-rate 0.3
+"""
+import re
+import json
+import time
+import random
+import logging
+import argparse
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+logging.basicConfig(level=logging.INFO)
+log = logging.getLogger(__name__)
+
+
+class StandinHandler(BaseHTTPRequestHandler):
+    """
+    Servidor local compatível com /v1/chat/completions (com e sem stream) para testar o roteamento entre endpoints:
+    devolve a última mensagem do usuário (prefixada com `tag`) após a latência configurada, falhando com 503
+    na proporção `error_rate`. A configuração fica em atributos de classe (ver make_server).
+    """
+    protocol_version = "HTTP/1.1"
+    latency = 0.0
+    jitter = 0.0
+    error_rate = 0.0
+    token_delay = 0.0
+    tag = ""
+
+    def log_message(self, format, *args):
+        log.debug(format % args)
+
+    def _send_json(self, status, payload):
+        data = json.dumps(payload).encode("utf-8")
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(data)))
+        self.end_headers()
+        self.wfile.write(data)
+
+    def do_POST(self):
+        request = json.loads(self.rfile.read(int(self.headers.get("Content-Length", 0))) or b"{}")
+        if not self.path.rstrip("/").endswith("/chat/completions"):
+            return self._send_json(404, {"error": {"message": f"Rota não suportada: {self.path}"}})
+        time.sleep(max(0.0, self.latency + random.uniform(-self.jitter, self.jitter)))
+        if random.random() < self.error_rate:
+            return self._send_json(503, {"error": {"message": "Falha injetada pelo servidor substituto."}})
+        user_messages = [message["content"] for message in request.get("messages", []) if message.get("role") == "user"]
+        reply = f"{self.tag}{user_messages[-1] if user_messages else ''}"
+        model = request.get("model", "standin")
+        if not request.get("stream"):
+            return self._send_json(200, {
+                "id": "standin", "object": "chat.completion", "created": int(time.time()), "model": model,
+                "choices": [{"index": 0, "message": {"role": "assistant", "content": reply}, "finish_reason": "stop"}],
+                "usage": {"prompt_tokens": 0, "completion_tokens": 0, "total_tokens": 0},
+            })
+        self.send_response(200)
+        self.send_header("Content-Type", "text/event-stream")
+        self.send_header("Connection", "close")
+        self.end_headers()
+        for piece in re.findall(r"\S+\s*|\s+", reply):
+            event = {
+                "id": "standin", "object": "chat.completion.chunk", "created": int(time.time()), "model": model,
+                "choices": [{"index": 0, "delta": {"content": piece}, "finish_reason": None}],
+            }
+            self.wfile.write(f"data: {json.dumps(event)}\n\n".encode("utf-8"))
+            self.wfile.flush()
+            if self.token_delay: time.sleep(self.token_delay)
+        self.wfile.write(b"data: [DONE]\n\n")
+        self.close_connection = True
+
+
+def make_server(port, latency=0.0, jitter=0.0, error_rate=0.0, token_delay=0.0, tag="", host="127.0.0.1"):
+    """Cria (sem iniciar) um servidor substituto; use serve_forever() numa thread para testes no mesmo processo."""
+    handler = type("ConfiguredStandinHandler", (StandinHandler,), {
+        "latency": latency, "jitter": jitter, "error_rate": error_rate, "token_delay": token_delay, "tag": tag,
+    })
+    return ThreadingHTTPServer((host, port), handler)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(
+        description="Servidor local compatível com a API OpenAI (chat/completions) com latência e falhas injetadas, "
+                    "para testar LLM_ENDPOINTS. Ex.: LLM_ENDPOINTS=\"http://127.0.0.1:8001/v1|a,http://127.0.0.1:8002/v1|b\""
+    )
+    parser.add_argument("--port", type=int, default=8001, help="Porta (padrão: 8001).")
+    parser.add_argument("--latency", type=float, default=0.0, help="Atraso antes de responder, em segundos.")
+    parser.add_argument("--jitter", type=float, default=0.0, help="Variação aleatória (±) do atraso, em segundos.")
+    parser.add_argument("--error-rate", type=float, default=0.0, help="Proporção de respostas 503 (0 a 1).")
+    parser.add_argument("--token-delay", type=float, default=0.0, help="Atraso entre pedaços no modo stream, em segundos.")
+    parser.add_argument("--tag", default=None, help="Prefixo das respostas (padrão: \"[porta] \").")
+    args = parser.parse_args()
+    server = make_server(args.port, args.latency, args.jitter, args.error_rate, args.token_delay,
+                         f"[{args.port}] " if args.tag is None else args.tag)
+    log.info(f"Servidor substituto em http://127.0.0.1:{args.port}/v1 (latência {args.latency}s, erros {args.error_rate:.0%}).")
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass